@@ -44,14 +44,22 @@ class Cfg(object):
                 c = jsonpickle.decode(config_str)
                 self.gui = c.gui
                 self.ie = c.ie
+                self._set_defaults()
                 return
             except:
                 pass
         # build default configuration
         self.gui = GuiCfg()
         self.ie = IECfg()
+        self._set_defaults()
         pass
 
+    def _set_defaults(self):
+        """ Set any settings which depend on the user's data directory. """
+        if getattr(self.ie, 'scan_cache_path', None) is None:
+            self.ie.scan_cache_path = os.path.join(
+                wx.StandardPaths.Get().GetUserDataDir(), 'im-scan-cache')
+
     def snapshot(self):
         """ used when passing cfg to background threads """
         return copy.deepcopy(self)
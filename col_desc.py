@@ -88,9 +88,9 @@ class ColDesc(object):
     def path(self):
         return [self]
 
-    def sql_literal_str(self, literal):
-        ''' Return the string to use in SQL literals. '''
-        return str(literal)
+    def sql_param(self, literal):
+        ''' Return the value to bind to a ? placeholder for <literal>. '''
+        return literal
 
     def gui_str(self, val):
         ''' Return the string to use in GUI output. '''
@@ -100,18 +100,79 @@ class ColDesc(object):
         ''' Call col_ref_fn(col_desc) for every SQL column accessed to display this column '''
         col_ref_fn(xs.ref(self))
 
-    def sql_relop_str(self, op: str, literal, col_ref_fn, xs: CDXState):
-        return '%s %s %s' % (col_ref_fn(xs.ref(self)), op, self.sql_literal_str(literal))
+    # order relops compare sql_order_expr() with literal's order value,
+    # NULL first (as in SQLite's ORDER BY), e.g. for keyset pagination:
+    #   'asc<': (self < literal) in the ascending order of this column
+    #   'desc<': (self < literal) in the order expression of a descending sort
+    # the SQL is the same for NULL and non-NULL literals
+    order_relop_strs = {
+        '<':    ('(%(e)s < ? OR %(e)s IS NULL AND ? IS NOT NULL)', 2),
+        '<=':   ('(%(e)s <= ? OR %(e)s IS NULL)', 1),
+        '==':   ('%(e)s IS ?', 1),
+        '>=':   ('(%(e)s >= ? OR ? IS NULL)', 2),
+        '>':    ('(%(e)s > ? OR %(e)s IS NOT NULL AND ? IS NULL)', 2),
+    }
+
+    @staticmethod
+    def split_order_relop(op: str):
+        ''' Return (descending, relop) for an order relop, or None for another op '''
+        for pfx, descending in (('asc', False), ('desc', True)):
+            if op.startswith(pfx) and op[len(pfx):] in ColDesc.order_relop_strs:
+                return descending, op[len(pfx):]
+        return None
 
-    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState):
-        s = col_ref_fn(xs.ref(self))
-        if descending:
+    def sql_relop_str(self, op: str, literal, col_ref_fn, xs: CDXState):
+        ''' Return the SQL for (self <op> literal), with ? placeholders for literals
+
+            sql_params() returns the values to bind to the placeholders
+        '''
+        order_relop = ColDesc.split_order_relop(op)
+        if order_relop is not None:
+            descending, relop = order_relop
+            return ColDesc.order_relop_strs[relop][0] % {
+                'e': self.sql_order_expr(descending, col_ref_fn, xs)}
+        return '%s %s ?' % (col_ref_fn(xs.ref(self)), op)
+
+    def sql_params(self, op: str, literal) -> List[Any]:
+        ''' Return the values for the placeholders of sql_relop_str(op, literal) '''
+        order_relop = ColDesc.split_order_relop(op)
+        if order_relop is not None:
+            descending, relop = order_relop
+            return ColDesc.order_relop_strs[relop][1] * [
+                self.sql_order_param(descending, literal)]
+        return [self.sql_param(literal)]
+
+    def sql_order_expr(self, descending: bool, col_ref_fn, xs: CDXState):
+        ''' Return the SQL expression that sql_order_str() sorts by '''
+        return col_ref_fn(xs.ref(self))
+
+    def sql_order_param(self, descending: bool, literal):
+        ''' Return the value of sql_order_expr() for <literal> '''
+        return None if literal is None else self.sql_param(literal)
+
+    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState, reverse=False):
+        ''' Return the ORDER BY term(s) for a (descending) sort
+
+            reverse: sort in exactly the reverse order, e.g. to read backwards
+        '''
+        s = self.sql_order_expr(descending, col_ref_fn, xs)
+        if descending != reverse:
             s += ' DESC'
         return s
 
     def get_val(self, get_sql_val_fn, xs: CDXState):
         return get_sql_val_fn(xs.ref(self).alias)
 
+    def sql_decoder(self, col_idx_fn, xs: CDXState):
+        ''' Return idxs, make_fn: how to get this column's value from a result row
+
+            idxs: the SELECT column indexes (from col_idx_fn(alias)) of its SQL values
+            make_fn: makes the value from the tuple of those SQL values,
+                or None if the value is the one SQL value
+            see SqlQuery.row_decoder, which calls this once per query
+        '''
+        return [col_idx_fn(xs.ref(self).alias)], None
+
     ''' see also:
     Join State.sql_col_ref()
     Filter._relop_str(), _between_str()
@@ -135,24 +196,24 @@ class TextCD(DataColDesc):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def sql_literal_str(self, literal):
-        return '"%s"' % literal
+    def sql_param(self, literal):
+        return str(literal)
 
 
 class DateCD(DataColDesc):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def sql_literal_str(self, literal):
-        return '"%s"' % literal
+    def sql_param(self, literal):
+        return str(literal)
 
 
 class DateTimeCD(DataColDesc):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-    def sql_literal_str(self, literal):
-        return '"%s"' % literal
+    def sql_param(self, literal):
+        return str(literal)
 
 
 class IntCD(DataColDesc):
@@ -170,13 +231,18 @@ class IMDateEltCD(DataColDesc):
             kwargs['hidden'] = True  # default hidden to True
         super().__init__(*args, **kwargs)
 
-    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState):
+    def sql_order_expr(self, descending: bool, col_ref_fn, xs: CDXState):
         ref = col_ref_fn(xs.ref(self))
         if descending:
             # IMDate.unk (0) will already sort at the end
-            return ref + ' DESC'
+            return ref
         else:
-            return 'CASE WHEN %s == 0 THEN 9999 ELSE %s' % (ref, ref)
+            return 'CASE WHEN %s == 0 THEN 9999 ELSE %s END' % (ref, ref)
+
+    def sql_order_param(self, descending: bool, literal):
+        if not descending and literal == IMDate.unk:
+            return 9999
+        return super().sql_order_param(descending, literal)
 
 
 class IdCD(DataColDesc):
@@ -228,8 +294,8 @@ class LinkColDesc(ColDesc):
         ''' Return the string to use in GUI output. '''
         return 'link'
 
-    def sql_literal_str(self, literal):
-        raise ValueError('sql_literal_str called on a LinkColDesc')
+    def sql_param(self, literal):
+        raise ValueError('sql_param called on a LinkColDesc')
 
     def sql_select(self, col_ref_fn, xs: CDXState):
         ''' Call col_ref_fn(col_desc) for the foreign key column '''
@@ -239,13 +305,20 @@ class LinkColDesc(ColDesc):
     def sql_relop_str(self, op: str, literal, col_ref_fn, xs: CDXState):
         raise ValueError('sql_relop_str called on a LinkColDesc')
 
-    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState):
+    def sql_params(self, op: str, literal):
+        raise ValueError('sql_params called on a LinkColDesc')
+
+    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState, reverse=False):
         raise ValueError('sql_order_str called on a LinkColDesc')
 
     def get_val(self, get_sql_val_fn, xs: CDXState):
         fcd = self.foreign_cd
         return fcd.get_val(get_sql_val_fn, xs.ref(fcd))
 
+    def sql_decoder(self, col_idx_fn, xs: CDXState):
+        fcd = self.foreign_cd
+        return fcd.sql_decoder(col_idx_fn, xs.ref(fcd))
+
 
 class TraitColDesc(LinkColDesc):
     ''' 'included' foreign table '''
@@ -304,8 +377,8 @@ class ChildrenCD(ColDesc):
         ''' Return the string to use in GUI output. '''
         raise ValueError('gui_str called on a ChildrenCD')
 
-    def sql_literal_str(self, literal):
-        raise ValueError('sql_literal_str called on a ChildrenCD')
+    def sql_param(self, literal):
+        raise ValueError('sql_param called on a ChildrenCD')
 
     def sql_select(self, col_ref_fn, xs: CDXState):
         ''' Call col_ref_fn(col_desc) for the foreign key column '''
@@ -316,7 +389,10 @@ class ChildrenCD(ColDesc):
     def sql_relop_str(self, op: str, literal, col_ref_fn, xs: CDXState):
         raise ValueError('sql_relop_str called on a ChildrenCD')
 
-    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState):
+    def sql_params(self, op: str, literal):
+        raise ValueError('sql_params called on a ChildrenCD')
+
+    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState, reverse=False):
         raise ValueError('sql_order_str called on a ChildrenCD')
 
     def get_val(self, get_sql_val_fn, xs: CDXState):
@@ -324,6 +400,10 @@ class ChildrenCD(ColDesc):
         fcd = self.foreign_cd
         return fcd.get_val(get_sql_val_fn, xs.ref(fcd))
 
+    def sql_decoder(self, col_idx_fn, xs: CDXState):
+        fcd = self.foreign_cd
+        return fcd.sql_decoder(col_idx_fn, xs.ref(fcd))
+
 
 class ShortcutCD(ColDesc):
     path_str: str   # [ link-shortcut-cd-name | link-cd-name '.'... ] [cd-name]
@@ -344,8 +424,8 @@ class ShortcutCD(ColDesc):
         s += ', path_str=%r' % (self.path_str)
         return s
 
-    def sql_literal_str(self, literal):
-        return self.path_cds[-1].sql_literal_str(literal)
+    def sql_param(self, literal):
+        return self.path_cds[-1].sql_param(literal)
 
     def path(self):
         return self.path_cds
@@ -359,13 +439,19 @@ class ShortcutCD(ColDesc):
         return self.path_cds[-1].sql_relop_str(
             op, literal, col_ref_fn, xs.extend(self, self.path_cds[0:-1]))
 
-    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState):
+    def sql_params(self, op: str, literal):
+        return self.path_cds[-1].sql_params(op, literal)
+
+    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState, reverse=False):
         return self.path_cds[-1].sql_order_str(
-            descending, col_ref_fn, xs.extend(self, self.path_cds[0:-1]))
+            descending, col_ref_fn, xs.extend(self, self.path_cds[0:-1]), reverse)
 
     def get_val(self, get_sql_val_fn, xs: CDXState):
         return self.path_cds[-1].get_val(get_sql_val_fn, xs.extend(self, self.path_cds[0:-1]))
 
+    def sql_decoder(self, col_idx_fn, xs: CDXState):
+        return self.path_cds[-1].sql_decoder(col_idx_fn, xs.extend(self, self.path_cds[0:-1]))
+
 
 class VirtualColDesc(ColDesc):
     dependencies: List[str]
@@ -391,19 +477,28 @@ class VirtualColDesc(ColDesc):
         s += ', dependencies=%r' % self.dependencies
         return s
 
-    def sql_literal_str(self, literal):
-        raise ValueError('sql_literal_str called on a VirtualColDesc')
+    def sql_param(self, literal):
+        raise ValueError('sql_param called on a VirtualColDesc')
 
     def sql_select(self, col_ref_fn, xs: CDXState):
         ''' Call col_ref_fn(col_desc) for every SQL column accessed to display this column '''
         for dcd in self.dependency_cds:
             dcd.sql_select(col_ref_fn, xs.sfx(self, dcd))
 
+    @staticmethod
+    def _eq_op(op: str):
+        ''' Return the equality op that goes with <op> in a lexicographic comparison '''
+        order_relop = ColDesc.split_order_relop(op)
+        if order_relop is not None:
+            return ('desc' if order_relop[0] else 'asc') + '=='
+        return '=='
+
     def sql_relop_str(self, op: str, literal, col_ref_fn, xs: CDXState):
         lits = literal  # literal is a sequence
         cds = self.dependency_cds
+        eq_op = VirtualColDesc._eq_op(op)
         try:
-            if op == '==':
+            if op == eq_op:
                 r = ' AND '.join([
                     cd.sql_relop_str(
                         op, l, col_ref_fn, xs.sfx(self, cd)) for cd, l in zip(cds, lits)])
@@ -421,7 +516,7 @@ class VirtualColDesc(ColDesc):
                             cds[0].sql_relop_str(
                                 op, lits[0], col_ref_fn, xs.sfx(self, cds[0])),
                             cds[0].sql_relop_str(
-                                '==', lits[0], col_ref_fn, xs.sfx(self, cds[0])),
+                                eq_op, lits[0], col_ref_fn, xs.sfx(self, cds[0])),
                             res(lits[1:], cds[1:])
                         )
                 r = res(lits, cds)
@@ -429,14 +524,54 @@ class VirtualColDesc(ColDesc):
             print('asf')
         return r
 
-    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState):
+    def sql_params(self, op: str, literal):
+        # in the order of sql_relop_str()'s placeholders
+        lits = literal  # literal is a sequence
+        cds = self.dependency_cds
+        eq_op = VirtualColDesc._eq_op(op)
+        if op == eq_op or op == '!=':
+            return [p for cd, l in zip(cds, lits) for p in cd.sql_params(op, l)]
+        else:
+            def res(lits, cds):
+                if len(lits) == 1:
+                    return cds[0].sql_params(op, lits[0])
+                else:
+                    return (
+                        cds[0].sql_params(op, lits[0]) +
+                        cds[0].sql_params(eq_op, lits[0]) +
+                        res(lits[1:], cds[1:]))
+            return res(lits, cds)
+
+    def sql_order_str(self, descending: bool, col_ref_fn, xs: CDXState, reverse=False):
         cols = []
         for dcd in self.dependency_cds:
-            cols.append(dcd.sql_order_str(descending, col_ref_fn, xs.sfx(self, dcd)))
+            cols.append(dcd.sql_order_str(
+                descending, col_ref_fn, xs.sfx(self, dcd), reverse))
         return ', '.join(cols)
 
+    def make_val(self, dependency_vals):
+        ''' Return the value made from the dependencies' values '''
+        return list(dependency_vals)
+
     def get_val(self, get_sql_val_fn, xs: CDXState):
-        return [dcd.get_val(get_sql_val_fn, xs.sfx(self, dcd)) for dcd in self.dependency_cds]
+        return self.make_val(
+            [dcd.get_val(get_sql_val_fn, xs.sfx(self, dcd)) for dcd in self.dependency_cds])
+
+    def sql_decoder(self, col_idx_fn, xs: CDXState):
+        decoders = [dcd.sql_decoder(col_idx_fn, xs.sfx(self, dcd)) for dcd in self.dependency_cds]
+        idxs = [idx for dcd_idxs, make_fn in decoders for idx in dcd_idxs]
+        if all(make_fn is None for dcd_idxs, make_fn in decoders):
+            return idxs, self.make_val
+        def make_val(sql_vals):
+            # split sql_vals among nested Virtual dependencies
+            vals = []
+            x = 0
+            for dcd_idxs, make_fn in decoders:
+                n = len(dcd_idxs)
+                vals.append(sql_vals[x] if make_fn is None else make_fn(sql_vals[x:x + n]))
+                x += n
+            return self.make_val(vals)
+        return idxs, make_val
 
 
 class IMDateCD(VirtualColDesc):
@@ -450,9 +585,11 @@ class IMDateCD(VirtualColDesc):
         # literal is an IMDate
         return super().sql_relop_str(op, literal.val, col_ref_fn, xs)
 
-    def get_val(self, get_sql_val_fn, xs: CDXState):
-        args = super().get_val(get_sql_val_fn, xs)
-        return IMDate(*args)
+    def sql_params(self, op: str, literal):
+        return super().sql_params(op, literal.val)
+
+    def make_val(self, dependency_vals):
+        return IMDate(*dependency_vals)
 
 
 if __name__ == '__main__':
@@ -1,22 +1,27 @@
 """ SQLAlchemy database classes """
 
+import atexit
 from enum import IntEnum as PyIntEnum
 import datetime
+import logging
 import os
+import string
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, distinct, event, func, inspect
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 from sqlalchemy.ext.orderinglist import ordering_list
 
 from sqlalchemy import Boolean, Column, Date, DateTime, Enum, Float
-from sqlalchemy import ForeignKey, Index, Integer
+from sqlalchemy import ForeignKey, Index, Integer, insert
 from sqlalchemy import LargeBinary, String, Table, Text
 from sqlalchemy.orm import backref, relationship
 from sqlalchemy.orm import composite
+from sqlalchemy.orm import object_session, Session
 
 from imdate import IMDate
 import tags
+from thumb_pack import ThumbPack
 import util
 
 
@@ -53,6 +58,11 @@ class ItemTag(Base):
     item_id = Column(Integer, ForeignKey('item.id'))
     flags = Column(Enum(TagFlags))
 
+    __table_args__ = (
+        Index('item_tags_item_index', 'item_id', 'tag_id'),
+        Index('item_tags_tag_index', 'tag_id'),
+    )
+
     def __str__(self):
         return "[ItemTag tag_id=%u, item_id=%u, ItemTag=%s]" %(
             self.tag_id, self.item_id, self.flags)
@@ -99,6 +109,9 @@ class Item(Base):
 
     name = Column(String(100))
 
+    # (subclass indexes can't include .name, which is in this table)
+    __table_args__ = (Index('item_name_index', 'name'),)
+
     # Item <<-(ItemTag)->> DbTag
     tags = relationship(
         'ItemTag', backref='item', primaryjoin = id == ItemTag.item_id)
@@ -192,8 +205,9 @@ class DbFolder(Item):
     thumbnail_id = Column(Integer, ForeignKey('db_image.id'))
     thumbnail = relationship('DbImage', foreign_keys='[DbFolder.thumbnail_id]')
 
-    Index('db_folder_index', 'date', 'db_name', unique=True)
-    Index('db_folder_flyer_index', 'date_month', 'date_day', 'db_name', unique=True)
+    __table_args__ = (
+        Index('db_folder_date_index', 'date_year', 'date_month', 'date_day'),
+    )
 
     @classmethod
     def add(cls, session, date, name):
@@ -205,9 +219,13 @@ class DbFolder(Item):
         return obj
 
     @classmethod
-    def find(cls, session, date, name):
+    def find_query(cls, session, date, name):
         im_date = IMDate(date.year, date.month, date.day)
-        return session.query(DbFolder).filter_by(date=im_date, name=name).first()
+        return session.query(DbFolder).filter_by(date=im_date, name=name)
+
+    @classmethod
+    def find(cls, session, date, name):
+        return cls.find_query(session, date, name).first()
 
     @classmethod
     def get(cls, session, date, name):
@@ -242,7 +260,6 @@ class DbCollection(Item):
     thumbnail = relationship(
         "DbImage", foreign_keys='[DbCollection.thumbnail_id]')
 
-    Index('db_collection_index', 'db_name', unique=True)
 
     @classmethod
     def add(cls, session, name):
@@ -250,14 +267,29 @@ class DbCollection(Item):
         if obj is not None: session.add(obj)
         return obj
 
+    @classmethod
+    def find_query(cls, session, name):
+        return session.query(DbCollection).filter_by(name=name)
+
     @classmethod
     def find(cls, session,  name):
-        return session.query(DbCollection).filter_by(name=name).first()
+        return cls.find_query(session, name).first()
 
     def __str__(self):
         return '[DbCollection %s]' % self.name
 
 
+class ImageThumbnail(Base):
+    """ an ImageData's thumbnail JPEG
+
+        kept out of image_data so that queries on image_data
+        (e.g. DbImage/FsImage table views) don't read thumbnail pages
+    """
+    __tablename__ = 'image_thumbnail'
+    id = Column(Integer, ForeignKey('image_data.id'), primary_key=True)
+    jpeg = Column(LargeBinary())
+
+
 class ImageData(Base):
     ''' event extracted from a FS image
 
@@ -274,10 +306,13 @@ class ImageData(Base):
     # TODO: image_types bitset
 
     thumbnail_timestamp = Column(DateTime)
-    thumbnail = Column(LargeBinary())
     # checked by fg_start_ie_work_item() to schedule a thumbnail read
     # updated by fg_finish_ie_work_item() and cleared by FsImage.set_db_image()
 
+    # ImageData -0-> ImageThumbnail: loaded on first use of .thumbnail
+    thumbnail_row = relationship(
+        'ImageThumbnail', uselist=False, cascade='all, delete-orphan')
+
     # EXIF attributes -- see exif.py
     exif_timestamp = Column(DateTime)   # also covers imported image tags
     image_width = Column(Integer)
@@ -289,6 +324,30 @@ class ImageData(Base):
     sensitivity = Column(Integer)
     # TODO: camera model, AF mode, AE mode
 
+    @classmethod
+    def bulk_add(cls, session, num):
+        """ Add <num> empty ImageData with one INSERT, and return them. """
+        if num == 0:
+            return []
+        return session.scalars(
+            insert(ImageData).returning(ImageData, sort_by_parameter_order=True),
+            [{'thumbnail_timestamp': None}] * num).all()
+
+    @property
+    def thumbnail(self):
+        """ the thumbnail JPEG (bytes), or None """
+        row = self.thumbnail_row
+        return None if row is None else row.jpeg
+
+    @thumbnail.setter
+    def thumbnail(self, jpeg):
+        if jpeg is None:
+            self.thumbnail_row = None
+        elif self.thumbnail_row is None:
+            self.thumbnail_row = ImageThumbnail(jpeg=jpeg)
+        else:
+            self.thumbnail_row.jpeg = jpeg
+
 
 class DbImage(Item):
     """ a single image (usually with multiple files: NEF/TIFF/PSD/JPEG) """
@@ -316,8 +375,7 @@ class DbImage(Item):
         'FsImage', foreign_keys='[FsImage.db_image_id]',
         back_populates='db_image', lazy='dynamic')
 
-    Index('db_folder_image_index', 'folder_id', 'db_name', unique=True)
-    Index('db_date_image_index', 'folder.date', 'db_name')
+    __table_args__ = (Index('db_image_folder_index', 'folder_id'),)
 
     @classmethod
     def add(cls, session, folder, name):
@@ -325,10 +383,13 @@ class DbImage(Item):
         if obj is not None: session.add(obj)
         return obj
 
+    @classmethod
+    def find_query(cls, session, db_folder, name):
+        return session.query(DbImage).filter_by(folder=db_folder, name=name)
+
     @classmethod
     def find(cls, session, db_folder,  name):
-        return session.query(DbImage).filter_by(
-            folder_id=db_folder.id, name=name).first()
+        return cls.find_query(session, db_folder, name).first()
     # TODO: find_in_date vs find_in_folder
 
     @classmethod
@@ -339,6 +400,30 @@ class DbImage(Item):
         else:
             return db_image, False
 
+    @classmethod
+    def find_all(cls, session, folder):
+        """ Return {name: DbImage} for all of <folder>'s DbImages. """
+        return {
+            db_image.name: db_image
+            for db_image in session.query(DbImage).filter_by(folder_id=folder.id)}
+
+    @classmethod
+    def bulk_add(cls, session, folder, names, data_ids=None):
+        """ Add a DbImage to <folder> for each of <names>, with one INSERT.
+
+            data_ids, if given, are the new DbImages' ImageData ids
+            <folder> must have been flushed
+            returns the new DbImages, in the order of <names>
+        """
+        if len(names) == 0:
+            return []
+        if data_ids is None:
+            data_ids = [None] * len(names)
+        return session.scalars(
+            insert(DbImage).returning(DbImage, sort_by_parameter_order=True),
+            [{'folder_id': folder.id, 'name': name, 'data_id': data_id}
+                for name, data_id in zip(names, data_ids)]).all()
+
     def fs_items(self):
         return self.fs_images
 
@@ -383,7 +468,10 @@ class DbTag(Item):
         'DbTag', remote_side=[id], foreign_keys=[base_tag_id])
 
     lower_name = Column(String) # TODO: this extra column shouldn't be necessary
-    Index('db_tag', lower_name, 'parent')
+    __table_args__ = (
+        Index('db_tag_name_index', 'lower_name', 'parent_id'),
+        Index('db_tag_parent_index', 'parent_id'),
+    )
 
     def base(self):
         return {
@@ -403,17 +491,27 @@ class DbTag(Item):
         if obj is not None: session.add(obj)
         if tag_type != DbTagType.DEPRECATED:
             tags.on_db_tag_added(session, obj)
+        elif DbTagIndex.loaded(session) is not None:
+            # (DbTag.find() finds deprecated tags too)
+            DbTagIndex.loaded(session).add(obj)
         return obj
 
+    @classmethod
+    def find_query(cls, session, name, parent=None):
+        # DbTagIndex's lookup of a stale key
+        return session.query(DbTag).filter_by(lower_name=name.lower(), parent=parent)
+
     @classmethod
     def find(cls, session, name, parent=None):
-        return session.query(DbTag).filter_by(
-            lower_name=name.lower(), parent=parent).first()
+        return DbTagIndex.get(session).find(session, name, parent)
+
+    @classmethod
+    def find_flat_query(cls, session, name):
+        return session.query(DbTag).filter_by(lower_name=name.lower())
 
     @classmethod
     def find_flat(cls, session, name):
-        return session.query(DbTag).filter_by(
-            lower_name=name.lower()).all()
+        return cls.find_flat_query(session, name).all()
 
     @classmethod
     def get(cls, session, name,
@@ -441,14 +539,7 @@ class DbTag(Item):
     @classmethod
     def find_expr(cls, session, expr):
         # <expr> is parent|child
-        list = expr.split('|')
-        tag = None
-        for elt in list:
-            tag = cls.find(session, elt, parent=tag)
-            if tag is None:
-                break
-        return tag
-    # TODO test
+        return DbTagIndex.get(session).find_expr(session, expr)
 
     @classmethod
     def find_id(cls, session, id):
@@ -468,6 +559,7 @@ class DbTag(Item):
         if new_name != self.name:
             tags.on_db_tag_removed(session, self)
             self.name = new_name
+            self.lower_name = new_name.lower()
             tags.on_db_tag_added(session, self)
     
     def pname(self):
@@ -488,6 +580,98 @@ class DbTag(Item):
         return self.pname().__cmp__(other.pname())
 
 
+class DbTagIndex(object):
+    """ a session's DbTags, indexed by (parent DbTag or None, lower-case name)
+
+        loaded with one query on first use, and kept up to date by
+        tags.on_db_tag_added/removed(), so that DbTag.find() needs no SQL
+        a key removed by on_db_tag_removed() (a renamed or deprecated tag)
+        is looked up in the database until it's added again
+        discarded when the session is rolled back
+    """
+
+    def __init__(self, session):
+        self.tags = {}          # (parent DbTag or None, lower_name) -> DbTag
+        self.stale = set()      # keys that are looked up in the database
+        self.exprs = {}         # lower-case find_expr() expr -> DbTag or None
+        self._max_words = None  # see max_words()
+        all_tags = session.query(DbTag).all()
+        # (so that tag.parent comes from the identity map, not another query)
+        for tag in all_tags:
+            self.tags[(tag.parent, tag.lower_name)] = tag
+
+    @classmethod
+    def get(cls, session):
+        """ Return <session>'s DbTagIndex, loading it if necessary. """
+        index = session.info.get('db_tag_index')
+        if index is None:
+            index = session.info['db_tag_index'] = DbTagIndex(session)
+            if not event.contains(session, 'after_rollback', cls._discard):
+                event.listen(session, 'after_rollback', cls._discard)
+        return index
+
+    @classmethod
+    def loaded(cls, session):
+        """ Return <session>'s DbTagIndex, or None if it hasn't been loaded. """
+        return session.info.get('db_tag_index')
+
+    @staticmethod
+    def _discard(session):
+        session.info.pop('db_tag_index', None)
+
+    def add(self, db_tag):
+        key = (db_tag.parent, db_tag.lower_name)
+        self.tags[key] = db_tag
+        self.stale.discard(key)
+        self.exprs.clear()
+        self._max_words = None
+
+    def remove(self, db_tag):
+        key = (db_tag.parent, db_tag.lower_name)
+        self.tags.pop(key, None)
+        self.stale.add(key)
+        self.exprs.clear()
+
+    def max_words(self):
+        """ Return the most words in a DbTag name (or a stale key's name). """
+        if self._max_words is None:
+            self._max_words = max(
+                [len(name.split()) for parent, name in self.tags] +
+                [len(name.split()) for parent, name in self.stale] + [0])
+        return self._max_words
+
+    def find(self, session, name, parent=None):
+        key = (parent, name.lower())
+        if key in self.stale:
+            tag = DbTag.find_query(session, name, parent).first()
+            if tag is not None:
+                self.tags[key] = tag
+                self.stale.discard(key)
+            return tag
+        tag = self.tags.get(key)
+        if tag is not None and (tag in session.deleted or inspect(tag).was_deleted):
+            del self.tags[key]
+            self.exprs.clear()
+            return None
+        return tag
+
+    def find_expr(self, session, expr):
+        key = expr.lower()
+        if key in self.exprs:
+            tag = self.exprs[key]
+            if tag is None or not (
+                tag in session.deleted or inspect(tag).was_deleted
+            ):
+                return tag
+        tag = None
+        for elt in expr.split('|'):
+            tag = self.find(session, elt, parent=tag)
+            if tag is None:
+                break
+        self.exprs[key] = tag
+        return tag
+
+
 class DbTextType(PyIntEnum):
     """ the syntax of a DbNote's state """
     TEXT = 1        # simple state
@@ -552,16 +736,21 @@ class FsTagSource(Base):
     id = Column(Integer, primary_key=True)
     description = Column(String(100))
 
+    __table_args__ = (Index('fs_tag_source_index', 'description'),)
+
     @classmethod
     def add(cls, session, description=''):
         obj = cls(description=description)
         if obj is not None: session.add(obj)
         return obj
 
+    @classmethod
+    def find_query(cls, session, description):
+        return session.query(FsTagSource).filter_by(description=description)
+
     @classmethod
     def find(cls, session, description):
-        return session.query(FsTagSource).filter_by(
-            description=description).first()
+        return cls.find_query(session, description).first()
 
     def mappings(self, session):
         """ Return all the FsTagMappings in this FsTagSource. """
@@ -609,6 +798,7 @@ class FsSource(Item):
 
     source_type = Column(Enum(FsSourceType))
         # TODO why is Enum ok here but not for DbNoteType.text_type
+
     readonly = Column(Boolean)
 
     # FsSource -> FsTagSourceId
@@ -621,6 +811,8 @@ class FsSource(Item):
         'FsFolder', foreign_keys='[FsFolder.source_id]',
         back_populates='source')
 
+    __table_args__ = (Index('fs_source_path_index', 'volume', 'path'),)
+
     @classmethod
     def add(cls, session, volume, path, source_type, readonly, tag_source):
         obj = cls(
@@ -638,10 +830,13 @@ class FsSource(Item):
     def find_id(cls, session, id):
         return session.query(FsSource).filter_by(id=id).first()
 
+    @classmethod
+    def find_query(cls, session, volume, path):
+        return session.query(FsSource).filter_by(volume=volume, path=path)
+
     @classmethod
     def find(cls, session, volume, path):
-        return session.query(FsSource).filter_by(
-            volume=volume, path=path).first()
+        return cls.find_query(session, volume, path).first()
 
     def label(self):
         return (
@@ -801,7 +996,21 @@ class FsItemTag(Base):
     db_tag_id = Column(Integer,ForeignKey('db_tag.id'))
     db_tag = relationship('DbTag', foreign_keys=[db_tag_id], uselist=False)
 
-    Index('fs_item_tag', 'type', 'state', unique=False)
+    # FsItemTag ->> FsItemTagWord: the inverted index entries for .text
+    words = relationship('FsItemTagWord',
+        back_populates='item_tag', cascade='all, delete-orphan')
+
+    __table_args__ = (
+        Index('fs_item_tag_text_index', 'text', 'type'),
+        Index('fs_item_tag_item_index', 'item_id', 'idx'),
+    )
+
+    @staticmethod
+    def text_words(text):
+        """ Return the sorted normalized words of a tag text's leaf,
+            e.g. 'band|Green Day' => ['day', 'green']
+        """
+        return sorted(set(text[text.rfind('|') + 1:].lower().split()))
 
     @classmethod
     def insert(cls, session, item, idx, type, text, bases):
@@ -818,11 +1027,67 @@ class FsItemTag(Base):
             first_idx=idx, last_idx=idx, user_grouping=False,
             type=type, text=text, bases=bases,
             source=FsItemTagSource.NONE,
-            binding=FsTagBinding.UNBOUND, db_tag=None)
+            binding=FsTagBinding.UNBOUND, db_tag=None,
+            words=[
+                FsItemTagWord(word=word) for word in FsItemTag.text_words(text)])
         if item_tag is not None:
             session.add(item_tag)
         return item_tag
 
+    @classmethod
+    def rewrite(cls, session, item, new_tags):
+        """ Replace item.item_tags with <new_tags> in one pass.
+
+            each element of new_tags is either one of item.item_tags (kept)
+            or a (type, text, bases) tuple (inserted as a new FsItemTag)
+            item.item_tags missing from new_tags are deleted
+            a kept user grouping survives if all of its FsItemTags are kept,
+            contiguous and in order; all other groupings are removed
+            only changed attributes are set, so unchanged rows aren't updated
+        """
+        old_tags = list(item.item_tags)
+        tags = []
+        for tag in new_tags:
+            if isinstance(tag, tuple):
+                type, text, bases = tag
+                tag = FsItemTag(
+                    user_grouping=False,
+                    type=type, text=text, bases=bases,
+                    source=FsItemTagSource.NONE,
+                    binding=FsTagBinding.UNBOUND, db_tag=None,
+                    words=[
+                        FsItemTagWord(word=word)
+                        for word in FsItemTag.text_words(text)])
+            tags.append(tag)
+        new_idxs = {tag: idx for idx, tag in enumerate(tags)}
+
+        # compute every grouping before changing any
+        groupings = []
+        for idx, tag in enumerate(tags):
+            first_idx = last_idx = idx
+            if tag.user_grouping and tag.first_idx != tag.last_idx:
+                group = old_tags[tag.first_idx:tag.last_idx + 1]
+                start = new_idxs.get(group[0])
+                if (start is not None and
+                    [new_idxs.get(t) for t in group] ==
+                    list(range(start, start + len(group)))
+                ):
+                    first_idx, last_idx = start, start + len(group) - 1
+            groupings.append((first_idx, last_idx))
+        for idx, (tag, (first_idx, last_idx)) in enumerate(zip(tags, groupings)):
+            if tag.idx != idx:
+                tag.idx = idx
+            if tag.first_idx != first_idx:
+                tag.first_idx = first_idx
+            if tag.last_idx != last_idx:
+                tag.last_idx = last_idx
+
+        # (the .idx values are already in order: ordering_list leaves them)
+        item.item_tags = tags
+        for tag in old_tags:
+            if tag not in new_idxs:
+                session.delete(tag)
+
     def delete(self, session):
         # TODO: test in test_db
         item = self.item
@@ -833,6 +1098,7 @@ class FsItemTag(Base):
 
         # delete (hmmm...)
         item.item_tags.pop(idx)
+        self.words = []     # the orphaned row must not be found by find_item_ids()
         # session.delete(self) this ought to work too
 
         # renumber the grouping indexes above idx
@@ -862,13 +1128,46 @@ class FsItemTag(Base):
             item.item_tags[idx].first_idx = idx
             item.item_tags[idx].last_idx = idx
 
+    @classmethod
+    def find_idx_query(cls, session, item, idx):
+        return session.query(FsItemTag).filter_by(item=item, idx=idx)
+
     @classmethod
     def find_idx(cls, session, item, idx):
-        return session.query(FsItemTag).filter_by(item=item, idx=idx).first()
+        return cls.find_idx_query(session, item, idx).first()
+
+    @classmethod
+    def find_text_query(cls, session, type, text):
+        return session.query(FsItemTag).filter_by(type=type, text=text)
 
     @classmethod
     def find_text(cls, session, type, text):
-        return session.query(FsItemTag).filter_by(type=type, text=text).all()
+        return cls.find_text_query(session, type, text).all()
+
+    @classmethod
+    def find_item_ids_query(cls, session, words):
+        """ Return the query for find_item_ids(): <words> is text_words(text) """
+        query = session.query(FsItemTag.item_id).join(
+            FsItemTagWord, FsItemTagWord.item_tag_id == FsItemTag.id
+        ).filter(
+            FsItemTagWord.word.in_(words), FsItemTag.item_id.isnot(None)
+        ).group_by(FsItemTag.item_id)
+        if len(words) > 1:
+            query = query.having(
+                func.count(distinct(FsItemTagWord.word)) == len(words))
+        return query
+
+    @classmethod
+    def find_item_ids(cls, session, text):
+        """ Return the ids of the FsItems whose FsItemTags could bind to <text>.
+
+            i.e. whose FsItemTags contain all of text's leaf words,
+            e.g. a WORD run 'green', 'day', or a TAG 'band|Green Day'
+        """
+        words = FsItemTag.text_words(text)
+        if len(words) == 0:
+            return set()
+        return {item_id for (item_id,) in cls.find_item_ids_query(session, words)}
 
     def diff_tup(self):
         # (w|t, state, bases)
@@ -885,6 +1184,24 @@ class FsItemTag(Base):
             idx, self.text, self.binding, self.source, tgt)
 
 
+class FsItemTagWord(Base):
+    """ a normalized word of an FsItemTag's text (see FsItemTag.text_words)
+
+        an inverted index: word -> FsItemTags, maintained by
+        FsItemTag.insert() and .delete()
+    """
+    __tablename__ = 'fs_item_tag_word'
+
+    word = Column(String, primary_key=True)
+    item_tag_id = Column(
+        Integer, ForeignKey('fs_item_tag.id'), primary_key=True)
+    item_tag = relationship('FsItemTag', back_populates='words')
+
+    __table_args__ = (
+        Index('fs_item_tag_word_item_tag_index', 'item_tag_id'),
+    )
+
+
 class FsTagMapping(Base):
     """ a state -> DbTag map in an FsTagSource """
     __tablename__ = 'fs_tag_mapping'
@@ -917,13 +1234,20 @@ class FsTagMapping(Base):
         mapping = FsTagMapping(
             tag_source=tag_source, text=text, binding=binding, db_tag=db_tag)
         if mapping is not None: session.add(mapping)
+        cache = FsTagMappingCache.loaded(session)
+        if cache is not None:
+            cache.add(mapping)
         tags.on_fs_tag_mapping_added(session, mapping)
         return mapping
 
+    @classmethod
+    def source_query(cls, session, tag_source):
+        # FsTagMappingCache's load of <tag_source>'s mappings
+        return session.query(FsTagMapping).filter_by(tag_source=tag_source)
+
     @classmethod
     def find(cls, session, tag_source, text):
-        return session.query(FsTagMapping).filter_by(
-            tag_source=tag_source, text=text).first()
+        return FsTagMappingCache.get(session).find(session, tag_source, text)
 
     @classmethod
     def add_if_nx(cls, session, tag_source, text, binding, db_tag):
@@ -945,8 +1269,11 @@ class FsTagMapping(Base):
             old_binding = mapping.binding
             if binding != old_binding:
                 tags.on_fs_tag_mapping_removed(session, mapping)
-                if binding == FsTagMapping.UNBOUND:
+                if binding == FsTagBinding.UNBOUND:
                     session.delete(mapping)
+                    cache = FsTagMappingCache.loaded(session)
+                    if cache is not None:
+                        cache.remove(mapping)
                     return None
             mapping.binding = binding
             mapping.db_tag = db_tag
@@ -972,6 +1299,80 @@ class FsTagMapping(Base):
         return '[FsTagMapping %s]' % self.pname()
 
 
+class FsTagMappingCache(object):
+    """ a session's FsTagMappings, by FsTagSource and case-folded text
+
+        each FsTagSource's mappings are loaded with one query on first use,
+        and kept up to date by FsTagMapping.add() and .set()
+        discarded when the session is rolled back
+    """
+
+    # fs_tag_mapping.text is COLLATE NOCASE, which folds only ASCII letters
+    _nocase = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+    def __init__(self):
+        self.sources = {}   # FsTagSource -> {folded text: FsTagMapping}
+        self.source_max_words = {}  # FsTagSource -> see max_words()
+
+    @classmethod
+    def get(cls, session):
+        """ Return <session>'s FsTagMappingCache, creating it if necessary. """
+        cache = session.info.get('fs_tag_mapping_cache')
+        if cache is None:
+            cache = session.info['fs_tag_mapping_cache'] = FsTagMappingCache()
+            if not event.contains(session, 'after_rollback', cls._discard):
+                event.listen(session, 'after_rollback', cls._discard)
+        return cache
+
+    @classmethod
+    def loaded(cls, session):
+        """ Return <session>'s FsTagMappingCache, or None. """
+        return session.info.get('fs_tag_mapping_cache')
+
+    @staticmethod
+    def _discard(session):
+        session.info.pop('fs_tag_mapping_cache', None)
+
+    def _mappings(self, session, tag_source):
+        mappings = self.sources.get(tag_source)
+        if mappings is None:
+            mappings = self.sources[tag_source] = {
+                mapping.text.translate(FsTagMappingCache._nocase): mapping
+                for mapping in FsTagMapping.source_query(session, tag_source)}
+        return mappings
+
+    def add(self, mapping):
+        mappings = self.sources.get(mapping.tag_source)
+        if mappings is not None:
+            mappings[mapping.text.translate(FsTagMappingCache._nocase)] = mapping
+        self.source_max_words.pop(mapping.tag_source, None)
+
+    def remove(self, mapping):
+        mappings = self.sources.get(mapping.tag_source)
+        if mappings is not None:
+            mappings.pop(
+                mapping.text.translate(FsTagMappingCache._nocase), None)
+
+    def max_words(self, session, tag_source):
+        """ Return the most words in the text of one of tag_source's mappings. """
+        max_words = self.source_max_words.get(tag_source)
+        if max_words is None:
+            max_words = self.source_max_words[tag_source] = max(
+                [len(text.split())
+                    for text in self._mappings(session, tag_source)] + [0])
+        return max_words
+
+    def find(self, session, tag_source, text):
+        mapping = self._mappings(session, tag_source).get(
+            text.translate(FsTagMappingCache._nocase))
+        if mapping is not None and (
+            mapping in session.deleted or inspect(mapping).was_deleted
+        ):
+            self.remove(mapping)
+            return None
+        return mapping
+
+
 class TagChange(Base):
     """ a timestamp-sorted list of new DbTags and FsTagMappings
         which have not yet been applied to FsFolders and FsImages
@@ -982,7 +1383,7 @@ class TagChange(Base):
     timestamp = Column(DateTime)
     text = Column(String)
 
-    Index('tag_change_index', 'timestamp', unique=False)
+    __table_args__ = (Index('tag_change_index', 'timestamp'),)
 
     @classmethod
     def clear(cls, session):
@@ -1000,10 +1401,19 @@ class TagChange(Base):
         """ Delete from the global TagChange list """
         session.delete(self)
 
+    @classmethod
+    def oldest_query(cls, session):
+        return session.query(TagChange).order_by(TagChange.timestamp, TagChange.id)
+
     @classmethod
     def first(cls, session):
         """ Return the oldest item in the global TagChange list. """
-        return session.query(TagChange).order_by(TagChange.timestamp).first()
+        return cls.oldest_query(session).first()
+
+    @classmethod
+    def oldest(cls, session, num):
+        """ Return the <num> oldest items in the global TagChange list. """
+        return cls.oldest_query(session).limit(num).all()
 
     @classmethod
     def all(cls, session):
@@ -1056,7 +1466,10 @@ class FsFolder(FsItem):
     images = relationship(
         'FsImage', foreign_keys='[FsImage.folder_id]', back_populates='folder', lazy='dynamic')
 
-    Index('fs_folder_index', 'source', 'db_name', unique=True)
+    __table_args__ = (
+        Index('fs_folder_source_index', 'source_id'),
+        Index('fs_folder_db_folder_index', 'db_folder_id'),
+    )
 
     @classmethod
     def add(cls, session, source, name,
@@ -1073,13 +1486,40 @@ class FsFolder(FsItem):
             print('bb')
         return obj
 
+    @classmethod
+    def find_query(cls, session, source, name):
+        return session.query(FsFolder).filter_by(source=source, name=name)
+
     @classmethod
     def find(cls, session, source, name):
         try:
-            return session.query(FsFolder).filter_by(source=source, name=name).first()
+            return cls.find_query(session, source, name).first()
         except Exception as ed:
             print('a')
 
+    # max names per IN (...) clause, below SQLite's bound-parameter limit
+    find_names_chunk = 500
+
+    @classmethod
+    def find_names_query(cls, session, source, names):
+        return session.query(FsFolder).filter(
+            FsFolder.source == source, FsFolder.name.in_(names))
+
+    @classmethod
+    def find_names(cls, session, source, names):
+        """ Return {name: FsFolder} for the FsFolders in <source> named in <names>.
+
+            names without an FsFolder are omitted
+            one query per find_names_chunk names, instead of one per name
+        """
+        names = list(names)
+        fs_folders = {}
+        for idx in range(0, len(names), cls.find_names_chunk):
+            chunk = names[idx:idx + cls.find_names_chunk]
+            for fs_folder in cls.find_names_query(session, source, chunk):
+                fs_folders[fs_folder.name] = fs_folder
+        return fs_folders
+
     @classmethod
     def get(cls, session, source, name,
         db_date=None, db_name='', db_folder=None
@@ -1128,17 +1568,25 @@ class FsImage(FsItem):
     db_image = relationship(
         'DbImage', foreign_keys=[db_image_id], back_populates='fs_images')
 
+    __table_args__ = (
+        Index('fs_image_folder_index', 'folder_id'),
+        Index('fs_image_db_image_index', 'db_image_id'),
+    )
+
     @classmethod
     def add(cls, session, folder, name, db_image=None):
         obj = cls(folder=folder, name=name, db_image=db_image)
         if obj is not None: session.add(obj)
         return obj
 
+    @classmethod
+    def find_query(cls, session, folder, name):
+        return session.query(FsImage).filter(
+            FsImage.folder == folder, FsImage.name == name)
+
     @classmethod
     def find(cls, session, folder, name):
-        return  session.query(FsImage).filter(
-            FsImage.folder == folder, FsImage.name == name
-        ).first()
+        return cls.find_query(session, folder, name).first()
 
     @classmethod
     def get(cls, session, folder, name, db_image=None):
@@ -1149,6 +1597,29 @@ class FsImage(FsItem):
         else:
             return fs_image, False
 
+    @classmethod
+    def bulk_add(cls, session, folder, names, db_images=None, data_ids=None):
+        """ Add an FsImage to <folder> for each of <names>, with one INSERT.
+
+            db_images and data_ids, if given, are the new FsImages'
+            DbImages (or None) and ImageData ids (or None)
+            <folder> and <db_images> must have been flushed
+            returns the new FsImages, in the order of <names>
+        """
+        if len(names) == 0:
+            return []
+        if db_images is None:
+            db_images = [None] * len(names)
+        if data_ids is None:
+            data_ids = [None] * len(names)
+        return session.scalars(
+            insert(FsImage).returning(FsImage, sort_by_parameter_order=True),
+            [{
+                'folder_id': folder.id, 'name': name, 'data_id': data_id,
+                'db_image_id': None if db_image is None else db_image.id
+            } for name, db_image, data_id in zip(names, db_images, data_ids)]
+        ).all()
+
     def db_item(self):
         return self.db_image
 
@@ -1173,32 +1644,229 @@ def _get_db_builtins(session):
     band_tag = DbTag.get(session, 'band')
     venue_tag = DbTag.get(session, 'venue')
 
-def _open_db(url):
+# SQLite PRAGMAs for file databases: open_file_db(..., pragmas=sqlite_perf_pragmas)
+# WAL + synchronous=NORMAL: a commit appends to the WAL without an fsync
+#   (only a checkpoint fsyncs); a power loss can drop the last commits,
+#   but cannot corrupt the database
+sqlite_perf_pragmas = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,     # bytes
+    'cache_size': -64 * 1024,           # negative: KiB, i.e. 64 MiB
+    'temp_store': 'MEMORY',
+}
+
+def _set_sqlite_pragmas(engine, pragmas):
+    """ apply {name: value} PRAGMAs to each new connection of <engine> """
+    @event.listens_for(engine, 'connect')
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+        cursor.close()
+
+def _migrate_thumbnails(engine):
+    """ move thumbnails from image_data.thumbnail (pre-ImageThumbnail databases)
+        to the image_thumbnail table, and drop the column
+    """
+    columns = [c['name'] for c in inspect(engine).get_columns('image_data')]
+    if 'thumbnail' not in columns:
+        return
+    with engine.begin() as connection:
+        # after the fallback below, the column stays, but holds only NULLs
+        has_thumbnails = connection.exec_driver_sql(
+            'SELECT 1 FROM image_data WHERE thumbnail IS NOT NULL LIMIT 1'
+        ).first() is not None
+        if has_thumbnails:
+            connection.exec_driver_sql(
+                'INSERT OR IGNORE INTO image_thumbnail (id, jpeg) '
+                'SELECT id, thumbnail FROM image_data WHERE thumbnail IS NOT NULL')
+        try:
+            connection.exec_driver_sql(
+                'ALTER TABLE image_data DROP COLUMN thumbnail')
+        except Exception as ed:
+            # SQLite before 3.35 can't drop columns: just free the space
+            if has_thumbnails:
+                connection.exec_driver_sql(
+                    'UPDATE image_data SET thumbnail = NULL WHERE thumbnail IS NOT NULL')
+
+def _migrate_fs_item_tag_words(engine):
+    """ fill in fs_item_tag_word for the FsItemTags of pre-FsItemTagWord databases """
+    with engine.begin() as connection:
+        if connection.exec_driver_sql(
+            'SELECT 1 FROM fs_item_tag_word LIMIT 1').first() is not None:
+            return
+        rows = connection.exec_driver_sql(
+            'SELECT id, text FROM fs_item_tag '
+            'WHERE item_id IS NOT NULL AND text IS NOT NULL').all()
+        words = [
+            (word, item_tag_id)
+            for item_tag_id, text in rows
+            for word in FsItemTag.text_words(text)]
+        if len(words) != 0:
+            connection.exec_driver_sql(
+                'INSERT INTO fs_item_tag_word (word, item_tag_id) VALUES (?, ?)',
+                words)
+
+def _create_missing_indexes(engine):
+    """ create the declared indexes that a database made before them lacks
+        (create_all() only creates the indexes of the tables it creates)
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def _find_queries(session):
+    """ Return [(name, Query)]: the indexed lookups done by the find() methods.
+
+        the queries come from the methods' own *_query() classmethods,
+        with placeholder arguments (unsaved objects with id 0)
+    """
+    def placeholder(cls):
+        return cls(id=0)
+    return [
+        ('DbFolder.find', DbFolder.find_query(session, datetime.date(2000, 1, 1), '')),
+        ('DbCollection.find', DbCollection.find_query(session, '')),
+        ('DbImage.find', DbImage.find_query(session, placeholder(DbFolder), '')),
+        ('DbTag.find', DbTag.find_query(session, '', placeholder(DbTag))),
+        ('DbTag.find_flat', DbTag.find_flat_query(session, '')),
+        ('FsTagSource.find', FsTagSource.find_query(session, '')),
+        ('FsSource.find', FsSource.find_query(session, '', '')),
+        ('FsItemTag.find_idx', FsItemTag.find_idx_query(session, placeholder(FsItem), 0)),
+        ('FsItemTag.find_text', FsItemTag.find_text_query(session, FsTagType.WORD, '')),
+        ('FsItemTag.find_item_ids', FsItemTag.find_item_ids_query(session, ['a', 'b'])),
+        ('FsTagMapping.find', FsTagMapping.source_query(session, placeholder(FsTagSource))),
+        ('TagChange.oldest', TagChange.oldest_query(session).limit(1)),
+        ('FsFolder.find', FsFolder.find_query(session, placeholder(FsSource), '')),
+        ('FsFolder.find_names', FsFolder.find_names_query(
+            session, placeholder(FsSource), ['a', 'b'])),
+        ('FsImage.find', FsImage.find_query(session, placeholder(FsFolder), '')),
+    ]
+
+def check_query_plans(session):
+    """ Return [(find name, plan step)] for each full-table scan
+        in the EXPLAIN QUERY PLANs of the find() queries
+    """
+    full_scans = []
+    dialect = session.get_bind().dialect
+    for name, query in _find_queries(session):
+        sql = str(query.statement.compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True}))
+        for row in session.connection().exec_driver_sql(
+            'EXPLAIN QUERY PLAN ' + sql
+        ):
+            detail = row[-1]    # e.g. 'SCAN item' or 'SEARCH item USING ...'
+            if detail.startswith('SCAN ') and ' USING ' not in detail:
+                full_scans.append((name, detail))
+    return full_scans
+
+# the ThumbPack of the open file database, at <database file>.thumbs
+# its keys are ImageData ids, so it's only used with its own database
+
+_thumb_pack = None
+
+def thumb_pack_path(session):
+    """ Return the path of the ThumbPack of session's database, or None for a memory database """
+    database = session.get_bind().url.database
+    if database is None or database in ('', ':memory:'):
+        return None
+    return database + '.thumbs'
+
+def get_thumb_pack(session, create=True):
+    """ Return the ThumbPack of session's database, opening it on first use.
+
+        returns None for a memory database, or if the ThumbPack doesn't
+        exist and not create
+        the imports write it and the thumbnail viewers read it
+    """
+    global _thumb_pack
+    path = thumb_pack_path(session)
+    if path is None:
+        return None
+    if _thumb_pack is not None and _thumb_pack.path != path:
+        close_thumb_pack()
+    if _thumb_pack is None:
+        if not create and not os.path.exists(path + '.idx'):
+            return None
+        _thumb_pack = ThumbPack(path)
+    return _thumb_pack
+
+def close_thumb_pack():
+    """ Close the open database's ThumbPack, if it's open. """
+    global _thumb_pack
+    if _thumb_pack is not None:
+        _thumb_pack.close()
+        _thumb_pack = None
+
+atexit.register(close_thumb_pack)
+
+# a deleted ImageData's thumbnail is removed from the ThumbPack
+# when the deletion is committed
+
+def _on_image_data_deleted(mapper, connection, image_data):
+    object_session(image_data).info.setdefault(
+        'deleted_image_data_ids', []).append(image_data.id)
+
+def _on_after_commit(session):
+    deleted_ids = session.info.pop('deleted_image_data_ids', [])
+    if len(deleted_ids) != 0:
+        thumb_pack = get_thumb_pack(session, create=False)
+        if thumb_pack is not None:
+            for id in deleted_ids:
+                thumb_pack.remove(id)
+
+def _on_after_rollback(session):
+    session.info.pop('deleted_image_data_ids', None)
+
+def _listen_for_image_data_deletes():
+    if not event.contains(ImageData, 'after_delete', _on_image_data_deleted):
+        event.listen(ImageData, 'after_delete', _on_image_data_deleted)
+        event.listen(Session, 'after_commit', _on_after_commit)
+        event.listen(Session, 'after_rollback', _on_after_rollback)
+
+def _open_db(url, pragmas=None):
     """ open a database and return a session """
     global session
+    close_thumb_pack()  # the previous database's
+    _listen_for_image_data_deletes()
     engine = create_engine(url, echo=False)
+    if pragmas is not None:
+        _set_sqlite_pragmas(engine, pragmas)
     Base.metadata.create_all(engine)
+    _create_missing_indexes(engine)
+    _migrate_thumbnails(engine)
+    _migrate_fs_item_tag_words(engine)
     from sqlalchemy.orm import sessionmaker
     Session = sessionmaker(bind=engine)
     session = Session()
     _get_db_builtins(session)
+    for name, detail in check_query_plans(session):
+        logging.warning('%s does a full table scan: %s', name, detail)
     return session
 
 def open_mem_db():
     """ open a memory database """
     return _open_db('sqlite:///:memory:')
 
-def open_file_db(full_path, mode):
+def open_file_db(full_path, mode, pragmas=None):
+    """ open a database file and return a session
+
+        pragmas: {name: value} SQLite PRAGMAs, e.g. sqlite_perf_pragmas,
+        or None for SQLite's defaults
+    """
     if mode == 'w':
-        try:
-            os.remove(full_path)
-        except Exception as ed:  # the path_str may not have existed in the first place
-            pass
-    return _open_db('sqlite:///' + full_path)
+        close_thumb_pack()
+        # the old database's ThumbPack goes with it
+        for path in (full_path, full_path + '.thumbs.dat', full_path + '.thumbs.idx'):
+            try:
+                os.remove(path)
+            except Exception as ed:  # the path_str may not have existed in the first place
+                pass
+    return _open_db('sqlite:///' + full_path, pragmas)
 
 def close_db():
     """ close the database """
-    pass
+    close_thumb_pack()
 
 def open_preloaded_mem_db():
     session = open_mem_db()
@@ -0,0 +1,115 @@
+""" a persistent exiftool process, driven through -stay_open """
+
+import atexit
+import json
+import logging
+import subprocess
+import threading
+
+
+class ExifTool(object):
+    """ a long-running exiftool process
+
+        commands are written to exiftool's stdin as an argument file
+        (one argument per line, terminated by -execute),
+        and exiftool answers each one on stdout, followed by {ready}
+        the process is (re)started on demand, so it survives exiftool crashes
+    """
+
+    sentinel = b'{ready}'
+
+    def __init__(self, executable='exiftool', common_args=None):
+        self.executable = executable
+        self.common_args = [] if common_args is None else list(common_args)
+        self.process = None
+        self.lock = threading.Lock()  # one command at a time
+
+    def __repr__(self):
+        return '<ExifTool %s>' % (
+            'running' if self.running() else 'stopped')
+
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """ Start the exiftool process, if it isn't already running. """
+        if self.running():
+            return
+        argv = [self.executable, '-stay_open', 'True', '-@', '-']
+        if len(self.common_args) > 0:
+            argv.append('-common_args')
+            argv.extend(self.common_args)
+        self.process = subprocess.Popen(
+            argv, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL)
+
+    def close(self):
+        """ Ask the exiftool process to exit, and wait for it. """
+        with self.lock:
+            if self.process is None:
+                return
+            try:
+                if self.running():
+                    self.process.stdin.write(b'-stay_open\nFalse\n')
+                    self.process.stdin.flush()
+                    self.process.wait(timeout=5)
+            except Exception as ed:
+                self.process.kill()
+            self.process = None
+
+    def _execute(self, args):
+        self.start()
+        cmd = ''.join(arg + '\n' for arg in args) + '-execute\n'
+        self.process.stdin.write(cmd.encode('utf-8'))
+        self.process.stdin.flush()
+        lines = []
+        while True:
+            line = self.process.stdout.readline()
+            if line == b'':
+                raise EOFError('exiftool exited')
+            if line.rstrip() == ExifTool.sentinel:
+                break
+            lines.append(line)
+        return b''.join(lines)
+
+    def execute(self, args):
+        """ Run exiftool on <args>, and return its output as bytes.
+
+            if exiftool has died, it is restarted and the command is retried once
+        """
+        with self.lock:
+            try:
+                return self._execute(args)
+            except (OSError, EOFError, ValueError) as ed:
+                logging.error('exiftool failed (%s): restarting', ed)
+                if self.process is not None:
+                    self.process.kill()
+                    self.process = None
+                return self._execute(args)
+
+    def execute_json(self, args):
+        """ Run exiftool -j on <args>, and return a list of dictionaries. """
+        out = self.execute(args)
+        if len(out.strip()) == 0:
+            return []  # e.g. no matching files
+        return json.loads(out.decode('utf-8', errors='replace'))
+
+
+_exiftool = None
+
+
+def get_exiftool(common_args=None):
+    """ Return the shared ExifTool, creating it on first use. """
+    global _exiftool
+    if _exiftool is None:
+        _exiftool = ExifTool(common_args=common_args)
+        atexit.register(close_exiftool)
+    return _exiftool
+
+
+def close_exiftool():
+    """ Stop the shared ExifTool, if there is one. """
+    global _exiftool
+    if _exiftool is not None:
+        _exiftool.close()
+        _exiftool = None
@@ -15,6 +15,9 @@ class Filter(object):
     tup: Tuple[Any]
     ''' filter-tup:
             ('</<=/==/!=/>=/>', col_idx-desc, value)
+            ('asc/desc' + '</<=/==/>=/>', col_idx-desc, value)
+                compare in the column's ORDER BY order, NULLs first
+                (see ColDesc.order_relop_strs)
             ('begins/ends/contains', col_idx-desc, str-expr)
             ('null/nonnull', col_idx-desc)
             ('tag', tag-expr)
@@ -79,6 +82,16 @@ class Filter(object):
             '!=':       lambda t: Filter._relop_str(t, js, xs, '!='),
             '>=':       lambda t: Filter._relop_str(t, js, xs, '>='),
             '>':        lambda t: Filter._relop_str(t, js, xs, '>'),
+            'asc<':     lambda t: Filter._relop_str(t, js, xs, 'asc<'),
+            'asc<=':    lambda t: Filter._relop_str(t, js, xs, 'asc<='),
+            'asc==':    lambda t: Filter._relop_str(t, js, xs, 'asc=='),
+            'asc>=':    lambda t: Filter._relop_str(t, js, xs, 'asc>='),
+            'asc>':     lambda t: Filter._relop_str(t, js, xs, 'asc>'),
+            'desc<':    lambda t: Filter._relop_str(t, js, xs, 'desc<'),
+            'desc<=':   lambda t: Filter._relop_str(t, js, xs, 'desc<='),
+            'desc==':   lambda t: Filter._relop_str(t, js, xs, 'desc=='),
+            'desc>=':   lambda t: Filter._relop_str(t, js, xs, 'desc>='),
+            'desc>':    lambda t: Filter._relop_str(t, js, xs, 'desc>'),
             '&':        lambda t: Filter._many_str(t, js, xs, 'AND', 6, parent_pri),
             '|':        lambda t: Filter._many_str(t, js, xs, 'OR', 7, parent_pri),
             '!':        lambda t: Filter._uni_str(t, js, xs, 'NOT', 5, parent_pri),
@@ -120,8 +133,27 @@ class Filter(object):
         return Filter._tup_str(t2, js, xs, parent_pri)
 
     def sql_str(self, js: JoinState, xs: CDXState):
+        ''' Return the WHERE clause, with ? placeholders for the literals
+
+            sql_params() returns the values to bind to them, so the same
+            SQL can be reused for different literals
+        '''
         return 'WHERE ' + Filter._tup_str(self.tup, js, xs, parent_pri=9)
 
+    @staticmethod
+    def _tup_params(t, params: List[Any]):
+        if t[0] in ('&', '|', '!', '-'):
+            for operand in t[1:]:
+                Filter._tup_params(operand, params)
+        else:
+            params.extend(t[1].sql_params(t[0], t[2]))
+
+    def sql_params(self) -> List[Any]:
+        ''' Return the values for sql_str()'s placeholders, in order '''
+        params = []
+        Filter._tup_params(self.tup, params)
+        return params
+
 if __name__ == '__main__':
     import tbl_descs
     from tbl_desc import TblDesc
@@ -150,26 +182,26 @@ if __name__ == '__main__':
 
     td = TblDesc.lookup_tbl_desc('DbFolder')
     t_lt_id = ('<', td.row_desc.col_descs[0], 123)
-    check(t_lt_id, 'WHERE db_folder.id < 123', [])
+    check(t_lt_id, 'WHERE db_folder.id < ?', [])
     t_lt_name = ('==', td.row_desc.col_descs[1], 'diana')
-    check(t_lt_name, 'WHERE item_0.name == "diana"',
+    check(t_lt_name, 'WHERE item_0.name == ?',
         ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
     t_lt_and = ('&', t_lt_id, t_lt_name)
-    check(t_lt_and, 'WHERE db_folder.id < 123 AND item_0.name == "diana"',
+    check(t_lt_and, 'WHERE db_folder.id < ? AND item_0.name == ?',
         ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
     t_lt_minus = ('-', t_lt_id, t_lt_name)
-    check(t_lt_minus, 'WHERE db_folder.id < 123 AND  NOT item_0.name == "diana"',
+    check(t_lt_minus, 'WHERE db_folder.id < ? AND  NOT item_0.name == ?',
         ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
     t_lt_or = ('|', t_lt_id, t_lt_name)
-    check(t_lt_or, 'WHERE db_folder.id < 123 OR item_0.name == "diana"',
+    check(t_lt_or, 'WHERE db_folder.id < ? OR item_0.name == ?',
         ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
     t_lt_orand = ('|', t_lt_or, t_lt_and)
     check(t_lt_orand,
-        'WHERE db_folder.id < 123 OR item_0.name == "diana" OR db_folder.id < 123 AND item_0.name == "diana"',
+        'WHERE db_folder.id < ? OR item_0.name == ? OR db_folder.id < ? AND item_0.name == ?',
         ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
     t_lt_andor = ('&', t_lt_and, t_lt_or)
     check(t_lt_andor,
-        'WHERE db_folder.id < 123 AND item_0.name == "diana" AND (db_folder.id < 123 OR item_0.name == "diana")',
+        'WHERE db_folder.id < ? AND item_0.name == ? AND (db_folder.id < ? OR item_0.name == ?)',
         ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
     pass
 
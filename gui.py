@@ -3,6 +3,8 @@
 import copy
 import logging
 from typing import Any, List, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import wx
 #import wx.aui as aui
 import wx.lib.agw.aui as aui
@@ -13,7 +15,7 @@ import db
 from empty_gui import EmptyTP
 from ie_gui import ImportExportTP
 from tab_panel_gui import TabbedNotebook, TabPanel, TabPanelStack
-from tags_gui import TagsTP
+from tags_gui import TagsTP, init_tag_rebind
 from tbl_desc import TblDesc
 from tbl_descs import DbFolder_td, ImageData_td, Item_td, DbImage_td
 from tbl_view import TblTP
@@ -35,7 +37,12 @@ class GuiApp(wx.App):
         # pseudo-thread scheduling
         global slicer
         slicer = WxSlicer(num_queues=2, max_slice_ms=100)
-        pass
+        init_tag_rebind()
+
+        # e.g. the report views re-read their rows after an import's commits
+        event.listen(
+            Session, 'after_commit',
+            lambda session: wx.CallAfter(lambda: pub.sendMessage('db.committed')))
 
         # logging
         handler = logging.FileHandler(
@@ -189,6 +196,7 @@ if __name__== '__main__':
     from db import open_file_db
     from base_path import dev_base_ie_source_path
     import tbl_descs
-    db.session = open_file_db(dev_base_ie_source_path + '\\test.db', 'r')
+    db.session = open_file_db(
+        dev_base_ie_source_path + '\\test.db', 'r', db.sqlite_perf_pragmas)
     # db.open_preloaded_mem_db()
     gui_test()
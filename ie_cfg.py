@@ -1,6 +1,7 @@
 """ persistent event for Import/Export: cfg.ie """
 
 from enum import Enum
+import os
 # import wx
 
 
@@ -37,6 +38,15 @@ class IECfg(object):
         self.import_image_tags = True   # also governs import of EXIF event
         self.export_image_tags = True
         self.import_thumbnails = False
+        self.thumbnail_workers = os.cpu_count() or 1
+            # number of processes used to make thumbnails (1: no subprocesses)
+        self.scan_threads = 4
+            # number of threads pre-scanning DIR folders (0: no pre-scan)
+        self.import_pipeline_depth = 0
+            # max work items between start and finish (0: one at a time)
+        self.scan_cache_path = None
+            # the ScanCache file for directory listings (None: no cache)
+            # set by Cfg.restore()
         self.reports = []
         # not really persisted -- just here for communication with ie_fs
         # FIXME: clean this up
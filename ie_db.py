@@ -2,6 +2,8 @@
 
 import copy
 from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as futures_wait
 import datetime
 from typing import Union
 
@@ -11,7 +13,10 @@ import ie_db
 from ie_cfg import *
 from ie_fs import *
 from imdate import IMDate
+from scan_cache import ScanCache
 from tags import set_fs_item_tags
+from thumb_pack import ThumbPack
+from util import merge_sorted
 import web_ie_db
 from wx_task import WxTask2
 
@@ -44,6 +49,8 @@ class IEWorkItem(object):
             # set of ie_images to get the exif event (e.g. tags) for
         self.get_thumbnail = set()
             # set of IeImages to get/update the thumbnail for
+        self.failed = False
+            # set by IETask2 if a stage raised: the later stages are skipped
 
     def __repr__(self):
         return '<WorkItem %s %s>' % (
@@ -115,35 +122,22 @@ def get_ie_worklist(session, fs_source, import_mode, paths):
 
     if import_mode == ImportMode.SEL:
         # get all db.FsFolders that match folders
-        for ie_folder in ie_folders:
-            fs_folder = db.FsFolder.find(
-                session, fs_source, fs_source.rel_path(ie_folder.fs_path))
-            worklist.append(IEWorkItem(fs_folder, ie_folder))
+        rel_paths = [fs_source.rel_path(f.fs_path) for f in ie_folders]
+        fs_folders = db.FsFolder.find_names(session, fs_source, rel_paths)
+        for ie_folder, rel_path in zip(ie_folders, rel_paths):
+            worklist.append(IEWorkItem(fs_folders.get(rel_path), ie_folder))
     else:                           # DIR_SET or FILE_SET
         # get all db.FsFolders in the FsSource
-        fs_folders = fs_source.folders
-        # merge fs_folders with ie_folders
-        while True:
-            if len(fs_folders) != 0 and len(ie_folders) != 0:
-                # we're updating a known db.FsFolder
-                fs_rel_path = fs_folders[0].name
-                ie_rel_path = fs_source.rel_path(ie_folders[0].fs_path)
-                if fs_rel_path == ie_rel_path:
-                    worklist.append(
-                        IEWorkItem(fs_folders.pop(0), ie_folders.pop(0)))
-                elif fs_rel_path < ie_rel_path:
-                    worklist.append(
-                        IEWorkItem(fs_folders.pop(0), None))
-                else:
-                    worklist.append(IEWorkItem(None, ie_folders.pop(0)))
-            elif len(fs_folders) != 0:
-                # an existing FsFolder was not seen in this external scan
-                worklist.append(IEWorkItem(fs_folders.pop(0), None))
-            elif len(ie_folders) != 0:
-                # a new folder has been found in the external scan
-                worklist.append(IEWorkItem(None, ie_folders.pop(0)))
-            else:
-                break
+        # (a sorted copy: popping fs_source.folders would detach them)
+        fs_folders = sorted(fs_source.folders, key=lambda x: x.name)
+        # merge fs_folders with ie_folders (sorted by scan_*_set)
+        # (fs_folder, None): an existing FsFolder was not seen in this scan
+        # (None, ie_folder): a new folder has been found in the scan
+        for fs_folder, ie_folder in merge_sorted(
+            fs_folders, ie_folders,
+            lambda x: x.name, lambda x: fs_source.rel_path(x.fs_path)
+        ):
+            worklist.append(IEWorkItem(fs_folder, ie_folder))
     return worklist
 
 
@@ -199,12 +193,32 @@ def _thumbnail_needs_update(image_data: db.ImageData, thumbnail_timestamp: datet
 
 
 def _update_thumbnail(
-    image_data: db.ImageData, thumbnail, thumbnail_timestamp: datetime.datetime
+    image_data: db.ImageData, thumbnail, thumbnail_timestamp: datetime.datetime,
+    session=None, thumb_pack: ThumbPack = None
 ):
-    image_data.thumbnail = thumbnail
+    if thumb_pack is not None:
+        # the pack is keyed by ImageData id
+        if image_data.id is None:
+            session.flush()
+        thumb_pack.put(image_data.id, thumbnail)
+        image_data.thumbnail = None
+    else:
+        image_data.thumbnail = thumbnail
     image_data.thumbnail_timestamp = thumbnail_timestamp
 
 
+def get_image_data_thumbnail(image_data: db.ImageData, thumb_pack: ThumbPack = None):
+    """ Return image_data's thumbnail (bytes or a memoryview), or None.
+
+        thumbnails imported before the ThumbPack was used are in the database
+    """
+    if thumb_pack is not None:
+        thumbnail = thumb_pack.get(image_data.id)
+        if thumbnail is not None:
+            return thumbnail
+    return image_data.thumbnail
+
+
 def _set_db_image(fs_image: db.FsImage, db_image: db.DbImage):
     # should be a FsImage method, but that would entail circular imports
     fs_image.db_image = db_image
@@ -254,16 +268,62 @@ def set_fs_folder_metrics(fs_folder, ie_folder, ie_cfg):
     pass
 
 
-def fg_start_ie_work_item(session, ie_cfg, work_item, fs_source):
+def _get_fs_images(session, ie_cfg, fs_folder, pairs):
+    """ Return [(FsImage, IEImage, new_fs_image)] for [(FsImage|None, IEImage)].
+
+        missing FsImages (and, if fs_folder has a DbFolder, missing DbImages)
+        are created with bulk INSERTs, each new data-holding image getting an
+        ImageData if EXIFs or thumbnails are being imported
+        existing DbImages are fetched with a single query
+    """
+    db_folder = fs_folder.db_folder
+    session.flush()     # fs_folder and db_folder may be new, and need ids
+
+    def add_image_data(num):
+        if ie_cfg.import_image_tags or ie_cfg.import_thumbnails:
+            return [d.id for d in db.ImageData.bulk_add(session, num)]
+        return None
+
+    new_names = [ie_image.name for fs_image, ie_image in pairs if fs_image is None]
+    if db_folder is not None:
+        # the DbImages hold the ImageData
+        db_images = db.DbImage.find_all(session, db_folder)
+        db_names = [
+            ie_image.name for fs_image, ie_image in pairs
+            if ie_image.name not in db_images]
+        for db_image in db.DbImage.bulk_add(
+            session, db_folder, db_names, add_image_data(len(db_names))
+        ):
+            db_images[db_image.name] = db_image
+        new_fs_images = db.FsImage.bulk_add(
+            session, fs_folder, new_names,
+            db_images=[db_images[name] for name in new_names])
+    else:
+        new_fs_images = db.FsImage.bulk_add(
+            session, fs_folder, new_names,
+            data_ids=add_image_data(len(new_names)))
+
+    results = []
+    new_fs_images = iter(new_fs_images)
+    for fs_image, ie_image in pairs:
+        new_fs_image = fs_image is None
+        if new_fs_image:
+            fs_image = next(new_fs_images)
+        elif db_folder is not None and fs_image.db_image is None:
+            fs_image.db_image = db_images[ie_image.name]
+        results.append((fs_image, ie_image, new_fs_image))
+    return results
+
+
+def fg_start_ie_work_item(
+    session, ie_cfg, work_item, fs_source, scan_cache=None, pre_scanner=None
+):
     import_mode = ie_cfg.import_mode
 
     def queue_ie_image_import(fs_image, ie_image, new_fs_image):
         work_item.existing_images.append((fs_image, ie_image, new_fs_image))
         if db_folder is not None:
-            db_image = db.DbImage.get(session, db_folder, ie_image.name)[0]
-            if fs_image.db_image is None:
-                fs_image.db_image = db_image
-            image_data = db_image.data
+            image_data = fs_image.db_image.data
         else:
             image_data = fs_image.data
         if ie_cfg.import_thumbnails:
@@ -272,7 +332,9 @@ def fg_start_ie_work_item(session, ie_cfg, work_item, fs_source):
             and _thumbnail_needs_update(image_data, thumb_ie_image_inst.mod_datetime)):
                 # add to the list of IEImages to get/update thumbnails for
                 work_item.get_thumbnail.add(ie_image)
-        if new_fs_image:
+        # an FsFolder without a last_scan was started, but its import never
+        # finished: its images' EXIFs may not have been imported
+        if new_fs_image or fs_folder.last_scan is None:
             if ie_cfg.import_image_tags:
                 work_item.get_exif.add(ie_image)
         pass
@@ -285,7 +347,10 @@ def fg_start_ie_work_item(session, ie_cfg, work_item, fs_source):
         pass
     elif fs_source.source_type == db.FsSourceType.DIR:
         # scan the folder's image files
-        scan_std_dir_files(ie_folder)
+        if pre_scanner is not None:
+            pre_scanner.wait(ie_folder)
+        else:
+            scan_std_dir_files(ie_folder, scan_cache)
     elif fs_source.source_type == db.FsSourceType.WEB:
         # all the work is done in the background thread
         return
@@ -305,10 +370,10 @@ def fg_start_ie_work_item(session, ie_cfg, work_item, fs_source):
     if (import_mode == ImportMode.SEL
     and fs_source.source_type == db.FsSourceType.FILE):
         # find/create FsImages corresponding to each IEImage
-        for ie_image in ie_folder.images.values():
-            fs_image, new_fs_image = db.FsImage.get(
-                session, fs_folder, ie_image.name)
-            queue_ie_image_import(fs_image, ie_image, new_fs_image)
+        fs_images = {fs_image.name: fs_image for fs_image in fs_folder.images}
+        pairs = [
+            (fs_images.get(ie_image.name), ie_image)
+            for ie_image in ie_folder.images.values()]
     else:
         # get sorted lists of all FsImages and IEImages for the folder
         fs_images = list(fs_folder.images)
@@ -316,34 +381,28 @@ def fg_start_ie_work_item(session, ie_cfg, work_item, fs_source):
         fs_images.sort(key=lambda x: x.name)
         ie_images.sort(key=lambda x: x.name)
         # merge the lists, noting additions and deletions
-        while True:
-            if len(fs_images) != 0 and len(ie_images) != 0:
-                fs_image = fs_images.pop(0)
-                ie_image = ie_images.pop(0)
-                if fs_image.name == ie_image.name:
-                    queue_ie_image_import(fs_image, ie_image, False)
-                elif fs_image.name < ie_image.name:
-                    work_item.deleted_images.append(fs_image)
-                else: # ie_image.db_name < fs_image.db_name
-                    fs_image = db.FsImage.add(session, fs_folder, ie_image.name)
-                    queue_ie_image_import(fs_image, ie_image, True)
-            elif len(fs_images) != 0:
-                work_item.deleted_images.extend(fs_images)
-                break
-            elif len(ie_images) != 0:
-                ie_image = ie_images.pop(0)
-                fs_image = db.FsImage.add(session, fs_folder, ie_image.name)
-                queue_ie_image_import(fs_image, ie_image, True)
+        pairs = []
+        for fs_image, ie_image in merge_sorted(
+            fs_images, ie_images, lambda x: x.name, lambda x: x.name
+        ):
+            if ie_image is None:
+                work_item.deleted_images.append(fs_image)
             else:
-                break
+                pairs.append((fs_image, ie_image))
 
-def bg_proc_ie_work_item(work_item, fs_source, pub_fn):
+    for fs_image, ie_image, new_fs_image in _get_fs_images(
+        session, ie_cfg, fs_folder, pairs
+    ):
+        queue_ie_image_import(fs_image, ie_image, new_fs_image)
+
+def bg_proc_ie_work_item(work_item, source_type, pub_fn, ie_cfg=None):
     """ WEB: scan the work item's web page
         FILE or DIR: get thumbnails or exifs for the work item
-        this is run in a background thread and may not touch the database
+        this is run in a background thread and may not touch the database,
+        so it's passed the FsSource's source_type, not the (expirable) FsSource
     """
     try:
-        if fs_source.source_type == db.FsSourceType.WEB:
+        if source_type == db.FsSourceType.WEB:
             if work_item.ie_folder is not None:
                 pub_fn('ie.sts.import webpage', data=1)
                 web_ie_db.scan_web_page_children(
@@ -354,7 +413,10 @@ def bg_proc_ie_work_item(work_item, fs_source, pub_fn):
             if len(work_item.get_thumbnail) > 0:
                 pub_fn(
                     'ie.sts.import thumbnails', data=len(work_item.get_thumbnail))
-                get_ie_image_thumbnails(work_item.get_thumbnail, pub_fn)
+                # IECfgs saved before thumbnail_workers was added lack it
+                num_workers = getattr(ie_cfg, 'thumbnail_workers', 1)
+                get_ie_image_thumbnails(
+                    work_item.get_thumbnail, pub_fn, num_workers)
                 pass
             if len(work_item.get_exif) > 0:
                 pub_fn(
@@ -364,7 +426,9 @@ def bg_proc_ie_work_item(work_item, fs_source, pub_fn):
     except Exception as exc_data:
         pass
 
-def fg_finish_ie_work_item(session, ie_cfg, work_item, fs_source, worklist):
+def fg_finish_ie_work_item(
+    session, ie_cfg, work_item, fs_source, worklist, thumb_pack=None
+):
     """ do auto-tagging, move image_data to db.DbImage """
 
     if fs_source.source_type == db.FsSourceType.WEB:
@@ -412,7 +476,8 @@ def fg_finish_ie_work_item(session, ie_cfg, work_item, fs_source, worklist):
                 if (thumb_ie_image_inst is not None
                 and _thumbnail_needs_update(image_data, thumb_ie_image_inst.mod_datetime)):
                     _update_thumbnail(
-                        image_data, ie_image.thumbnail, thumb_ie_image_inst.mod_datetime)
+                        image_data, ie_image.thumbnail,
+                        thumb_ie_image_inst.mod_datetime, session, thumb_pack)
     except Exception as ed:
         print('hey')
 
@@ -431,6 +496,8 @@ def fg_finish_ie_work_item(session, ie_cfg, work_item, fs_source, worklist):
     except Exception as ed:
         print ('hey')
 
+    if thumb_pack is not None:
+        thumb_pack.flush()
     session.commit()
     pass
 
@@ -449,28 +516,68 @@ class IETask2(WxTask2):
         self.ie_cfg.paths = kw['paths'] # does this need to be a copy?
 
         self.fs_source = self.ie_cfg.source
+        # for the background threads, which mustn't load ORM attributes
+        self.source_type = self.fs_source.source_type
+        # IECfgs saved before scan_cache_path was added lack it
+        self.scan_cache = ScanCache(getattr(self.ie_cfg, 'scan_cache_path', None))
+        self.thumb_pack = db.get_thumb_pack(self.session)
         self.worklist = get_ie_worklist(
             self.session,
             self.fs_source, self.ie_cfg.import_mode, self.ie_cfg.paths)
         self.worklist_idx = 0
 
+        # DIR folders are scanned by a thread pool, ahead of the DB work
+        self.pre_scanner = None
+        num_threads = getattr(self.ie_cfg, 'scan_threads', 0)
+        if self.fs_source.source_type == db.FsSourceType.DIR and num_threads > 0:
+            self.pre_scanner = DirPreScanner(
+                [w.ie_folder for w in self.worklist if w.ie_folder is not None],
+                self.scan_cache, num_threads)
+
+    def _needs_bg_proc(self, work_item):
+        return (
+            len(work_item.get_exif) > 0 or
+            len(work_item.get_thumbnail) > 0 or
+            self.source_type == db.FsSourceType.WEB)
+
     def run(self):
         self.pub('ie.sts.begun', data=self.worklist)
+        # IECfgs saved before import_pipeline_depth was added lack it
+        if getattr(self.ie_cfg, 'import_pipeline_depth', 0) > 0:
+            yield from self._run_pipelined()
+        else:
+            yield from self._run_sequential()
+        if self.pre_scanner is not None:
+            self.pre_scanner.shutdown()
+        try:
+            self.scan_cache.save()
+        except Exception as ed:
+            logging.error('saving scan cache: %s', ed)
+        if self.thumb_pack is not None:
+            try:
+                # reclaim the space of superseded thumbnails
+                if self.thumb_pack.garbage_size() > self.thumb_pack.data_size // 2:
+                    self.thumb_pack.compact()
+            except Exception as ed:
+                logging.error('compacting thumbnail pack: %s', ed)
+            self.thumb_pack.flush()
+        self.pub('ie.sts.done', data=True)
+
+    def _run_sequential(self):
+        """ start, process and finish one work item at a time """
         while not self.cancelled() and self.worklist_idx < len(self.worklist):
             work_item = self.worklist[self.worklist_idx]
             try:
                 fg_start_ie_work_item(
-                    self.session, self.ie_cfg, work_item, self.fs_source)
+                    self.session, self.ie_cfg, work_item, self.fs_source,
+                    self.scan_cache, self.pre_scanner)
             except Exception as ed:
                 print('hey')
 
-            if (len(work_item.get_exif) > 0 or
-                len(work_item.get_thumbnail) > 0 or
-                self.fs_source.source_type == db.FsSourceType.WEB
-            ):
+            if self._needs_bg_proc(work_item):
                 try:
                     yield (lambda: bg_proc_ie_work_item(
-                        work_item, self.fs_source, self.pub))
+                        work_item, self.source_type, self.pub, self.ie_cfg))
                 except Exception as ed:
                     print('hey')
                 pass
@@ -480,7 +587,7 @@ class IETask2(WxTask2):
             try:
                 fg_finish_ie_work_item(
                     self.session, self.ie_cfg, work_item, self.fs_source,
-                    self.worklist)
+                    self.worklist, self.thumb_pack)
             except Exception as ed:
                 print('hey')
 
@@ -488,4 +595,75 @@ class IETask2(WxTask2):
                 data=self.worklist[self.worklist_idx].ie_folder.db_name)
             self.worklist_idx += 1
             yield
-        self.pub('ie.sts.done', data=True)
+
+    def _run_pipelined(self):
+        """ overlap the stages of successive work items
+
+            while work item N's thumbnails/EXIFs are extracted in a background
+            thread, item N+1 is started (and, for DIR sources, later items are
+            pre-scanned) and item N-1 is finished and committed
+            all database access stays in this (foreground) thread, and at most
+            ie_cfg.import_pipeline_depth items are between start and finish
+
+            item N-1's commit includes the FsFolder/FsImages/ImageData that
+            fg_start_ie_work_item() created for the started items N and N+1...
+            if the import is cancelled (or fails) before they're finished,
+            they stay in the database without a last_scan, and the next
+            import of the folder finishes them (see fg_start_ie_work_item())
+            an item whose start or finish raises is logged and marked failed:
+            it isn't extracted, or finished if it hasn't been
+        """
+        depth = self.ie_cfg.import_pipeline_depth
+        extractor = ThreadPoolExecutor(max_workers=1)
+        in_flight = deque()     # (IEWorkItem, Future), in worklist order
+        start_idx = 0
+        try:
+            while not self.cancelled() and (
+                start_idx < len(self.worklist) or len(in_flight) != 0
+            ):
+                # finish extracted items, in worklist order
+                while (
+                    not self.cancelled() and
+                    len(in_flight) != 0 and in_flight[0][1].done()
+                ):
+                    work_item = in_flight.popleft()[0]
+                    if not work_item.failed:
+                        try:
+                            fg_finish_ie_work_item(
+                                self.session, self.ie_cfg, work_item,
+                                self.fs_source, self.worklist, self.thumb_pack)
+                        except Exception as ed:
+                            logging.error('finishing %r: %s', work_item, ed)
+                            work_item.failed = True
+                    self.pub('ie.sts.folder done',
+                        data=self.worklist[self.worklist_idx].ie_folder.db_name)
+                    self.worklist_idx += 1
+                    yield
+
+                if start_idx < len(self.worklist) and len(in_flight) < depth:
+                    # start the next item, and queue its extraction
+                    work_item = self.worklist[start_idx]
+                    start_idx += 1
+                    try:
+                        fg_start_ie_work_item(
+                            self.session, self.ie_cfg, work_item,
+                            self.fs_source, self.scan_cache, self.pre_scanner)
+                    except Exception as ed:
+                        logging.error('starting %r: %s', work_item, ed)
+                        work_item.failed = True
+                    if not work_item.failed and self._needs_bg_proc(work_item):
+                        future = extractor.submit(
+                            bg_proc_ie_work_item, work_item, self.source_type,
+                            self.pub, self.ie_cfg)
+                    else:
+                        future = Future()
+                        future.set_result(None)
+                    in_flight.append((work_item, future))
+                    yield
+                elif len(in_flight) != 0 and not in_flight[0][1].done():
+                    # nothing to start: block until the oldest item is extracted
+                    oldest = in_flight[0][1]
+                    yield (lambda: futures_wait([oldest]))
+        finally:
+            # a cancelled import abandons its unfinished items
+            extractor.shutdown(wait=True)
@@ -1,16 +1,19 @@
 """ import/export folders/images from/to the file system """
 
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
 import datetime
 from enum import Enum, IntEnum
 import io
-import json
 import logging
 import os
-from PIL import Image
+from PIL import ExifTags, Image
 import re
-import subprocess
 
 import exif
+from exiftool import get_exiftool
 import util
 
 
@@ -260,37 +263,98 @@ class IEImageInst(object):
         return '<IEImageInst %s>' % self.pname()
 
     def get_thumbnail(self):
+        return make_thumbnail(self.fs_path)
+
+
+thumbnail_size = (200, 200)
+
+
+def _exif_preview(pimage):
+    """ Return the preview JPEG embedded in <pimage>'s EXIF data, or None.
+
+        the preview is only returned if it's big enough to make a thumbnail
+        and has the same aspect ratio as <pimage>
+    """
+    raw = pimage.info.get('exif')
+    if raw is None:
+        return None
+    ifd1 = pimage.getexif().get_ifd(ExifTags.IFD.IFD1)
+    if 0x0201 not in ifd1 or 0x0202 not in ifd1:
+        return None  # no JPEGInterchangeFormat(Length)
+    offset, length = ifd1[0x0201], ifd1[0x0202]
+    tiff = raw[6:] if raw.startswith(b'Exif\x00\x00') else raw
+    preview = Image.open(io.BytesIO(tiff[offset:offset + length]))
+    pw, ph = preview.size
+    iw, ih = pimage.size
+    if max(pw, ph) < max(thumbnail_size) or abs(pw * ih - ph * iw) > max(iw, ih):
+        return None  # too small, or letterboxed
+    preview.load()
+    return preview
+
+
+def _fast_thumbnail_image(pimage):
+    """ Return the PIL image to make a thumbnail from, avoiding a full decode.
+
+        JPEGs use the EXIF preview if there's a suitable one,
+        else the decoder's DCT scaling (1/2, 1/4 or 1/8)
+    """
+    if pimage.format != 'JPEG':
+        return pimage
+    try:
+        preview = _exif_preview(pimage)
+        if preview is not None:
+            return preview
+    except Exception as ed:
+        pass  # bad EXIF data: fall through to the image itself
+    pimage.draft('RGB', thumbnail_size)
+    return pimage
+
+
+def make_thumbnail(fs_path, fast=True):
+    """ Return the JPEG bytes of a thumbnail of the image file at <fs_path>.
+
+        returns None if the file can't be read
+        if <fast>, try to avoid decoding the full-resolution image,
+        falling back to the full decode if that fails
+        this is also run in get_ie_image_thumbnails' worker processes
+    """
+    if fast:
         try:
-            pimage = Image.open(self.fs_path)
-            pimage.thumbnail((200, 200))
+            pimage = _fast_thumbnail_image(Image.open(fs_path))
+            pimage.thumbnail(thumbnail_size)
             byte_array = io.BytesIO()
             pimage.save(byte_array, format='JPEG')
-            bytes = byte_array.getvalue()
-            return bytes
-        except:
-            return None
+            return byte_array.getvalue()
+        except Exception as ed:
+            pass
+    try:
+        pimage = Image.open(fs_path)
+        pimage.thumbnail(thumbnail_size)
+        byte_array = io.BytesIO()
+        pimage.save(byte_array, format='JPEG')
+        bytes = byte_array.getvalue()
+        return bytes
+    except:
+        return None
 
 
-_exiftool_command_args = ['exiftool', '-S', '-j', '-q']
+_exiftool_common_args = ['-S', '-j', '-q']
 
 
 _exiftool_attr_args = ['-%s' % attr[0] for attr in exif.attrs]
 
 
-def _get_exiftool_json(argv):
-    """ Run exiftool on <argv> and return a list of dictionariess. """
+def _get_exiftool_json(args):
+    """ Run exiftool on <args> and return a list of dictionaries.
+
+        the exiftool process is shared by all IETasks, and restarted as needed
+    """
     try:
-        outb = subprocess.check_output(argv)
-        #FIXME: diagnostic if no exiftool
+        return get_exiftool(_exiftool_common_args).execute_json(args)
     except Exception as ed:
-        pass
-    outs = str(outb)[2:-5]\
-        .replace(r'\n', '').replace(r'\r', '').replace(r"\'", "'")
-    try:
-        exiftool_json = json.loads(outs)
-    except:
-        pass
-    return exiftool_json
+        #FIXME: diagnostic if no exiftool
+        logging.error('exiftool %s: %s', args[:1], ed)
+        return []
 
 ie_image_set0 = None
 
@@ -342,10 +406,9 @@ def get_ie_image_exifs(ie_image_set, pub):
             if len(worklist) > num_dir_files / 2:
                 # run exiftools on <dir>/*.<ext>
                 len0 = len(ie_image_set)
-                argv = list(_exiftool_command_args)
-                argv.append(os.path.join(dir_path, '*' + fs_ext))
-                argv.extend(_exiftool_attr_args)
-                exiftool_json = _get_exiftool_json(argv)
+                args = [os.path.join(dir_path, '*' + fs_ext)]
+                args.extend(_exiftool_attr_args)
+                exiftool_json = _get_exiftool_json(args)
                 proc_exiftool_json(ie_image_set, ext_paths, exiftool_json)
                 pub('ie.sts imported tags', data = len0 - len(ie_image_set))
             else:
@@ -354,25 +417,60 @@ def get_ie_image_exifs(ie_image_set, pub):
                     n = min(len(worklist), 30) # up to 30 files per run
                     sublist, worklist = worklist[:n], worklist[n:]
                     len0 = len(ie_image_set)
-                    argv = list(_exiftool_command_args)
-                    for ie_image_inst in sublist:
-                        argv.append(ie_image_inst.fs_path)
-                    argv.extend(_exiftool_attr_args)
-                    exiftool_json = _get_exiftool_json(argv)
+                    args = [ie_image_inst.fs_path for ie_image_inst in sublist]
+                    args.extend(_exiftool_attr_args)
+                    exiftool_json = _get_exiftool_json(args)
                     proc_exiftool_json(ie_image_set, ext_paths, exiftool_json)
                     pub('ie.sts imported tags', data = len0 - len(ie_image_set))
 
-def get_ie_image_thumbnails(ie_image_set, pub):
+_thumbnail_pool = None          # ProcessPoolExecutor
+_thumbnail_pool_workers = 0     # its number of worker processes
+
+def _get_thumbnail_pool(num_workers):
+    """ Return the shared thumbnail process pool, (re)creating it if needed. """
+    global _thumbnail_pool, _thumbnail_pool_workers
+    if _thumbnail_pool is not None and _thumbnail_pool_workers != num_workers:
+        _thumbnail_pool.shutdown(wait=False)
+        _thumbnail_pool = None
+    if _thumbnail_pool is None:
+        _thumbnail_pool = ProcessPoolExecutor(max_workers=num_workers)
+        _thumbnail_pool_workers = num_workers
+    return _thumbnail_pool
+
+def get_ie_image_thumbnails(ie_image_set, pub, num_workers=1):
     """ extract thumbnails for the images in <ie_image_set>
         deletes images from the set as their thumbnails are proecesed
+        returns a map: IEImage -> thumbnail JPEG bytes (or None)
+        if num_workers > 1, the thumbnails are made by a pool of processes
     """
+    global _thumbnail_pool
     pub('ie.sts.import thumbnails', data=len(ie_image_set))
+    thumbnails = {}
+    todo = []
     for ie_image in ie_image_set:
         ie_image_inst = ie_image.newest_inst_with_thumbnail
         assert ie_image_inst is not None
-        ie_image.thumbnail = ie_image_inst.get_thumbnail()
+        todo.append((ie_image, ie_image_inst.fs_path))
+    if num_workers > 1 and len(todo) > 1:
+        try:
+            pool = _get_thumbnail_pool(num_workers)
+            futures = {
+                pool.submit(make_thumbnail, fs_path): ie_image
+                for ie_image, fs_path in todo}
+            for future in as_completed(futures):
+                ie_image = futures[future]
+                ie_image.thumbnail = thumbnails[ie_image] = future.result()
+                pub('ie.sts imported thumbnails', data=1)
+        except BrokenProcessPool as ed:
+            # a worker died: make the remaining thumbnails in this process
+            logging.error('thumbnail pool failed: %s', ed)
+            _thumbnail_pool = None
+        todo = [x for x in todo if x[0] not in thumbnails]
+    for ie_image, fs_path in todo:
+        ie_image.thumbnail = thumbnails[ie_image] = make_thumbnail(fs_path)
         pub('ie.sts imported thumbnails', data=1)
     # clear(ie_image_set) FIXME: why does this fail?
+    return thumbnails
 
 # a std_dirname has the form 'yymmdd db_name'
 leading_date_space = re.compile(r'^\d{6,6} ')
@@ -384,7 +482,7 @@ def is_std_dirname(dirname):
     return True
     # TODO: return leading_date_space.match(dirname) is not None
 
-def proc_std_dirname(dir_pathname, dir_name):
+def proc_std_dirname(dir_pathname, dir_name, stat_mtime=None):
     match = leading_date.match(dir_name)
     if match is None:
         db_date = None
@@ -393,7 +491,8 @@ def proc_std_dirname(dir_pathname, dir_name):
         yymmdd = match.group()
         db_date = util.date_from_yymmdd(yymmdd)
         db_name = dir_name[match.end():].lstrip(' ')
-    stat_mtime = os.path.getmtime(dir_pathname)
+    if stat_mtime is None:
+        stat_mtime = os.path.getmtime(dir_pathname)
     mtime = datetime.datetime.fromtimestamp(stat_mtime)
     folder = IEFolder(dir_pathname, db_date, db_name, mtime)
     if db_date is None:
@@ -404,15 +503,17 @@ def scan_dir_set(dir_set_pathname, test, proc):
     """ return a list of IEFolders representing each directory satisfying test
         the list is sorted by folder fs_name
         test(dir_name) checks whether the directory should be processed
-        proc(dir_pathname, dir_name) returns an IEFolder for the directory
+        proc(dir_pathname, dir_name, stat_mtime)
+            returns an IEFolder for the directory
+        the directory is read with a single os.scandir() pass
     """
     folders = []
-    for dir in os.listdir(dir_set_pathname):
-        dir_path = os.path.join(dir_set_pathname, dir)
-        if os.path.isdir(dir_path) and test(dir):
-            folder = proc(dir_path, dir)
-            if folder is not None:
-                folders.append(folder)
+    with os.scandir(dir_set_pathname) as entries:
+        for entry in entries:
+            if entry.is_dir() and test(entry.name):
+                folder = proc(entry.path, entry.name, entry.stat().st_mtime)
+                if folder is not None:
+                    folders.append(folder)
     folders.sort(key=lambda folder: folder.fs_path)
     return folders
 
@@ -479,9 +580,36 @@ def add_ie_folder_name_tag(ie_folder, bases):
     ie_folder.add_tag(IETag(
         IETagType.BASED, text=ie_folder.db_name, bases=bases))
 
-def scan_std_dir_files(ie_folder):
+def scan_std_dir_files(ie_folder, scan_cache=None):
+    """ add IEImages (and any folder tags) for the files in ie_folder's directory
 
-    def acquire_file(file_path, file_name, high_res):
+        if <scan_cache> is a ScanCache, the listings of unchanged directories
+        are taken from it, without calling stat on each file
+    """
+
+    def list_dir(pathname):
+        """ Return a list of (name, is_dir, stat_mtime) for <pathname>. """
+        if scan_cache is not None:
+            signature = scan_cache.dir_signature(pathname)
+            entries = scan_cache.lookup(pathname, signature)
+            if entries is not None:
+                return entries
+        # DirEntry caches the type (and on Windows the stat) from the scan
+        entries = []
+        with os.scandir(pathname) as dir_entries:
+            for entry in dir_entries:
+                if entry.is_dir():
+                    entries.append((entry.name, True, None))
+                elif entry.is_file():
+                    entries.append(
+                        (entry.name, False, entry.stat().st_mtime))
+                else:
+                    entries.append((entry.name, False, None))
+        if scan_cache is not None:
+            scan_cache.store(pathname, signature, entries)
+        return entries
+
+    def acquire_file(file_path, file_name, high_res, stat_mtime):
         got_folder_tags = False
         if file_name == 'New Text Document.txt':
             got_folder_tags = True
@@ -491,8 +619,7 @@ def scan_std_dir_files(ie_folder):
                 for tag in tags:
                     ie_folder.add_tag(IETag(
                         IETagType.BASED, text=tag, bases='band'))
-        elif os.path.isfile(file_path):
-            stat_mtime = os.path.getmtime(file_path)
+        elif stat_mtime is not None:
             mtime = datetime.datetime.fromtimestamp(stat_mtime)
             add_ie_folder_image_inst(
                 ie_folder, file_path, file_name, high_res, mtime)
@@ -505,14 +632,14 @@ def scan_std_dir_files(ie_folder):
         # TODO: detect high_res from exif dimensions
         logging.debug('scan_std_dir_images(%s)', pathname)
         got_folder_tags = False
-        file_name_list = os.listdir(pathname)
-        for file_name in file_name_list:
+        for file_name, is_dir, stat_mtime in list_dir(pathname):
             file_path = os.path.join(pathname, file_name)
-            if os.path.isdir(file_path):
+            if is_dir:
                 if file_name not in ignored_subdirectories:
                     acquire_dir(file_path, file_name == 'hi')
             else:
-                got_folder_tags |= acquire_file(file_path, file_name, high_res)
+                got_folder_tags |= acquire_file(
+                    file_path, file_name, high_res, stat_mtime)
         return got_folder_tags
 
     assert ie_folder is not None
@@ -529,17 +656,69 @@ def scan_std_dir_files(ie_folder):
     # TODO: adjust seq numbers for Nikon 9999 rollover:
     # 0001, 9999 => 10001, 09999
 
+class DirPreScanner(object):
+    """ runs scan_std_dir_files on IEFolders in a pool of threads
+
+        the folders are scanned in the order given, at most .lookahead ahead
+        of the folder the client is waiting for, so the directory I/O
+        overlaps the client's (e.g. database) work on earlier folders
+    """
+
+    def __init__(self, ie_folders, scan_cache=None, num_threads=4, lookahead=None):
+        self.scan_cache = scan_cache
+        self.lookahead = 2 * num_threads if lookahead is None else lookahead
+        self.pool = ThreadPoolExecutor(max_workers=num_threads)
+        self.pending = deque(ie_folders)    # IEFolders not yet submitted
+        self.futures = {}                   # map: IEFolder -> Future
+        self._submit()
+
+    def __repr__(self):
+        return '<DirPreScanner %u pending, %u submitted>' % (
+            len(self.pending), len(self.futures))
+
+    def _submit(self):
+        while len(self.pending) != 0 and len(self.futures) < self.lookahead:
+            ie_folder = self.pending.popleft()
+            self.futures[ie_folder] = self.pool.submit(
+                scan_std_dir_files, ie_folder, self.scan_cache)
+
+    def wait(self, ie_folder):
+        """ Wait until ie_folder has been scanned.
+
+            a folder that hasn't been submitted yet is scanned in this thread
+            any exception raised by the scan is re-raised here
+        """
+        future = self.futures.pop(ie_folder, None)
+        try:
+            if future is not None:
+                future.result()
+            else:
+                if ie_folder in self.pending:
+                    self.pending.remove(ie_folder)
+                scan_std_dir_files(ie_folder, self.scan_cache)
+        finally:
+            self._submit()
+
+    def shutdown(self):
+        """ Stop scanning: queued scans are cancelled. """
+        self.pending.clear()
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
+        self.pool.shutdown(wait=True)
+
 corbett_date = re.compile(r'[0-9]{2,2}_[0-9]{2,2}(&[0-9]{2,2})?_[0-9]{2,2}')
 corbett_trailing_date = re.compile(
     r'[0-9]{2,2}_[0-9]{2,2}(&[0-9]{2,2})?_[0-9]{2,2}$')
 amper_date = re.compile(r'&[0-9]+')
 
-def proc_corbett_filename(file_pathname, file_name, folders):
+def proc_corbett_filename(file_pathname, file_name, folders, stat_mtime=None):
     base_name, ext = os.path.splitext(file_name)
 
     base_name = base_name.lower()
     base, seq = base_name.split('-')
-    stat_mtime = os.path.getmtime(file_pathname)
+    if stat_mtime is None:
+        stat_mtime = os.path.getmtime(file_pathname)
     mtime = datetime.datetime.fromtimestamp(stat_mtime)
 
     if (len(folders) == 0 or
@@ -604,19 +783,16 @@ def scan_file_set(file_set_pathname, test, proc):
         the list is sorted by folder.fs_path
         test(file_name)
             checks whether the directory should be processed
-        proc(file_pathname, file_name, folders)
+        proc(file_pathname, file_name, folders, stat_mtime)
             returns an IEImage for the file, and,
         if the filename has a new prefix, adds a new IEFolder to folders
+        the directory is read with a single os.scandir() pass
     """
     folders = []
-    try:
-        os.listdir(file_set_pathname)
-    except:
-        pass
-    for file in os.listdir(file_set_pathname):
-        file_path = os.path.join(file_set_pathname, file)
-        if os.path.isfile(file_path) and test(file):
-            proc(file_path, file, folders)
+    with os.scandir(file_set_pathname) as entries:
+        for entry in entries:
+            if entry.is_file() and test(entry.name):
+                proc(entry.path, entry.name, folders, entry.stat().st_mtime)
     folders.sort(key=lambda folder: folder.fs_path)
 
     return folders
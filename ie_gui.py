@@ -11,6 +11,7 @@ from cfg import cfg
 from ie_cfg import *
 from ie_db import IETask2
 from tab_panel_gui import TabPanel, TabPanelStack
+from tags_gui import hold_tag_rebind, release_tag_rebind
 import util
 
 class IEState(Enum):
@@ -221,6 +222,8 @@ class ImportExportTP(TabPanel):
             pub.subscribe(self.on_ie_folder_done, 'ie.sts.folder done')
             pub.subscribe(self.on_ie_done, 'ie.sts.done')
 
+            # the import's tag changes are applied once it's done
+            hold_tag_rebind()
             self.ie_cmd = IETask2(
                 session=db.session,
                 ie_cfg=cfg.ie, fs_source=self.source,
@@ -300,6 +303,7 @@ class ImportExportTP(TabPanel):
         self.gc_button.SetLabel('Import/Export')
         self.gc_button.Enable()
         self.Layout()
+        release_tag_rebind()
         pass
 
 
@@ -0,0 +1,82 @@
+""" persistent cache of directory listings, for re-scanning unchanged folders """
+
+import json
+import logging
+import os
+import threading
+
+
+class ScanCache(object):
+    """ a map: directory pathname -> (signature, entries)
+
+        signature is the directory's (mtime_ns, inode, size), which changes
+        when an entry is added, deleted or renamed
+        entries is a list of (name, is_dir, stat_mtime) where stat_mtime is
+            the file's os.path.getmtime() value
+            None for subdirectories and special files
+        the cache is loaded from and saved to a JSON file at .path,
+        or is memory-only if .path is None
+        it may be shared by threads, e.g. ie_fs.DirPreScanner's
+    """
+
+    version = 1
+
+    def __init__(self, path=None):
+        self.path = path
+        self.dirs = {}
+        self.dirty = False  # whether .dirs has changed since load()/save()
+        self.lock = threading.Lock()  # for .dirs and .dirty
+        if path is not None:
+            self.load()
+
+    def __repr__(self):
+        return '<ScanCache %s: %u directories>' % (self.path, len(self.dirs))
+
+    @staticmethod
+    def dir_signature(dir_path):
+        st = os.stat(dir_path)
+        return [st.st_mtime_ns, st.st_ino, st.st_size]
+
+    def lookup(self, dir_path, signature):
+        """ Return the cached entries for <dir_path>, or None if it has changed. """
+        with self.lock:
+            try:
+                cached_signature, entries = self.dirs[dir_path]
+            except KeyError:
+                return None
+        return entries if cached_signature == signature else None
+
+    def store(self, dir_path, signature, entries):
+        with self.lock:
+            self.dirs[dir_path] = (signature, entries)
+            self.dirty = True
+
+    def load(self):
+        dirs = {}
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+            if state['version'] == ScanCache.version:
+                dirs = {
+                    dir_path: (signature, [tuple(e) for e in entries])
+                    for dir_path, (signature, entries) in state['dirs'].items()}
+        except FileNotFoundError:
+            pass
+        except Exception as ed:
+            # a damaged cache is just discarded
+            logging.error('scan cache %s: %s', self.path, ed)
+        with self.lock:
+            self.dirs = dirs
+            self.dirty = False
+
+    def save(self):
+        if self.path is None:
+            return
+        with self.lock:
+            if not self.dirty:
+                return
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'version': ScanCache.version, 'dirs': self.dirs}, f)
+            os.replace(tmp_path, self.path)
+            self.dirty = False
@@ -11,6 +11,7 @@ from util import attrs_eq
 class SorterCol(object):
     col_desc: ColDesc
     descending: bool
+    reverse: bool = False   # sort in the exact reverse of the descending order
 
     def get_state(self):
         return '%s%s' % ('-' if self.descending else '+', self.col_desc.db_name)
@@ -1,5 +1,7 @@
 ''' SQL query generator '''
 
+from collections import OrderedDict
+from operator import itemgetter
 from typing import List, NewType, Optional, Union
 
 from col_desc import CDXState, ColDesc
@@ -22,6 +24,7 @@ class SqlQuery(object):
     where_str: str                  # the WHERE clause, '' if none
     order_str: str                  # the ORDER BY clause, '' if none
     query_str: str                  # the final SQL query
+    row_decoder: list               # [(getter, make_fn)], one per cli_select column
 
     def __init__(
             self, tbl_desc: TblDesc, select: SelectArg,
@@ -31,6 +34,14 @@ class SqlQuery(object):
         self.tbl_desc = tbl_desc
         self.join_state = JoinState(tbl_desc)
         self.cli_select = select
+        # the WHERE clause is made first, so that it references table columns:
+        # a SELECT alias like 'id' can be ambiguous in a WHERE clause
+        self.filter = filter
+        if filter is not None:
+            self.where_str = ' ' + filter.sql_str(self.join_state, CDXState())
+        else:
+            self.where_str = ''
+        self.row_decoder = None
         if select == 'count':
             # self.select = RowDesc([tbl_desc.lookup_col_desc('id')])
             # self.select_str = 'SELECT COUNT(%s.id)' % tbl_desc.sql_name()
@@ -40,19 +51,15 @@ class SqlQuery(object):
             for cd in self.cli_select.col_descs:
                 cd.sql_select(col_ref_fn, CDXState())
             self.select_str = 'SELECT ' + ', '.join(self.join_state.select_strs)
-            pass
-        self.filter = filter
-        if filter is not None:
-            self.where_str = ' ' + filter.sql_str(self.join_state, CDXState())
-        else:
-            self.where_str = ''
+            self.row_decoder = self._make_row_decoder()
         self.sorter = sorter
         if sorter is not None:
             sort_cols = []
             col_ref_fn = self.join_state.sql_col_ref_fn()
             for sc in sorter.cols:
                 sort_cols.append(
-                    sc.col_desc.sql_order_str(sc.descending, col_ref_fn, CDXState()))
+                    sc.col_desc.sql_order_str(
+                        sc.descending, col_ref_fn, CDXState(), sc.reverse))
             self.order_str = ' ORDER BY ' + ', '.join(sort_cols)
         else:
             self.order_str = ''
@@ -64,6 +71,75 @@ class SqlQuery(object):
         self.query_str += self.order_str
         pass
 
+    def _make_row_decoder(self):
+        ''' Compile cli_select into a getter and a make_fn (or None) per column
+
+            a column's value is getter(row) if make_fn is None, else make_fn(getter(row))
+        '''
+        select_cols = self.join_state.select_cols
+        row_decoder = []
+        for cd in self.cli_select.col_descs:
+            idxs, make_fn = cd.sql_decoder(lambda alias: select_cols[alias][0], CDXState())
+            if make_fn is not None and len(idxs) == 1:
+                # itemgetter(idx) returns the value, not a 1-tuple
+                make_fn = (lambda make_fn: lambda val: make_fn((val,)))(make_fn)
+            row_decoder.append((itemgetter(*idxs), make_fn))
+        return row_decoder
+
+    # map: SqlQuery.key() -> SqlQuery, least recently used first
+    cache = OrderedDict()
+    cache_size = 256
+
+    @staticmethod
+    def _cd_key(cd: ColDesc):
+        # the attributes that determine a ColDesc's SQL
+        return (
+            type(cd).__name__, cd.db_name,
+            getattr(cd, 'path_str', None), tuple(getattr(cd, 'dependencies', ())))
+
+    @staticmethod
+    def _lit_key(literal):
+        # literals are bound as parameters, so only their types matter
+        if type(literal) in (tuple, list):  # e.g. for a VirtualColDesc
+            return tuple(type(l).__name__ for l in literal)
+        return type(literal).__name__
+
+    @staticmethod
+    def _tup_key(t):
+        ''' Return a hashable structural key for a filter-tup '''
+        if t[0] in ('&', '|', '!', '-'):
+            return (t[0],) + tuple(SqlQuery._tup_key(e) for e in t[1:])
+        return (t[0], SqlQuery._cd_key(t[1])) + tuple(SqlQuery._lit_key(e) for e in t[2:])
+
+    @staticmethod
+    def key(tbl_desc: TblDesc, select: SelectArg, filter: Filter=None, sorter: Sorter=None):
+        ''' Return a hashable key: equal keys make identical SqlQueries '''
+        return (
+            tbl_desc.db_tbl_cls.__name__,
+            select if select == 'count' else tuple(
+                SqlQuery._cd_key(cd) for cd in select.col_descs),
+            None if filter is None else SqlQuery._tup_key(filter.tup),
+            None if sorter is None else tuple(
+                (SqlQuery._cd_key(sc.col_desc), sc.descending, sc.reverse)
+                for sc in sorter.cols))
+
+    @classmethod
+    def get(cls, tbl_desc: TblDesc, select: SelectArg, filter: Filter=None, sorter: Sorter=None):
+        ''' Return a (cached) SqlQuery(tbl_desc, select, filter, sorter)
+
+            SqlQueries aren't modified after __init__(), so they can be shared
+        '''
+        key = SqlQuery.key(tbl_desc, select, filter, sorter)
+        try:
+            sql_query = cls.cache[key]
+            cls.cache.move_to_end(key)
+        except KeyError:
+            sql_query = cls.cache[key] = SqlQuery(
+                tbl_desc, select, filter=filter, sorter=sorter)
+            if len(cls.cache) > cls.cache_size:
+                cls.cache.popitem(last=False)
+        return sql_query
+
     @staticmethod
     def from_names(tbl_desc: TblDesc, select_names, **kwargs):
         if select_names == 'count':
@@ -3,6 +3,7 @@
 import db
 import difflib
 from ie_fs import IETagType
+from task import Task
 
 def find_text_binding(session, text, fs_tag_source):
     """ Return [state, FsTagBinding, FsItemTagSource, DbTag id]. """
@@ -54,43 +55,75 @@ def tag_text_binding(session, text, bases, fs_tag_source):
     result = results[0]
     return result
 
+def max_tag_words(session, fs_tag_source):
+    """ Return the most words in a text that could be bound in fs_tag_source.
+
+        i.e. in any DbTag name, or in any fs_tag_source or global FsTagMapping
+        a longer text is always UNBOUND
+    """
+    mapping_cache = db.FsTagMappingCache.get(session)
+    return max(
+        db.DbTagIndex.get(session).max_words(),
+        mapping_cache.max_words(session, fs_tag_source),
+        mapping_cache.max_words(session, db.global_tag_source))
+
 def word_list_bindings(session, word_list, bases, fs_tag_source):
-    """ Return [(relative idx range, [state, binding, source, db_tag])]. """
-    def partition_words(pfx, word_list, partitions):
-        partitions.append(pfx + [word_list])
-        if len(word_list) > 1:
-            for x in range(1, len(word_list)):
-                partition_words(
-                    pfx + [word_list[0:x]], word_list[x:], partitions)
-    partitions = []
-    partition_words([], word_list, partitions)
-
-    scores = []
-    for partition in partitions:
-        bindings = []
-        total_score = 1
-        have_unbound_multiword = False
-        for wl in partition:
-            text = ' '.join(wl)
-            binding = tag_text_binding(
-                session, text, bases, fs_tag_source)
-            if binding[1] == db.FsTagBinding.UNBOUND and len(wl) > 1:
-                have_unbound_multiword = True
-            bindings.append(binding)
-            total_score += binding[1].value # UNBOUND | SUGGESTED | BOUND
-        if have_unbound_multiword:
-            # don't consider a partition that has unbound multi-word elements
-            total_score = 0
-        scores.append((total_score / len(partition), partition, bindings))
-    scores.sort(key = lambda x: x[0], reverse=True) # sort by descending score
+    """ Return [(relative idx range, [state, binding, source, db_tag])].
+
+        picks the partition of word_list into runs of words with the best
+        score: (1 + the sum of the runs' binding values) / the number of runs,
+        where partitions with an unbound multi-word run are excluded
+        ties go to the partition that comes first in the order
+        [all words], [1 word, partitions of the rest...], [2 words, ...], ...
+
+        dynamic programming over suffixes: each run is bound at most once,
+        and runs longer than max_tag_words() are never bound
+    """
+    num_words = len(word_list)
+    max_run = min(num_words, max(1, max_tag_words(session, fs_tag_source)))
+
+    run_bindings = {}   # (start, stop) -> binding of word_list[start:stop]
+    def run_binding(start, stop):
+        binding = run_bindings.get((start, stop))
+        if binding is None:
+            binding = run_bindings[(start, stop)] = tag_text_binding(
+                session, ' '.join(word_list[start:stop]), bases, fs_tag_source)
+        return binding
+
+    # best[start][num_runs] = (total binding value, run stops) of the first
+    # (in the order above) best-scoring partition of word_list[start:]
+    best = [None] * num_words + [{0: (0, ())}]
+    for start in range(num_words - 1, -1, -1):
+        best[start] = {}
+        rest = num_words - start
+        for run in [rest] + list(range(1, rest)):
+            if run > max_run and run > 1:
+                continue
+            binding = run_binding(start, start + run)
+            if binding[1] == db.FsTagBinding.UNBOUND and run > 1:
+                continue    # an unbound multi-word run
+            for num_runs, (value, stops) in best[start + run].items():
+                value += binding[1].value   # UNBOUND | SUGGESTED | BOUND
+                if (num_runs + 1 not in best[start]
+                or value > best[start][num_runs + 1][0]):
+                    best[start][num_runs + 1] = (value, (start + run,) + stops)
+
+    def order(stops):
+        # a partition's position in the order above
+        return tuple(
+            (0,) if stop == num_words else (1, stop - start)
+            for start, stop in zip((0,) + stops, stops))
+
+    score = max(
+        (1 + value) / num_runs for num_runs, (value, stops) in best[0].items())
+    stops = min(
+        (s for num_runs, (value, s) in best[0].items()
+            if (1 + value) / num_runs == score),
+        key=order)
 
     results = []
-    score = scores[0]
-    idx = 0
-    for wl, binding in zip(score[1], score[2]):
-        r = range(idx, idx + len(wl))
-        results.append((r, binding))
-        idx += len(wl)
+    for start, stop in zip((0,) + stops, stops):
+        results.append((range(start, stop), run_binding(start, stop)))
     return results
 
 def _bind_fs_item_tags(session, item, fs_tag_source):
@@ -209,60 +242,25 @@ def set_fs_item_tags(session, fs_item, ie_tags, fs_tag_source):
         # no change in external tags
         return
 
-    # diff the imported tags with the current ones
+    # diff the imported tags with the current ones, and build the new list:
+    # unchanged runs keep their FsItemTags, changed runs get new ones
     # TODO: flag when user-defined groupings are destroyed
     s = difflib.SequenceMatcher(None, old_diff_tups, new_diff_tups)
     item_tags = fs_item.item_tags
-    opcodes = s.get_opcodes()
-    opcodes.reverse()
+    new_tags = []
     got_changes = False
-    for op in opcodes:
-        act, old_start, old_stop, new_start, new_stop = op
+    for act, old_start, old_stop, new_start, new_stop in s.get_opcodes():
         if act == 'equal':
+            new_tags.extend(item_tags[old_start:old_stop])
             continue
-        if not got_changes:
-            got_changes = True
-            # remove any auto-assigned word groupings
-            for item_tag in item_tags:
-                if not item_tag.user_grouping:
-                    item_tag.del_grouping()
-
-        # a user-assigned word-grouping spans or extends into the change
-        if (
-            old_start > 0
-            and item_tags[old_start - 1].user_grouping
-            and old_diff_tups[old_start - 1][0] == 'w'
-            and item_tags[old_start - 1].last_idx >= old_start
-        ):
-            db.FsItemTag.del_grouping(item_tags[old_start - 1])
-        if (
-            old_stop < len(item_tags)
-            and item_tags[old_stop].user_grouping
-            and old_diff_tups[old_stop][0] == 'w'
-            and item_tags[old_stop].first_idx < old_stop
-        ):
-            db.FsItemTag.del_grouping(item_tags[old_stop])
-
-        # TODO a user-assigned word-grouping abuts the change
-        # and the affected region will start(end) with a word after the change
-
-        if act != 'insert':
-            # delete old_start:old_stop
-            pass
-            for idx in range(old_start, old_stop):
-                item_tags[idx].delete(session)
-            pass
-        if act != 'delete':
-            # insert new_start:new_stop at old_start
-            offset = 0
-            for t in new_diff_tups[new_start:new_stop]:
-                db.FsItemTag.insert(session,
-                    fs_item, old_start + offset,
-                    db.FsTagType.WORD if t[0] == 'w' else db.FsTagType.TAG,
-                    t[1], t[2])
-            pass
-
+        got_changes = True
+        new_tags.extend(
+            (db.FsTagType.WORD if t[0] == 'w' else db.FsTagType.TAG, t[1], t[2])
+            for t in new_diff_tups[new_start:new_stop])
     if got_changes:
+        # removes auto-assigned word groupings,
+        # and user-assigned ones that span or extend into a change
+        db.FsItemTag.rewrite(session, fs_item, new_tags)
         try:
             _bind_fs_item_tags(session, fs_item, fs_tag_source)
         except Exception as ed:
@@ -290,8 +288,11 @@ def _on_tag_change(session, text):
         called when a DbTag or FsTagMapping is changed
         <state> is a leaf tag string,
             e.g. 'Green Day' if the eDbTag 'band}Green Day' was changed
+        the GUI starts a TagRebindTask when the change is committed
+        (see tags_gui.init_tag_rebind())
     """
     db.TagChange.add(session, text)
+    session.info['tag_changes'] = True
     pass
 
 def on_db_tag_added(session, db_tag):
@@ -299,6 +300,9 @@ def on_db_tag_added(session, db_tag):
 
         called when a DbTag is added, renamed, or un-deprecated
     """
+    db_tag_index = db.DbTagIndex.loaded(session)
+    if db_tag_index is not None:
+        db_tag_index.add(db_tag)
     _on_tag_change(session, db_tag.name)
 
 def on_db_tag_removed(session, db_tag):
@@ -306,6 +310,9 @@ def on_db_tag_removed(session, db_tag):
 
         called when a DbTag is renamed or deprecated
     """
+    db_tag_index = db.DbTagIndex.loaded(session)
+    if db_tag_index is not None:
+        db_tag_index.remove(db_tag)
     _on_tag_change(session, db_tag.name)
 
 def on_fs_tag_mapping_added(session, mapping):
@@ -321,3 +328,63 @@ def on_fs_tag_mapping_removed(session, mapping):
         called when an FsTagMapping is deleted or its .binding is changed
     """
     _on_tag_change(session, mapping.leaf_text())
+
+class TagRebindTask(Task):
+    """ apply the global TagChange list to the affected FsItemTags
+
+        changes are drained oldest-first; for each batch of changes,
+        rebind_fs_item_tags() is run on just the FsItems whose tags
+        could bind to a changed text (see FsItemTag.find_item_ids()),
+        yielding to the Slicer between items and committing every
+        commit_batch items
+        cancel() stops it between items: the unapplied changes are kept
+    """
+
+    change_batch = 100
+    commit_batch = 100
+
+    def __init__(self, slicer, **kw):
+        super().__init__(slicer, **kw)
+        self.session = kw['session']
+        self.num_changes = 0    # TagChanges applied
+        self.num_items = 0      # FsItems rebound
+
+    @staticmethod
+    def fs_tag_source(item):
+        """ Return the FsTagSource used to bind <item>'s tags. """
+        folder = item.folder if isinstance(item, db.FsImage) else item
+        return folder.source.tag_source
+
+    def run(self):
+        session = self.session
+        while not self.cancelled():
+            changes = db.TagChange.oldest(session, TagRebindTask.change_batch)
+            if len(changes) == 0:
+                break
+            item_ids = set()
+            for change in changes:
+                item_ids |= db.FsItemTag.find_item_ids(session, change.text)
+            num_uncommitted = 0
+            for item_id in sorted(item_ids):
+                if self.cancelled():
+                    break
+                item = session.get(db.FsItem, item_id)
+                if item is not None:
+                    rebind_fs_item_tags(
+                        session, item, TagRebindTask.fs_tag_source(item))
+                    self.num_items += 1
+                    num_uncommitted += 1
+                if num_uncommitted == TagRebindTask.commit_batch:
+                    session.commit()
+                    num_uncommitted = 0
+                yield
+            # the changes are deleted only once their FsItems are rebound,
+            # so an interrupted batch is reapplied (rebinding is idempotent)
+            if self.cancelled():
+                session.commit()
+                break
+            for change in changes:
+                change.delete(session)
+            session.commit()
+            self.num_changes += len(changes)
+            yield
@@ -1,11 +1,17 @@
 """ tag editing GUI """
 
 from sortedcontainers import SortedKeyList
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 import wx
 from wx.lib.agw import ultimatelistctrl as ulc
 
+import db
 import gui_wrap
 from tab_panel_gui import TabPanel, TabPanelStack
+from tags import TagRebindTask
+from task import TaskState
+from wx_task import WxSlicer
 
 class Table(ulc.UltimateListCtrl):
 
@@ -141,3 +147,51 @@ class TagsTP(TabPanel):
         pass
 
 
+# committed TagChanges are applied by a low-priority TagRebindTask,
+# which waits for any import/export to finish: both use db.session
+
+rebind_task = None  # the last TagRebindTask started by start_tag_rebind()
+rebind_holds = 0    # hold_tag_rebind()s not yet released
+
+def start_tag_rebind():
+    """ Start a TagRebindTask if there are TagChanges, and none is running. """
+    global rebind_task
+    if rebind_holds != 0:
+        return
+    if (rebind_task is not None and not rebind_task.cancel_requested and
+        rebind_task.state not in (TaskState.DONE, TaskState.EXCEPTION)
+    ):
+        return  # it also applies the TagChanges added while it runs
+    if db.TagChange.first(db.session) is None:
+        return
+    rebind_task = TagRebindTask(WxSlicer.get(), session=db.session, pri=1)
+    rebind_task.start()
+
+def hold_tag_rebind():
+    """ Stop TagRebindTasks until release_tag_rebind(), e.g. during an import. """
+    global rebind_holds
+    rebind_holds += 1
+    if rebind_task is not None:
+        # its unapplied TagChanges are kept, and reapplied by the next one
+        rebind_task.cancel()
+
+def release_tag_rebind():
+    global rebind_holds
+    rebind_holds -= 1
+    start_tag_rebind()
+
+def _on_after_commit(session):
+    if session.info.pop('tag_changes', False):
+        # no SQL in an after_commit hook
+        wx.CallAfter(start_tag_rebind)
+
+def _on_after_rollback(session):
+    session.info.pop('tag_changes', None)
+
+def init_tag_rebind():
+    """ Start a TagRebindTask for the TagChanges left by the last run,
+        and whenever TagChanges are committed
+    """
+    event.listen(Session, 'after_commit', _on_after_commit)
+    event.listen(Session, 'after_rollback', _on_after_rollback)
+    start_tag_rebind()
@@ -1,5 +1,6 @@
 ''' table and block buffers '''
 
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import List, Optional
 
@@ -37,32 +38,41 @@ class BlkBuf(object):
 
 class TblBuf(object):
     cli_query: TblQuery                 # the query specified by the client
-    buf_query: TblQuery                 # the query used by TblBuf (may have added key columns)
-    blk_bufs: List[BlkBuf]              # sorted by .first_key
+    tbl_query: TblQuery                 # the query used by TblBuf (may have added key columns)
+    blk_bufs: 'OrderedDict[int, BlkBuf]'
+    # map: block number -> BlkBuf of rows [n * blk_size, (n + 1) * blk_size),
+    # least recently used first
+    last_blk: Optional[int]             # the block of the last get_row()
     cur_rows: Optional[List[RowBuf]]    # the result of the last get_rows()
     # cur_rows is None before the first sucessful get_rows()
     # a prefix and suffix (or all) of cur_rows' elements may be None
 
+    blk_size = 256      # rows per block
+    max_blks = 64       # blocks kept in the LRU cache
+
     def __init__(self, cli_query: TblQuery):
         self.set_query(cli_query)
         self.cur_rows = None
 
     def _set_tbl_query(self):
+        # the blocks are read in keyset_sorter() order: it's a total order,
+        # so get_rows_after/before() of a cached block's keys find its neighbors
         added_key_col_descs = self.cli_query.missing_key_col_descs()
-        if len(added_key_col_descs) == 0:
-            self.tbl_query = self.cli_query
-        else:
-            # add added_key_col_descs to the query
-            self.tbl_query = TblQuery(
-                self.cli_query.tbl_desc,
-                RowDesc(list(self.cli_query.row_desc.col_descs) + added_key_col_descs),
-                self.cli_query.sorter
-            )
+        self.tbl_query = TblQuery(
+            self.cli_query.tbl_desc,
+            RowDesc(list(self.cli_query.row_desc.col_descs) + added_key_col_descs),
+            filter=self.cli_query.filter, sorter=self.cli_query.keyset_sorter()
+        )
 
     def set_query(self, cli_query):
         self.cli_query = cli_query
         self._set_tbl_query()
-        self.blk_bufs = []
+        self.invalidate()
+
+    def invalidate(self):
+        ''' Discard the cached blocks, e.g. after the table has changed. '''
+        self.blk_bufs = OrderedDict()
+        self.last_blk = None
 
     def add_col(self, col_desc: ColDesc, idx: int = -1):
         pass
@@ -76,31 +86,92 @@ class TblBuf(object):
     def set_sorter(self, sorter: Sorter = None):
         self.cli_query.set_sorter(sorter)
         self._set_tbl_query()
-        self.blk_bufs = []  # invalidate the buffers
+        self.invalidate()
 
     def set_filter(self, filter):
         self.cli_query.set_filter(filter)
-        self.tbl_query.set_filter(filter)
-        self.blk_bufs = []  # invalidate the buffers
+        self._set_tbl_query()
+        self.invalidate()
+
+    def _read_blks(self, session, first_blk: int, num_blks: int):
+        ''' Read blocks first_blk..first_blk + num_blks - 1 into the cache. '''
+        limit = num_blks * TblBuf.blk_size
+        prev_bb = self.blk_bufs.get(first_blk - 1)
+        next_bb = self.blk_bufs.get(first_blk + num_blks)
+        if prev_bb is not None:
+            # seek from a neighbor's key, rather than skip over the rows before
+            row_bufs = self.tbl_query.get_rows_after(session, prev_bb.last_key, limit=limit)
+        elif next_bb is not None and first_blk >= 0:
+            row_bufs = self.tbl_query.get_rows_before(session, next_bb.first_key, limit=limit)
+        elif first_blk == 0:
+            row_bufs = self.tbl_query.get_rows(session, limit=limit)
+        else:
+            # a jump: seek from the key of the row before the first block
+            key = self.tbl_query.get_key_at(session, first_blk * TblBuf.blk_size - 1)
+            row_bufs = (
+                [] if key is None else
+                self.tbl_query.get_rows_after(session, key, limit=limit))
+        for x in range(num_blks):
+            blk_rows = row_bufs[x * TblBuf.blk_size:(x + 1) * TblBuf.blk_size]
+            if len(blk_rows) == 0:
+                break   # past the end of the table
+            self.blk_bufs[first_blk + x] = BlkBuf.from_row_buf_list(blk_rows, self.tbl_query)
+        while len(self.blk_bufs) > TblBuf.max_blks:
+            self.blk_bufs.popitem(last=False)
+
+    def _get_blk(self, session, blk: int) -> Optional[BlkBuf]:
+        ''' Return block <blk>, reading it and the next block
+            in the scroll direction if it isn't cached
+        '''
+        bb = self.blk_bufs.get(blk)
+        if bb is None:
+            if self.last_blk is not None and blk < self.last_blk and blk > 0:
+                self._read_blks(session, blk - 1, 2)     # scrolling up
+            else:
+                self._read_blks(session, blk, 2)
+            bb = self.blk_bufs.get(blk)
+        if bb is not None:
+            self.blk_bufs.move_to_end(blk)
+        self.last_blk = blk
+        return bb
+
+    def _get_row(self, session, row_idx: int, row_desc: RowDesc) -> Optional[RowBuf]:
+        blk, x = divmod(row_idx, TblBuf.blk_size)
+        bb = self._get_blk(session, blk)
+        if bb is None or x >= len(bb.row_bufs):
+            return None
+        return bb.row_bufs[x].extract(bb.data_row_desc, row_desc)
+
+    def get_row(self, session, row_idx: int) -> Optional[RowBuf]:
+        ''' Return row <row_idx> of cli_query, or None if there's no such row. '''
+        return self._get_row(session, row_idx, self.cli_query.row_desc)
+
+    def get_key(self, session, row_idx: int) -> Optional[RowBuf]:
+        ''' Return the key (see TblQuery.key_row_desc()) of row <row_idx>, or None
+
+            the key includes the row's id, even if cli_query's RowDesc doesn't
+        '''
+        return self._get_row(session, row_idx, self.tbl_query.key_row_desc())
 
     def get_rows(self, session, limit=None, skip=0) -> List[RowBuf]:
         try:
-            row_bufs = self.tbl_query.get_rows(session, limit=limit, skip=skip)
-            bb = BlkBuf.from_row_buf_list(row_bufs, self.tbl_query)
-            self.blk_bufs = [bb]
-            self.cur_rows = [
-                rb.extract(bb.data_row_desc, self.cli_query.row_desc)
-                for rb in bb.row_bufs
-            ]
+            if limit is None:
+                limit = self.cli_query.get_num_rows(session) - skip
+            self.cur_rows = []
+            for row_idx in range(skip, skip + limit):
+                row = self.get_row(session, row_idx)
+                if row is None:
+                    break
+                self.cur_rows.append(row)
             return self.cur_rows
         except Exception as ed:
             print('hey')
             pass
 
-from base_path import dev_base_ie_source_path
-from db import open_file_db
-
 if __name__ == '__main__':
+    from base_path import dev_base_ie_source_path
+    from db import open_file_db
+
     session = open_file_db(dev_base_ie_source_path + '\\test.db', 'r')
     q_image = TblQuery.from_names('DbImage', ['name', 'folder_id', 'folder_name'])
     tb = TblBuf(q_image)
@@ -5,12 +5,12 @@ from typing import List, Optional
 
 from sqlalchemy.orm import aliased, with_polymorphic
 
-from col_desc import ColDesc, DataColDesc, LinkColDesc, ShortcutCD, CDXState
+from col_desc import ColDesc, DataColDesc, LinkColDesc, ShortcutCD
 from db import DbFolder, DbImage
 from filter import Filter
 from row_buf import RowBuf
 from row_desc import RowDesc
-from sorter import Sorter
+from sorter import Sorter, SorterCol
 from sql_query import SqlQuery
 from sql_util import JoinState
 from tbl_desc import TblDesc
@@ -124,10 +124,29 @@ class TblQuery(object):
     def missing_key_col_descs(self):
         ''' Return a list of any key fields not in the query's RowDesc '''
         missing_key_col_descs = []
-        for key_col_desc in self.sorter.row_desc.col_descs:
-            missing_key_col_descs.append(key_col_desc)
+        for key_col_desc in self.key_row_desc().col_descs:
+            if not self.row_desc.has_col_desc(key_col_desc):
+                missing_key_col_descs.append(key_col_desc)
         return missing_key_col_descs
 
+    def keyset_sorter(self) -> Sorter:
+        ''' Return self.sorter, with +id appended if needed to make the order total
+
+            so that a key identifies one row, and keyset pages don't skip ties
+        '''
+        id_cd = self.tbl_desc.lookup_col_desc('id')
+        if self.sorter.row_desc.has_col_desc(id_cd):
+            return self.sorter
+        return Sorter(list(self.sorter.cols) + [SorterCol(id_cd, descending=False)])
+
+    def key_row_desc(self) -> RowDesc:
+        ''' Return the RowDesc of the keys used by get_rows_after/before() '''
+        return self.keyset_sorter().row_desc
+
+    def get_key(self, row: RowBuf) -> RowBuf:
+        ''' Return the key of <row>, a row of this query (see missing_key_col_descs()) '''
+        return row.extract(self.row_desc, self.key_row_desc())
+
     def set_sorter(self, sorter: Sorter = None):
         self.sql_query = None
         self.sorter = copy.copy(sorter if sorter is not None else self.tbl_desc.sorter)
@@ -138,66 +157,127 @@ class TblQuery(object):
 
     def get_sql_query(self):
         if self.sql_query is None:
-            self.sql_query = SqlQuery(
+            self.sql_query = SqlQuery.get(
                 self.tbl_desc, self.row_desc, filter=self.filter, sorter=self.sorter)
         return self.sql_query
 
+    @staticmethod
+    def _params(filter: Optional[Filter]):
+        return () if filter is None else tuple(filter.sql_params())
+
+    @staticmethod
+    def _execute(session, sql_query: SqlQuery, params, limit=None, skip=0) -> List[RowBuf]:
+        ''' Run <sql_query> with <params> bound to its placeholders
+
+            <sql_query> may be a cached SqlQuery made for other literals, so
+            <params> must come from the caller's filter
+        '''
+        q = str(sql_query)
+        if limit is not None:
+            q += ' LIMIT %u' % limit
+        if skip != 0:
+            if limit is None:
+                q += ' LIMIT -1'  # SQLite won't do OFFSET without LIMIT
+            q += ' OFFSET %u' % skip
+        db_rows = session.connection().exec_driver_sql(q, params)
+        row_decoder = sql_query.row_decoder
+        return [
+            RowBuf([
+                getter(dbr) if make_fn is None else make_fn(getter(dbr))
+                for getter, make_fn in row_decoder])
+            for dbr in db_rows]
+
     def get_rows(self, session, limit=None, skip=0) -> List[RowBuf]:
         if self.sql_query is None:
-            self.sql_query = SqlQuery(
+            self.sql_query = SqlQuery.get(
                 self.tbl_desc, self.row_desc, filter=self.filter, sorter=self.sorter)
         try:
-            row_bufs = []
-            q = str(self.sql_query)
-            if limit is not None:
-                q += ' LIMIT %u' % limit
-            if skip != 0:
-                if limit is None:
-                    q += ' LIMIT -1'  # SQLite won't do OFFSET without LIMIT
-                q += ' OFFSET %u' % skip
-            db_rows = session.execute(q)
-            join_state = self.sql_query.join_state
-            row_bufs = []
-            for dbr in db_rows:
-                cols = []
-                for cd in self.sql_query.cli_select.col_descs:
-                    try:
-                        col = cd.get_val(
-                            lambda col_name: dbr[join_state.select_cols[col_name][0]],
-                            CDXState())
-                    except Exception as ed:
-                        print('hi')
-                    cols.append(col)
-                row_bufs.append(RowBuf(cols))
-            return row_bufs
+            return TblQuery._execute(
+                session, self.sql_query, TblQuery._params(self.filter), limit=limit, skip=skip)
         except Exception as ed:
             print('hey')
             pass
 
+    @staticmethod
+    def _order_op(sorter_col: SorterCol, relop: str):
+        # compare as ORDER BY does: its expression, and NULLs (see ColDesc.order_relop_strs)
+        return ('desc' if sorter_col.descending else 'asc') + relop
+
+    @staticmethod
+    def _key_tup(sorter_cols: List[SorterCol], key_cols, before: bool):
+        ''' Return a filter-tup selecting the rows that sort before (or after) a key '''
+        if len(sorter_cols) > 1:
+            high = TblQuery._key_tup(sorter_cols[0:1], key_cols[0:1], before)
+            low = TblQuery._key_tup(sorter_cols[1:], key_cols[1:], before)
+            eq_op = TblQuery._order_op(sorter_cols[0], '==')
+            return ('|', high,
+                    ('&', (eq_op, sorter_cols[0].col_desc, key_cols[0]), low))
+        else:
+            rel = '>' if sorter_cols[0].descending == before else '<'
+            return (TblQuery._order_op(sorter_cols[0], rel), sorter_cols[0].col_desc, key_cols[0])
+
+    def _get_keyset_rows(self, session, key: RowBuf, limit, before: bool):
+        sorter = self.keyset_sorter()
+        key_tup = TblQuery._key_tup(sorter.cols, key.cols, before)
+        # the redundant bound on the first key column lets SQLite seek an index
+        first_tup = TblQuery._key_tup(sorter.cols[0:1], key.cols[0:1], before)
+        key_tup = ('&', (first_tup[0] + '=',) + first_tup[1:], key_tup)
+        filter = Filter(
+            key_tup if self.filter is None else ('&', self.filter.tup, key_tup))
+        if before:
+            # read backwards from the key, in the exact reverse order
+            # (flipping descending would still sort IMDate.unk last)
+            sorter = Sorter([
+                SorterCol(sc.col_desc, sc.descending, reverse=True) for sc in sorter.cols])
+        sql_query = SqlQuery.get(self.tbl_desc, self.row_desc, filter=filter, sorter=sorter)
+        row_bufs = TblQuery._execute(session, sql_query, TblQuery._params(filter), limit=limit)
+        if before:
+            row_bufs.reverse()
+        return row_bufs
+
+    def get_rows_after(self, session, key: RowBuf, limit=None) -> List[RowBuf]:
+        ''' Return the first <limit> rows that sort after <key>.
+
+            <key> is a RowBuf of key_row_desc() values, e.g. from get_key()
+            unlike get_rows(skip=n), the cost doesn't grow with the row's index
+        '''
+        return self._get_keyset_rows(session, key, limit, before=False)
+
+    def get_rows_before(self, session, key: RowBuf, limit=None) -> List[RowBuf]:
+        ''' Return the last <limit> rows that sort before <key>, in sort order. '''
+        return self._get_keyset_rows(session, key, limit, before=True)
+
+    def get_key_at(self, session, idx: int) -> Optional[RowBuf]:
+        ''' Return the key of row <idx>, or None if there's no such row.
+
+            only the key columns are read over the skipped rows, so the skip
+            is cheap next to get_rows(skip=idx) of a wide row: a deep jump is
+            get_rows_after(get_key_at(idx - 1)), not get_rows(skip=idx)
+        '''
+        sql_query = SqlQuery.get(
+            self.tbl_desc, self.key_row_desc(), filter=self.filter,
+            sorter=self.keyset_sorter())
+        keys = TblQuery._execute(
+            session, sql_query, TblQuery._params(self.filter), limit=1, skip=idx)
+        return keys[0] if len(keys) != 0 else None
+
     def get_num_rows(self, session) -> int:
-        sql_query = SqlQuery(self.tbl_desc, 'count', filter=self.filter)
+        sql_query = SqlQuery.get(self.tbl_desc, 'count', filter=self.filter)
         q = str(sql_query)
         try:
-            num_rows = session.execute(q).scalar()
+            num_rows = session.connection().exec_driver_sql(
+                q, TblQuery._params(self.filter)).scalar()
         except Exception as ed:
             print('hey')
         return num_rows
 
     def get_index(self, session, key: RowBuf) -> int:
-        def get_tup(scs, cvs):
-            if len(scs) > 1:
-                high = get_tup(scs[0:1], cvs[0:1])
-                low = get_tup(scs[1:], cvs[1:])
-                return ('|', high,
-                        ('&', ('==', scs[0].col_desc, cvs[0]), low))
-            else:
-                rel = '>' if scs[0].descending else '<'
-                return (rel, scs[0].col_desc, cvs[0])
-        filter_tup = get_tup(self.tbl_desc.sorter.cols, key.cols)
+        filter_tup = TblQuery._key_tup(self.tbl_desc.sorter.cols, key.cols, before=True)
         filter = Filter(filter_tup)
-        sql_query = SqlQuery(self.tbl_desc, 'count', filter=filter)
+        sql_query = SqlQuery.get(self.tbl_desc, 'count', filter=filter)
         try:
-            idx = session.execute(str(sql_query)).scalar()
+            idx = session.connection().exec_driver_sql(
+                str(sql_query), TblQuery._params(filter)).scalar()
         except Exception as ed:
             print('hey')
         return idx
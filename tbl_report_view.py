@@ -5,35 +5,59 @@ from dataclasses import dataclass
 from typing import Any, List, Optional
 import wx
 import wx.lib.agw.ultimatelistctrl as ulc
+from wx.lib.pubsub import pub
 
 from col_desc import ChildrenCD, ColDesc, LinkColDesc, ShortcutCD, SuperCD, TraitColDesc
 import db
 from filter import Filter
 from row_desc import RowDesc
 from tab_panel_gui import TabPanel, TabPanelStack
+from tbl_buf import TblBuf
 from tbl_desc import TblDesc
 from tbl_query import TblQuery
 from tbl_view import TblTP
+from thumb_gui import ThumbnailTP
+
+
+def get_col_by_id(td: TblDesc, col_desc: ColDesc, id: Optional[int]) -> Any:
+    ''' Return <col_desc>'s value in <td>'s row <id>, or None if there's no such row '''
+    if id is None:
+        return None
+    id_tq = TblQuery(
+        td, RowDesc([col_desc]), filter=Filter(('==', td.lookup_col_desc('id'), id)))
+    r = id_tq.get_rows(db.session, limit=1)
+    return r[0].cols[0] if len(r) > 0 else None
 
 
 class TblULC(ulc.UltimateListCtrl):
     tbl_query: TblQuery
+    tbl_buf: TblBuf     # caches blocks of tbl_query's rows
 
     def __init__(self, *args, **kwargs):
         tbl_query = kwargs.pop('tbl_query')
         super().__init__(*args, **kwargs)
         self.tbl_query = tbl_query
+        self.tbl_buf = TblBuf(tbl_query)
 
         for x, cd in enumerate(self.tbl_query.row_desc.col_descs):
             self.InsertColumn(x, cd.disp_names[0])
 
         num_rows = tbl_query.get_num_rows(db.session)
         self.SetItemCount(num_rows)
+        pub.subscribe(self.on_db_committed, 'db.committed')
+
+    def on_db_committed(self):
+        ''' Re-read the rows: the table may have changed, so tbl_buf's blocks are stale '''
+        if not self:
+            return  # the window has been destroyed
+        self.tbl_buf.invalidate()
+        self.SetItemCount(self.tbl_query.get_num_rows(db.session))
+        self.Refresh()
 
     def OnGetItemText(self, row, col):
         try:
-            r = self.tbl_query.get_rows(db.session, skip=row, limit=1)
-            c = r[0].cols[col]
+            r = self.tbl_buf.get_row(db.session, row)
+            c = r.cols[col]
             cd = self.tbl_query.row_desc.col_descs[col]
             return cd.gui_str(c)
         except Exception as ed:
@@ -243,12 +267,14 @@ class TblReportTP(TblTP):
             except Exception as ed:
                 print('sds')
         self.report.tbl_query.add_col(col_idx, cd)
+        self.report.tbl_buf.set_query(self.report.tbl_query)
         self.report.InsertColumn(col_idx, col_item.disp_str())
         self.Refresh()
         pass
 
     def on_del_col(self, event, col_idx):
         self.report.tbl_query.del_col(col_idx)
+        self.report.tbl_buf.set_query(self.report.tbl_query)
         self.report.DeleteColumn(col_idx)
         self.Refresh()
         pass
@@ -273,9 +299,35 @@ class TblReportTP(TblTP):
         if len(child_items) != 0 and len(parent_items) != 0:
             menu.AppendSeparator()
         add_cell_items(menu, parent_items)
+        if 'data_id' in [cd.db_name for cd in col_descs]:
+            # e.g. a DbImage or FsImage row
+            menu.AppendSeparator()
+            item = menu.Append(-1, 'Thumbnail')
+            self.Bind(
+                wx.EVT_MENU, lambda event: self.on_push_thumbnail(event, row_idx, tab_idx), item)
         self.PopupMenu(menu)
         pass
 
+    def get_row_id(self, row_idx: int) -> Optional[int]:
+        ''' Return the id of the report's row <row_idx>, or None
+
+            the row is found through the report's tbl_buf, so it's the row displayed
+        '''
+        tbl_buf = self.report.tbl_buf
+        key = tbl_buf.get_key(db.session, row_idx)
+        if key is None:
+            return None
+        id_cd = tbl_buf.tbl_query.tbl_desc.lookup_col_desc('id')
+        return key.extract(tbl_buf.tbl_query.key_row_desc(), RowDesc([id_cd])).cols[0]
+
+    def on_push_thumbnail(self, event, row_idx, tab_idx):
+        td = self.tbl_query.tbl_desc
+        data_id = get_col_by_id(td, td.lookup_col_desc('data_id'), self.get_row_id(row_idx))
+        if data_id is None:
+            return
+        add_tps = self.notebook.tab_panel_stacks[tab_idx]
+        ThumbnailTP(add_tps.relative_stack(1), data_id)
+
     def on_push_item_select(self, event, row_idx, tab_idx, cell_item):
         def add(text, pos):
             def l(pos):
@@ -294,12 +346,9 @@ class TblReportTP(TblTP):
         if isinstance(cell_item.cd_path[0], LinkColDesc):
             # going towards ancestors, or maybe sideways
             td = self.tbl_query.tbl_desc
+            foreign_id = self.get_row_id(row_idx)
             for cd in cell_item.cd_path:
-                foreign_cd = cd.foreign_cd
-                id_tq = TblQuery(td, RowDesc([foreign_cd]))
-                # FIXME: use the same buffer pool as the table view
-                r = id_tq.get_rows(db.session, skip=row_idx, limit=1)
-                foreign_id = r[0].cols[0]
+                foreign_id = get_col_by_id(td, cd.foreign_cd, foreign_id)
                 if foreign_id is None:
                     return
                 td = cd.foreign_td
@@ -313,10 +362,9 @@ class TblReportTP(TblTP):
             # going towards children
             assert len(cell_item.cd_path) == 1
             td = self.tbl_query.tbl_desc
-            id_cd = td.lookup_col_desc('id')
-            id_tq = TblQuery(td, RowDesc([id_cd]))
-            r = id_tq.get_rows(db.session, skip=row_idx, limit=1)
-            id = r[0].cols[0]
+            id = self.get_row_id(row_idx)
+            if id is None:
+                return
             children_cd = cell_item.cd_path[0]
             tbl_td = children_cd.foreign_td
             vc = tbl_td.viewed_cols(TblReportTP)  # TODO: defaults
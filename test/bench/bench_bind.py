@@ -0,0 +1,91 @@
+''' benchmark tag-text binding: per-lookup SELECTs vs the session caches
+
+    usage: python bench_bind.py [num_texts [num_tags]]
+    binds num_texts texts (half mapped, a quarter DbTags, a quarter unknown)
+    with tags.find_text_binding(), which uses db.FsTagMappingCache and
+    db.DbTagIndex, and with the same lookups done as one SELECT each
+    (the way FsTagMapping.find and DbTag.find/find_expr used to work)
+'''
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import db
+import tags
+
+
+def sql_find_mapping(session, tag_source, text):
+    return session.query(db.FsTagMapping).filter_by(
+        tag_source=tag_source, text=text).first()
+
+
+def sql_find_expr(session, expr):
+    tag = None
+    for elt in expr.split('|'):
+        tag = session.query(db.DbTag).filter_by(
+            lower_name=elt.lower(), parent=tag).first()
+        if tag is None:
+            break
+    return tag
+
+
+def sql_find_text_binding(session, text, fs_tag_source):
+    mapping = sql_find_mapping(session, fs_tag_source, text)
+    if mapping is not None:
+        return [text, mapping.binding, db.FsItemTagSource.FSTS, mapping.db_tag]
+    mapping = sql_find_mapping(session, db.global_tag_source, text)
+    if mapping is not None:
+        return [text, mapping.binding, db.FsItemTagSource.GLOBTS, mapping.db_tag]
+    db_tag = sql_find_expr(session, text)
+    if db_tag is not None:
+        return [text, db.FsTagBinding.BOUND, db.FsItemTagSource.DBTAG, db_tag]
+    return [text, db.FsTagBinding.UNBOUND, db.FsItemTagSource.NONE, None]
+
+
+def make_db(num_tags):
+    session = db.open_mem_db()
+    tag_source = db.FsTagSource.add(session, 'bench')
+    band = db.DbTag.get(session, 'band')[0]
+    for x in range(num_tags):
+        db_tag = db.DbTag.add(session, 'Band %u' % x, band)
+        if x % 2 == 0:
+            db.FsTagMapping.add(
+                session, tag_source, 'band %u' % x, db.FsTagBinding.BOUND, db_tag)
+    session.commit()
+    return session, tag_source
+
+
+def make_texts(num_texts, num_tags):
+    rng = random.Random(1)
+    texts = []
+    for x in range(num_texts):
+        n = rng.randrange(num_tags)
+        r = x % 4
+        texts.append(
+            'band %u' % (n - n % 2) if r < 2 else       # mapped
+            'band|Band %u' % n if r == 2 else           # a DbTag
+            'nobody %u' % n)                            # unknown
+    return texts
+
+
+def bench(name, bind, session, tag_source, texts):
+    t0 = time.perf_counter()
+    results = [bind(session, text, tag_source) for text in texts]
+    secs = time.perf_counter() - t0
+    print('%-7s %7u texts  %8.3f s  %9.0f texts/s' % (
+        name, len(texts), secs, len(texts) / secs))
+    return results
+
+
+if __name__ == '__main__':
+    num_texts = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    num_tags = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    session, tag_source = make_db(num_tags)
+    texts = make_texts(num_texts, num_tags)
+    sql = bench('sql', sql_find_text_binding, session, tag_source, texts)
+    cached = bench('cached', tags.find_text_binding, session, tag_source, texts)
+    assert cached == sql
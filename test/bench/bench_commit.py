@@ -0,0 +1,58 @@
+''' benchmark import commit throughput: SQLite defaults vs db.sqlite_perf_pragmas
+
+    usage: python bench_commit.py [num_folders [images_per_folder]]
+    each "folder" mimics fg_start/fg_finish_ie_work_item: an FsFolder,
+    bulk-added FsImages with ImageData, a fake thumbnail each, then one commit
+'''
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import db
+
+
+def import_folders(session, num_folders, images_per_folder):
+    tag_source = db.FsTagSource.add(session, 'bench')
+    source = db.FsSource.add(
+        session, 'bench', '/bench', db.FsSourceType.DIR, False, tag_source)
+    session.commit()
+    thumbnail = os.urandom(8 * 1024)
+    names = ['dsc_%04u' % x for x in range(images_per_folder)]
+    for f in range(num_folders):
+        fs_folder = db.FsFolder.add(session, source, 'folder %u' % f)
+        session.flush()
+        data = db.ImageData.bulk_add(session, len(names))
+        db.FsImage.bulk_add(
+            session, fs_folder, names, data_ids=[d.id for d in data])
+        for image_data in data:
+            image_data.thumbnail = thumbnail
+            image_data.thumbnail_timestamp = datetime.datetime.now()
+        session.commit()
+
+
+def bench(name, pragmas, num_folders, images_per_folder):
+    with tempfile.TemporaryDirectory() as dir_path:
+        session = db.open_file_db(
+            os.path.join(dir_path, 'bench.db'), 'w', pragmas)
+        t0 = time.perf_counter()
+        import_folders(session, num_folders, images_per_folder)
+        secs = time.perf_counter() - t0
+        journal_mode = session.connection().exec_driver_sql(
+            'PRAGMA journal_mode').scalar()
+        session.close()
+        session.get_bind().dispose()
+    print('%-9s journal=%-6s %5u commits  %7.3f s  %8.1f commits/s  %9.0f images/s' % (
+        name, journal_mode, num_folders, secs,
+        num_folders / secs, num_folders * images_per_folder / secs))
+
+
+if __name__ == '__main__':
+    num_folders = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    images_per_folder = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    bench('defaults', None, num_folders, images_per_folder)
+    bench('perf', db.sqlite_perf_pragmas, num_folders, images_per_folder)
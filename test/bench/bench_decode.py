@@ -0,0 +1,83 @@
+''' benchmark TblQuery row decoding: ColDesc.get_val chains vs SqlQuery.row_decoder
+
+    usage: python bench_decode.py [num_folders [images_per_folder]]
+    decodes DbImage rows with joined folder columns (an IMDate and a name),
+    from already-fetched result rows and end-to-end through TblQuery.get_rows()
+'''
+
+import datetime
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from col_desc import CDXState
+import db
+from row_buf import RowBuf
+from tbl_desc import TblDesc
+import tbl_descs
+from tbl_query import TblQuery
+
+
+def make_db(num_folders, images_per_folder):
+    session = db.open_mem_db()
+    for f in range(num_folders):
+        folder = db.DbFolder.add(
+            session, datetime.date(2000 + f % 20, 1 + f % 12, 1 + f % 28), 'folder %u' % f)
+        for x in range(images_per_folder):
+            db.DbImage.add(session, folder, 'dsc_%04u' % x)
+    session.commit()
+    return session
+
+
+def get_val_decode(sql_query, db_rows):
+    # the per-row, per-column ColDesc.get_val() chains that row_decoder replaces
+    join_state = sql_query.join_state
+    row_bufs = []
+    for dbr in db_rows:
+        cols = []
+        for cd in sql_query.cli_select.col_descs:
+            cols.append(cd.get_val(
+                lambda col_name: dbr[join_state.select_cols[col_name][0]], CDXState()))
+        row_bufs.append(RowBuf(cols))
+    return row_bufs
+
+
+def row_decoder_decode(sql_query, db_rows):
+    row_decoder = sql_query.row_decoder
+    return [
+        RowBuf([
+            getter(dbr) if make_fn is None else make_fn(getter(dbr))
+            for getter, make_fn in row_decoder])
+        for dbr in db_rows]
+
+
+def best_secs(fn, repeat=3):
+    best = None
+    for r in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        secs = time.perf_counter() - t0
+        best = secs if best is None else min(best, secs)
+    return best
+
+
+def report(name, num_rows, secs):
+    print('%-12s %7u rows  %8.3f s  %10.0f rows/s' % (name, num_rows, secs, num_rows / secs))
+
+
+if __name__ == '__main__':
+    num_folders = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    images_per_folder = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    TblDesc.complete_tbl_descs()
+    session = make_db(num_folders, images_per_folder)
+    q_image = TblQuery.from_names(
+        'DbImage', ['folder_date', 'folder_name', 'name', 'id'])
+    sql_query = q_image.get_sql_query()
+    db_rows = session.connection().exec_driver_sql(str(sql_query)).all()
+    num_rows = len(db_rows)
+    assert get_val_decode(sql_query, db_rows) == row_decoder_decode(sql_query, db_rows)
+    report('get_val', num_rows, best_secs(lambda: get_val_decode(sql_query, db_rows)))
+    report('row_decoder', num_rows, best_secs(lambda: row_decoder_decode(sql_query, db_rows)))
+    report('get_rows', num_rows, best_secs(lambda: q_image.get_rows(session)))
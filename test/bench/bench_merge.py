@@ -0,0 +1,77 @@
+''' benchmark the import merges: repeated list.pop(0) vs util.merge_sorted
+
+    usage: python bench_merge.py [max_pop_n]
+    merges n existing names with n scanned names (90% in common),
+    for n = 10k, 100k and 1M
+    the pop(0) merge is quadratic, so it is skipped for n > max_pop_n
+    (default 100k)
+'''
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+from util import merge_sorted
+
+
+class Item(object):
+
+    def __init__(self, name):
+        self.name = name
+
+
+def make_lists(n):
+    """ return sorted existing and scanned lists, each of n Items """
+    names = ['dsc_%07u' % x for x in range(n + n // 10)]
+    existing = [Item(name) for name in names[:n]]
+    scanned = [Item(name) for name in names[n // 10:]]
+    return existing, scanned
+
+
+def pop_merge(existing, scanned):
+    """ the merge as it was done in fg_start_ie_work_item """
+    existing = list(existing)
+    scanned = list(scanned)
+    pairs = []
+    while True:
+        if len(existing) != 0 and len(scanned) != 0:
+            if existing[0].name == scanned[0].name:
+                pairs.append((existing.pop(0), scanned.pop(0)))
+            elif existing[0].name < scanned[0].name:
+                pairs.append((existing.pop(0), None))
+            else:
+                pairs.append((None, scanned.pop(0)))
+        elif len(existing) != 0:
+            pairs.append((existing.pop(0), None))
+        elif len(scanned) != 0:
+            pairs.append((None, scanned.pop(0)))
+        else:
+            break
+    return pairs
+
+
+def iter_merge(existing, scanned):
+    return list(merge_sorted(
+        existing, scanned, lambda x: x.name, lambda x: x.name))
+
+
+def bench(name, merge, existing, scanned):
+    t0 = time.perf_counter()
+    pairs = merge(existing, scanned)
+    secs = time.perf_counter() - t0
+    print('  %-8s %8u pairs  %8.3f s' % (name, len(pairs), secs))
+    return pairs
+
+
+if __name__ == '__main__':
+    max_pop_n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    for n in (10000, 100000, 1000000):
+        print('n = %u' % n)
+        existing, scanned = make_lists(n)
+        pairs = bench('merge', iter_merge, existing, scanned)
+        if n <= max_pop_n:
+            assert bench('pop(0)', pop_merge, existing, scanned) == pairs
+        else:
+            print('  %-8s skipped' % 'pop(0)')
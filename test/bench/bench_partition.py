@@ -0,0 +1,89 @@
+''' benchmark tags.word_list_bindings: DP vs enumerating every partition
+
+    usage: python bench_partition.py [max_enumerated_words]
+    binds runs of 1..20 words against 1000 one- to three-word DbTags
+    enumeration scores 2^(n-1) partitions, so it is skipped for
+    n > max_enumerated_words (default 14)
+    times are the best of 3 runs
+'''
+
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import db
+import tags
+
+
+def enumerated_word_list_bindings(session, word_list, bases, fs_tag_source):
+    """ the original word_list_bindings(): score every partition """
+    def partition_words(pfx, word_list, partitions):
+        partitions.append(pfx + [word_list])
+        if len(word_list) > 1:
+            for x in range(1, len(word_list)):
+                partition_words(
+                    pfx + [word_list[0:x]], word_list[x:], partitions)
+    partitions = []
+    partition_words([], word_list, partitions)
+
+    scores = []
+    for partition in partitions:
+        bindings = []
+        total_score = 1
+        have_unbound_multiword = False
+        for wl in partition:
+            binding = tags.tag_text_binding(
+                session, ' '.join(wl), bases, fs_tag_source)
+            if binding[1] == db.FsTagBinding.UNBOUND and len(wl) > 1:
+                have_unbound_multiword = True
+            bindings.append(binding)
+            total_score += binding[1].value
+        if have_unbound_multiword:
+            total_score = 0
+        scores.append((total_score / len(partition), partition, bindings))
+    scores.sort(key = lambda x: x[0], reverse=True)
+
+    results = []
+    idx = 0
+    for wl, binding in zip(scores[0][1], scores[0][2]):
+        results.append((range(idx, idx + len(wl)), binding))
+        idx += len(wl)
+    return results
+
+
+def timed(fn, *args):
+    """ Return fn's result and its best time over 3 runs. """
+    secs = []
+    for x in range(3):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        secs.append(time.perf_counter() - t0)
+    return result, min(secs)
+
+
+if __name__ == '__main__':
+    max_enumerated = int(sys.argv[1]) if len(sys.argv) > 1 else 14
+    rng = random.Random(1)
+    vocabulary = ['word%u' % x for x in range(200)]
+    session = db.open_mem_db()
+    tag_source = db.FsTagSource.add(session, 'bench')
+    for x in range(1000):
+        db.DbTag.get(session, ' '.join(rng.sample(vocabulary, rng.randint(1, 3))))
+    session.commit()
+    tags.max_tag_words(session, tag_source)     # load the caches
+    print('words       dp (s)   enumerated (s)')
+    for num_words in range(1, 21):
+        word_list = [rng.choice(vocabulary) for x in range(num_words)]
+        dp, dp_secs = timed(
+            tags.word_list_bindings, session, word_list, None, tag_source)
+        if num_words <= max_enumerated:
+            enumerated, enumerated_secs = timed(
+                enumerated_word_list_bindings,
+                session, word_list, None, tag_source)
+            assert dp == enumerated
+            print('%5u  %11.6f  %15.6f' % (num_words, dp_secs, enumerated_secs))
+        else:
+            print('%5u  %11.6f  %15s' % (num_words, dp_secs, 'skipped'))
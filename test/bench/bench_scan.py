@@ -0,0 +1,149 @@
+''' benchmark ie_fs directory scanning: os.listdir + per-entry stats vs os.scandir
+
+    usage: python bench_scan.py [num_folders [files_per_folder]]
+    counts the calls that cost a syscall:
+        directory reads     os.listdir() and os.scandir()
+        stats               os.stat()/os.lstat() (including os.path.isdir/isfile/getmtime)
+                            and the first DirEntry.stat() on each entry
+    on Windows DirEntry.stat() is answered from the directory read, so the
+    scandir stat counts there are an upper bound
+'''
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import ie_fs
+
+
+class Counts(object):
+
+    def __init__(self):
+        self.dir_reads = 0
+        self.stats = 0
+
+
+counts = Counts()
+
+
+class _CountingEntry(object):
+    """ a DirEntry that counts its first stat() call """
+
+    def __init__(self, entry):
+        self._entry = entry
+        self._statted = False
+
+    def __getattr__(self, name):
+        return getattr(self._entry, name)
+
+    def stat(self, **kw):
+        if not self._statted:
+            self._statted = True
+            counts.stats += 1
+        return self._entry.stat(**kw)
+
+
+class _CountingScandir(object):
+
+    def __init__(self, it):
+        self._it = it
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self._it.close()
+
+    def __iter__(self):
+        for entry in self._it:
+            yield _CountingEntry(entry)
+
+
+def instrument():
+    real_stat, real_lstat = os.stat, os.lstat
+    real_listdir, real_scandir = os.listdir, os.scandir
+
+    def stat(*args, **kw):
+        counts.stats += 1
+        return real_stat(*args, **kw)
+
+    def lstat(*args, **kw):
+        counts.stats += 1
+        return real_lstat(*args, **kw)
+
+    def listdir(*args, **kw):
+        counts.dir_reads += 1
+        return real_listdir(*args, **kw)
+
+    def scandir(*args, **kw):
+        counts.dir_reads += 1
+        return _CountingScandir(real_scandir(*args, **kw))
+
+    os.stat, os.lstat, os.listdir, os.scandir = stat, lstat, listdir, scandir
+
+
+def make_tree(root, num_folders, files_per_folder):
+    for f in range(num_folders):
+        dir_path = os.path.join(root, '1710%02u folder %u' % (f % 28 + 1, f))
+        os.mkdir(dir_path)
+        os.mkdir(os.path.join(dir_path, 'hi'))
+        for x in range(files_per_folder):
+            for ext in ('.nef', '.jpg'):
+                open(os.path.join(dir_path, 'dsc_%04u%s' % (x, ext)), 'w').close()
+            if x % 4 == 0:
+                open(os.path.join(dir_path, 'hi', 'dsc_%04u.jpg' % x), 'w').close()
+
+
+def listdir_scan(root):
+    """ the scan as it was done before scandir: listdir, then isdir/isfile/getmtime """
+
+    def acquire_dir(ie_folder, pathname, high_res):
+        for file_name in os.listdir(pathname):
+            file_path = os.path.join(pathname, file_name)
+            if os.path.isdir(file_path):
+                acquire_dir(ie_folder, file_path, file_name == 'hi')
+            elif os.path.isfile(file_path):
+                mtime = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
+                ie_fs.add_ie_folder_image_inst(
+                    ie_folder, file_path, file_name, high_res, mtime)
+
+    folders = []
+    for dir_name in os.listdir(root):
+        dir_path = os.path.join(root, dir_name)
+        if os.path.isdir(dir_path):
+            folders.append(ie_fs.proc_std_dirname(dir_path, dir_name))
+    folders.sort(key=lambda folder: folder.fs_path)
+    for folder in folders:
+        acquire_dir(folder, folder.fs_path, False)
+    return folders
+
+
+def scandir_scan(root):
+    folders = ie_fs.scan_dir_set(root, ie_fs.is_std_dirname, ie_fs.proc_std_dirname)
+    for folder in folders:
+        ie_fs.scan_std_dir_files(folder)
+    return folders
+
+
+def bench(name, scan, root):
+    counts.dir_reads = counts.stats = 0
+    t0 = time.perf_counter()
+    folders = scan(root)
+    secs = time.perf_counter() - t0
+    num_insts = sum(len(f.image_insts) for f in folders)
+    print('%-8s %6u folders %8u files  %6u dir reads %8u stats  %7.3f s' % (
+        name, len(folders), num_insts, counts.dir_reads, counts.stats, secs))
+
+
+if __name__ == '__main__':
+    num_folders = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    files_per_folder = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    with tempfile.TemporaryDirectory() as root:
+        make_tree(root, num_folders, files_per_folder)
+        instrument()
+        bench('listdir', listdir_scan, root)
+        bench('scandir', scandir_scan, root)
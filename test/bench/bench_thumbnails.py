@@ -0,0 +1,97 @@
+''' benchmark ie_fs.make_thumbnail against a full-resolution decode
+
+    full decode     Image.load() before thumbnail(): no DCT scaling at all
+    current path    make_thumbnail(fast=False): thumbnail() as before,
+                    which lets PIL draft at twice the thumbnail size (PIL >= 7)
+    fast path       make_thumbnail(): EXIF preview, or draft at thumbnail size
+
+    usage: python bench_thumbnails.py [num_images [width height]]
+    the corpus is generated, and each path is run, in a fresh process,
+    so each path's peak RSS is its own
+'''
+
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+
+import io
+from PIL import Image
+
+from ie_fs import make_thumbnail
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return kb / (1024 * 1024) if sys.platform == 'darwin' else kb / 1024
+    except ImportError:  # Windows
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def make_corpus(dir_path, num_images, size):
+    paths = []
+    gradient = Image.linear_gradient('L').resize(size)
+    noise = Image.effect_noise(size, 64)
+    pimage = Image.merge('RGB', (gradient, noise, gradient.transpose(Image.FLIP_LEFT_RIGHT)))
+    for x in range(num_images):
+        path = os.path.join(dir_path, 'img_%04u.jpg' % x)
+        pimage.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def in_process(target, *args):
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    p = ctx.Process(target=target, args=args + (results,))
+    p.start()
+    result = results.get()
+    p.join()
+    return result
+
+
+def run_make_corpus(dir_path, num_images, size, results):
+    results.put(make_corpus(dir_path, num_images, size))
+
+
+def full_decode_thumbnail(path):
+    pimage = Image.open(path)
+    pimage.load()
+    pimage.thumbnail((200, 200))
+    byte_array = io.BytesIO()
+    pimage.save(byte_array, format='JPEG')
+    return byte_array.getvalue()
+
+
+modes = {
+    'full decode': full_decode_thumbnail,
+    'current path': lambda path: make_thumbnail(path, fast=False),
+    'fast path': make_thumbnail
+}
+
+
+def run(paths, mode, results):
+    fn = modes[mode]
+    t0 = time.perf_counter()
+    for path in paths:
+        assert fn(path) is not None
+    secs = time.perf_counter() - t0
+    results.put((secs, peak_rss_mb()))
+
+
+if __name__ == '__main__':
+    num_images = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    size = (int(sys.argv[2]), int(sys.argv[3])) if len(sys.argv) > 3 else (6000, 4000)
+    with tempfile.TemporaryDirectory() as dir_path:
+        paths = in_process(run_make_corpus, dir_path, num_images, size)
+        print('%u %ux%u JPEGs' % (num_images, size[0], size[1]))
+        for mode in modes:
+            secs, rss = in_process(run, paths, mode)
+            print('%-14s %8.1f images/s  peak RSS %7.1f MB' % (
+                mode, num_images / secs, rss))
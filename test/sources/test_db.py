@@ -648,3 +648,277 @@ def test_tag_change():
     c = TagChange.first(session)
     assert c is None
 
+
+
+def test_fs_folder_find_names():
+    source = FsSource_Tester().add()
+    names = [_mk_name('folder') for i in range(7)]
+    fs_folders = [FsFolder.add(session, source, name) for name in names[:5]]
+    session.commit()
+    chunk = FsFolder.find_names_chunk
+    FsFolder.find_names_chunk = 2   # exercise the chunking
+    try:
+        found = FsFolder.find_names(session, source, names)
+    finally:
+        FsFolder.find_names_chunk = chunk
+    assert found == dict(zip(names[:5], fs_folders))
+    assert FsFolder.find_names(session, source, []) == {}
+
+
+def test_image_bulk_add():
+    fs_folder = FsFolder_Tester().add()
+    db_folder = fs_folder.db_folder
+    names = [_mk_name('image') for i in range(3)]
+    data = ImageData.bulk_add(session, len(names))
+    db_images = DbImage.bulk_add(
+        session, db_folder, names, [d.id for d in data])
+    fs_images = FsImage.bulk_add(session, fs_folder, names, db_images=db_images)
+    session.commit()
+    assert [i.name for i in db_images] == names
+    assert [i.data for i in db_images] == data
+    assert DbImage.find_all(session, db_folder) == dict(zip(names, db_images))
+    assert [i.db_image for i in fs_images] == db_images
+    assert set(fs_folder.images) == set(fs_images)
+    assert FsImage.bulk_add(session, fs_folder, []) == []
+
+
+def test_sqlite_pragmas(tmp_path):
+    # (not via open_file_db, which would replace this module's db globals)
+    from db import _set_sqlite_pragmas
+    engine = create_engine('sqlite:///' + str(tmp_path / 'pragmas.db'))
+    _set_sqlite_pragmas(engine, sqlite_perf_pragmas)
+    with engine.connect() as connection:
+        def pragma(name):
+            return connection.exec_driver_sql('PRAGMA ' + name).scalar()
+        assert pragma('journal_mode') == 'wal'
+        assert pragma('synchronous') == 1   # NORMAL
+        assert pragma('temp_store') == 2    # MEMORY
+        assert pragma('cache_size') == sqlite_perf_pragmas['cache_size']
+    engine.dispose()
+
+
+def test_image_thumbnail():
+    image_data = ImageData()
+    session.add(image_data)
+    assert image_data.thumbnail is None
+    image_data.thumbnail = b'jpeg1'
+    session.commit()
+    assert session.query(ImageThumbnail).filter_by(
+        id=image_data.id).one().jpeg == b'jpeg1'
+    image_data.thumbnail = b'jpeg2'
+    session.commit()
+    session.expire(image_data)
+    assert image_data.thumbnail == b'jpeg2'
+    image_data.thumbnail = None
+    session.commit()
+    assert session.query(ImageThumbnail).filter_by(id=image_data.id).first() is None
+
+
+def test_migrate_thumbnails(tmp_path):
+    from db import _migrate_thumbnails
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.db'))
+    with engine.begin() as connection:
+        # an image_data table from before ImageThumbnail
+        connection.exec_driver_sql(
+            'CREATE TABLE image_data (id INTEGER PRIMARY KEY, '
+            'thumbnail_timestamp DATETIME, thumbnail BLOB)')
+        connection.exec_driver_sql(
+            "INSERT INTO image_data (id, thumbnail) VALUES (1, x'ffd8'), (2, NULL)")
+    ImageThumbnail.__table__.create(engine)
+    _migrate_thumbnails(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql(
+            'SELECT id, jpeg FROM image_thumbnail').all() == [(1, b'\xff\xd8')]
+    _migrate_thumbnails(engine)     # a no-op once migrated
+    engine.dispose()
+
+
+def test_migrate_thumbnails_no_drop_column(tmp_path):
+    # an SQLite that can't DROP COLUMN keeps the column, emptied
+    from db import _migrate_thumbnails
+    from sqlalchemy import event
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.db'))
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            'CREATE TABLE image_data (id INTEGER PRIMARY KEY, '
+            'thumbnail_timestamp DATETIME, thumbnail BLOB)')
+        connection.exec_driver_sql(
+            "INSERT INTO image_data (id, thumbnail) VALUES (1, x'ffd8'), (2, NULL)")
+    ImageThumbnail.__table__.create(engine)
+    statements = []
+    def before_execute(conn, cursor, statement, *args):
+        if 'DROP COLUMN' in statement:
+            raise ValueError('no DROP COLUMN')
+        statements.append(statement)
+    event.listen(engine, 'before_cursor_execute', before_execute)
+    _migrate_thumbnails(engine)
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql(
+            'SELECT id, jpeg FROM image_thumbnail').all() == [(1, b'\xff\xd8')]
+        assert connection.exec_driver_sql(
+            'SELECT id FROM image_data WHERE thumbnail IS NOT NULL').all() == []
+
+    # later opens don't rewrite image_data
+    del statements[:]
+    _migrate_thumbnails(engine)
+    assert not any(
+        s.startswith('INSERT') or s.startswith('UPDATE') for s in statements)
+    event.remove(engine, 'before_cursor_execute', before_execute)
+    engine.dispose()
+
+
+def test_query_plans(tmp_path):
+    assert check_query_plans(session) == []
+
+    # a database created before the indexes were declared gets them
+    from db import _create_missing_indexes
+    from sqlalchemy.orm import Session
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.db'))
+    Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql('DROP INDEX item_name_index')
+    with Session(engine) as old_session:
+        assert 'DbCollection.find' in [
+            name for name, detail in check_query_plans(old_session)]
+    _create_missing_indexes(engine)
+    with Session(engine) as old_session:
+        assert check_query_plans(old_session) == []
+    engine.dispose()
+
+
+def test_db_tag_index():
+    from sqlalchemy import event
+    band = DbTag.get_expr(session, _mk_name('band') + '|Green Day')
+    band_name = band.parent.name
+    session.commit()
+
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(session.get_bind(), 'before_cursor_execute', count)
+    try:
+        DbTagIndex.get(session)   # loaded with one query
+        parent = band.parent        # (refreshed after the commit)
+        statements.clear()
+        assert DbTag.find_expr(session, band_name + '|green day') is band
+        assert DbTag.find(session, 'GREEN DAY', parent) is band
+        assert DbTag.find_expr(session, band_name + '|Blue Day') is None
+        assert statements == []
+    finally:
+        event.remove(session.get_bind(), 'before_cursor_execute', count)
+
+    # kept up to date by the tags.on_db_tag_* hooks
+    new_name = _mk_name('Green Day')
+    band.set_name(session, new_name)
+    assert DbTag.find_expr(session, band_name + '|green day') is None
+    assert DbTag.find_expr(session, band_name + '|' + new_name) is band
+    other = DbTag.add(session, 'Green Day', band.parent)
+    assert DbTag.find_expr(session, band_name + '|green day') is other
+    session.commit()
+    session.delete(other)
+    assert DbTag.find(session, 'Green Day', band.parent) is None
+    session.commit()
+
+
+def test_fs_tag_mapping_cache():
+    tag_source = FsTagSource.add(session, _mk_name('tag source'))
+    db_tag = DbTag.add(session, _mk_name('tag'))
+    FsTagMapping.add(session, tag_source, 'Band|Tribe 8', FsTagBinding.BOUND, db_tag)
+    session.commit()
+    mapping = FsTagMapping.find(session, tag_source, 'band|tribe 8')
+    assert mapping is not None and mapping.db_tag is db_tag
+    assert FsTagMapping.find(session, tag_source, 'band|tribe 9') is None
+    # kept up to date by add() and set()
+    FsTagMapping.set(
+        session, tag_source, 'band|tribe 9', FsTagBinding.SUGGESTED, db_tag)
+    assert FsTagMapping.find(session, tag_source, 'BAND|TRIBE 9') is not None
+    FsTagMapping.set(
+        session, tag_source, 'band|tribe 8', FsTagBinding.UNBOUND, None)
+    assert FsTagMapping.find(session, tag_source, 'band|tribe 8') is None
+    session.commit()
+    assert [m.text for m in tag_source.mappings(session)] == ['band|tribe 9']
+
+
+def test_fs_item_tag_words():
+    green, day = _mk_name('Green'), _mk_name('Day')
+    assert FsItemTag.text_words('band|%s  %s %s' % (green, day, green)) == sorted(
+        [green.lower(), day.lower()])
+    folder = FsFolder_Tester().add()
+    image = FsImage.add(session, folder, _mk_name('image'))
+    tag = FsItemTag.insert(
+        session, folder, 0, FsTagType.TAG, 'band|%s %s' % (green, day), 'band')
+    FsItemTag.insert(session, image, 0, FsTagType.WORD, green, None)
+    FsItemTag.insert(session, image, 1, FsTagType.WORD, day.upper(), None)
+    session.commit()
+    assert FsItemTag.find_item_ids(session, '%s %s' % (green, day)) == {
+        folder.id, image.id}
+    assert FsItemTag.find_item_ids(session, 'x|' + day) == {folder.id, image.id}
+    assert FsItemTag.find_item_ids(session, '%s %s' % (green, 'x')) == set()
+    assert FsItemTag.find_item_ids(session, '') == set()
+    # kept up to date by delete()
+    image.item_tags[1].delete(session)
+    session.commit()
+    assert FsItemTag.find_item_ids(session, day) == {folder.id}
+
+
+def test_migrate_fs_item_tag_words(tmp_path):
+    from db import _migrate_fs_item_tag_words
+    engine = create_engine('sqlite:///' + str(tmp_path / 'old.db'))
+    # an fs_item_tag table from before FsItemTagWord
+    FsItemTag.__table__.create(engine)
+    FsItemTagWord.__table__.create(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "INSERT INTO fs_item_tag (id, item_id, text) VALUES "
+            "(1, 1, 'band|Green Day'), (2, 2, 'day'), (3, NULL, 'orphan')")
+    _migrate_fs_item_tag_words(engine)
+    _migrate_fs_item_tag_words(engine)  # a no-op once migrated
+    with engine.connect() as connection:
+        assert connection.exec_driver_sql(
+            'SELECT word, item_tag_id FROM fs_item_tag_word '
+            'ORDER BY item_tag_id, word').all() == [
+                ('day', 1), ('green', 1), ('day', 2)]
+    engine.dispose()
+
+
+def test_fs_item_tag_rewrite():
+    from sqlalchemy import event
+    folder = FsFolder_Tester().add()
+    d_text = _mk_name('d')
+    a, b, c, d = [
+        FsItemTag.insert(session, folder, idx, FsTagType.WORD, text, None)
+        for idx, text in enumerate(['a', 'b', 'c', d_text])]
+    FsItemTag.add_grouping(folder, range(1, 3))
+    b.user_grouping = c.user_grouping = True
+    session.commit()
+
+    # insert x, delete d: the user grouping moves with b and c
+    FsItemTag.rewrite(
+        session, folder, [(FsTagType.TAG, 'x', None), a, b, c])
+    session.commit()
+    x = folder.item_tags[0]
+    assert folder.item_tags == [x, a, b, c]
+    assert [t.idx for t in folder.item_tags] == [0, 1, 2, 3]
+    assert [(t.first_idx, t.last_idx) for t in folder.item_tags] == [
+        (0, 0), (1, 1), (2, 3), (2, 3)]
+    assert x.text == 'x' and x.binding == FsTagBinding.UNBOUND
+    assert FsItemTag.find_item_ids(session, d_text) == set()
+
+    # an unchanged list emits no SQL
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(session.get_bind(), 'before_cursor_execute', count)
+    try:
+        FsItemTag.rewrite(session, folder, list(folder.item_tags))
+        session.flush()
+        assert statements == []
+    finally:
+        event.remove(session.get_bind(), 'before_cursor_execute', count)
+
+    # an insertion inside the user grouping removes it
+    FsItemTag.rewrite(
+        session, folder, [x, a, b, (FsTagType.WORD, 'y', None), c])
+    session.commit()
+    assert [(t.first_idx, t.last_idx) for t in folder.item_tags] == [
+        (i, i) for i in range(5)]
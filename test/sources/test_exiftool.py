@@ -0,0 +1,45 @@
+''' test the persistent exiftool process '''
+
+import os
+import shutil
+import pytest
+
+from exiftool import ExifTool
+
+needs_exiftool = pytest.mark.skipif(
+    shutil.which('exiftool') is None, reason='exiftool is not installed')
+
+@needs_exiftool
+def test_execute_json():
+    et = ExifTool(common_args=['-S', '-j', '-q'])
+    try:
+        got = et.execute_json([__file__, '-FileName'])
+        assert len(got) == 1
+        assert got[0]['FileName'] == os.path.basename(__file__)
+        # the same process answers the next command
+        pid = et.process.pid
+        assert et.execute_json([__file__, '-FileName']) == got
+        assert et.process.pid == pid
+    finally:
+        et.close()
+    assert not et.running()
+
+@needs_exiftool
+def test_restart():
+    et = ExifTool(common_args=['-S', '-j', '-q'])
+    try:
+        got = et.execute_json([__file__, '-FileName'])
+        et.process.kill()
+        et.process.wait()
+        assert et.execute_json([__file__, '-FileName']) == got
+    finally:
+        et.close()
+
+@needs_exiftool
+def test_no_files():
+    et = ExifTool(common_args=['-S', '-j', '-q'])
+    try:
+        assert et.execute_json(
+            [os.path.join(os.path.dirname(__file__), '*.nonesuch')]) == []
+    finally:
+        et.close()
@@ -15,7 +15,7 @@ def test_results():
         if not(restored == f):
             assert restored == f
 
-    def check(t, exp_sql=None, exp_joins=None):
+    def check(t, exp_sql=None, exp_joins=None, exp_params=None):
         what = '%s(%r)' % (td.db_tbl_cls.__name__, t)
         try:
             f = Filter(t)
@@ -34,6 +34,8 @@ def test_results():
             for got_join, exp_join in zip(js.sql_strs, exp_joins):
                 if got_join != got_join:
                     assert got_join == exp_join
+        if exp_params is not None:
+            assert f.sql_params() == exp_params
         check_pickling(f)
         pass
 
@@ -41,25 +43,25 @@ def test_results():
 
     td = TblDesc.lookup_tbl_desc('DbFolder')
     t_lt_id = ('<', td.lookup_col_desc('id'), 123)
-    check(t_lt_id, 'WHERE db_folder.id < 123', [])
+    check(t_lt_id, 'WHERE db_folder.id < ?', [], [123])
     t_lt_name = ('==', td.lookup_col_desc('name'), 'diana')
-    check(t_lt_name, 'WHERE item_0.name == "diana"',
-        ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
+    check(t_lt_name, 'WHERE item_0.name == ?',
+        ['JOIN item AS item_0 ON db_folder.id == item_0.id'], ['diana'])
     t_lt_and = ('&', t_lt_id, t_lt_name)
-    check(t_lt_and, 'WHERE db_folder.id < 123 AND item_0.name == "diana"',
-        ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
+    check(t_lt_and, 'WHERE db_folder.id < ? AND item_0.name == ?',
+        ['JOIN item AS item_0 ON db_folder.id == item_0.id'], [123, 'diana'])
     t_lt_minus = ('-', t_lt_id, t_lt_name)
-    check(t_lt_minus, 'WHERE db_folder.id < 123 AND  NOT item_0.name == "diana"',
-        ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
+    check(t_lt_minus, 'WHERE db_folder.id < ? AND  NOT item_0.name == ?',
+        ['JOIN item AS item_0 ON db_folder.id == item_0.id'], [123, 'diana'])
     t_lt_or = ('|', t_lt_id, t_lt_name)
-    check(t_lt_or, 'WHERE db_folder.id < 123 OR item_0.name == "diana"',
-        ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
+    check(t_lt_or, 'WHERE db_folder.id < ? OR item_0.name == ?',
+        ['JOIN item AS item_0 ON db_folder.id == item_0.id'], [123, 'diana'])
     t_lt_orand = ('|', t_lt_or, t_lt_and)
     check(t_lt_orand,
-        'WHERE db_folder.id < 123 OR item_0.name == "diana" OR db_folder.id < 123 AND item_0.name == "diana"',
-        ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
+        'WHERE db_folder.id < ? OR item_0.name == ? OR db_folder.id < ? AND item_0.name == ?',
+        ['JOIN item AS item_0 ON db_folder.id == item_0.id'], [123, 'diana', 123, 'diana'])
     t_lt_andor = ('&', t_lt_and, t_lt_or)
     check(t_lt_andor,
-        'WHERE db_folder.id < 123 AND item_0.name == "diana" AND (db_folder.id < 123 OR item_0.name == "diana")',
-        ['JOIN item AS item_0 ON db_folder.id == item_0.id'])
+        'WHERE db_folder.id < ? AND item_0.name == ? AND (db_folder.id < ? OR item_0.name == ?)',
+        ['JOIN item AS item_0 ON db_folder.id == item_0.id'], [123, 'diana', 123, 'diana'])
 
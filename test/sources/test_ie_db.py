@@ -3,6 +3,8 @@
 from sqlalchemy.ext.declarative import declarative_base
 Base = declarative_base()
 
+import os
+
 import check_tags
 from db import *
 
@@ -384,6 +386,174 @@ def test_web_cmd():
     ctx = check_tags.Ctx(session, local_tag_source)
     do_web_cmd(session, ctx)
 
+def test_thumb_pack_deletes(tmp_path):
+    from ie_db import _update_thumbnail
+    session = open_file_db(str(tmp_path / 'test.db'), 'w')
+    try:
+        thumb_pack = get_thumb_pack(session)
+        assert thumb_pack.path == str(tmp_path / 'test.db.thumbs')
+        data = ImageData.bulk_add(session, 2)
+        for image_data in data:
+            _update_thumbnail(
+                image_data, b'jpeg %u' % image_data.id, datetime.datetime.now(),
+                session, thumb_pack)
+        session.commit()
+        ids = [image_data.id for image_data in data]
+        assert bytes(get_image_data_thumbnail(data[0], thumb_pack)) == b'jpeg %u' % ids[0]
+        assert data[0].thumbnail is None    # not in the database
+
+        # a deleted ImageData's thumbnail is removed when the delete is committed
+        session.delete(data[0])
+        session.flush()
+        session.rollback()
+        assert ids[0] in thumb_pack
+        session.delete(session.get(ImageData, ids[0]))
+        session.commit()
+        assert ids[0] not in thumb_pack and ids[1] in thumb_pack
+        assert thumb_pack.garbage_size() == len(b'jpeg %u' % ids[0])
+
+        # ... even if nothing has opened the ThumbPack yet
+        close_thumb_pack()
+        session.delete(session.get(ImageData, ids[1]))
+        session.commit()
+        assert ids[1] not in get_thumb_pack(session)
+    finally:
+        close_db()
+
+def test_thumb_pack_per_db(tmp_path):
+    # a memory database has no ThumbPack
+    assert get_thumb_pack(open_mem_db()) is None
+
+    # each database file has its own, which is removed with the database
+    session = open_file_db(str(tmp_path / 'a.db'), 'w')
+    get_thumb_pack(session).put(1, b'jpeg a')
+    session.close()
+    session = open_file_db(str(tmp_path / 'b.db'), 'w')
+    assert 1 not in get_thumb_pack(session)
+    session.close()
+    session = open_file_db(str(tmp_path / 'a.db'), 'r')
+    assert bytes(get_thumb_pack(session).get(1)) == b'jpeg a'
+    session.close()
+    session = open_file_db(str(tmp_path / 'a.db'), 'w')
+    assert get_thumb_pack(session, create=False) is None
+    session.close()
+    close_db()
+
+def make_dir_tree(root):
+    from PIL import Image
+    for folder_name, num_images in (
+        ('170101 alpha', 3), ('170102 beta', 2), ('170103 gamma', 4)
+    ):
+        os.mkdir(os.path.join(root, folder_name))
+        for x in range(num_images):
+            Image.new('RGB', (64, 48), (x * 40, 0, 0)).save(
+                os.path.join(root, folder_name, '%04u.jpg' % x))
+
+def run_dir_import(session, root, depth, on_done=None):
+    """ import DIR root, returning the task and its 'folder done' folders """
+    fs_source = FsSource.find(session, 'C:', root)
+    if fs_source is None:
+        fs_source = FsSource.add(
+            session, 'C:', root, FsSourceType.DIR, readonly=True,
+            tag_source=FsTagSource.add(session, 'mine'))
+    cfg = IECfg()
+    cfg.import_thumbnails = True
+    cfg.import_pipeline_depth = depth
+    cfg.thumbnail_workers = 1
+    cfg.scan_threads = 0
+    slicer = MockSlicer(suspended=True)
+    done = []
+    def folder_done(data):
+        done.append(data)
+        if on_done is not None:
+            on_done(task)
+    slicer.sub([(folder_done, 'ie.sts.folder done')])
+    task = IETask2(
+        slicer=slicer, session=session, ie_cfg=cfg, fs_source=fs_source,
+        import_mode=ImportMode.SET, paths=[root])
+    task.start()
+    slicer.resume()
+    return task, done
+
+def dir_import_contents(session):
+    return sorted(
+        (fs_folder.name, fs_folder.last_scan is not None, sorted(
+            (fs_image.name, fs_image.data.thumbnail is not None)
+            for fs_image in fs_folder.images))
+        for fs_folder in session.query(FsFolder))
+
+def test_pipelined_import(tmp_path):
+    make_dir_tree(str(tmp_path))
+    results = []
+    for depth in (0, 2):
+        session = open_mem_db()
+        task, done = run_dir_import(session, str(tmp_path), depth)
+        assert task.state == TaskState.DONE
+        results.append((done, dir_import_contents(session)))
+    assert results[0][0] == ['alpha', 'beta', 'gamma']
+    assert results[1] == results[0]
+    assert all(last_scan for name, last_scan, images in results[0][1])
+    assert sum(len(images) for name, last_scan, images in results[0][1]) == 9
+
+def test_pipelined_import_worker_args(tmp_path, monkeypatch):
+    # the extractor thread gets plain values, not (expirable) ORM objects
+    import ie_db
+    make_dir_tree(str(tmp_path))
+    session = open_mem_db()
+    source_types = []
+    bg_proc = ie_db.bg_proc_ie_work_item
+    def checking_bg_proc(work_item, source_type, *args):
+        source_types.append(source_type)
+        bg_proc(work_item, source_type, *args)
+    monkeypatch.setattr(ie_db, 'bg_proc_ie_work_item', checking_bg_proc)
+    task, done = run_dir_import(session, str(tmp_path), 2)
+    assert done == ['alpha', 'beta', 'gamma']
+    assert source_types == [FsSourceType.DIR] * 3
+
+def test_pipelined_import_cancel(tmp_path, monkeypatch):
+    import ie_db
+    make_dir_tree(str(tmp_path))
+    session = open_mem_db()
+    task, done = run_dir_import(
+        session, str(tmp_path), 2, on_done=lambda task: task.cancel())
+    assert done == ['alpha']
+
+    # alpha's commit included beta's started (but unfinished) state
+    session.rollback()
+    started = {
+        name: last_scan for name, last_scan, images in dir_import_contents(session)}
+    assert started == {'170101 alpha': True, '170102 beta': False}
+
+    # re-importing finishes beta, including its EXIFs
+    num_exifs = {}
+    fg_start = ie_db.fg_start_ie_work_item
+    def counting_fg_start(session, ie_cfg, work_item, *args):
+        fg_start(session, ie_cfg, work_item, *args)
+        num_exifs[work_item.ie_folder.db_name] = len(work_item.get_exif)
+    monkeypatch.setattr(ie_db, 'fg_start_ie_work_item', counting_fg_start)
+    task, done = run_dir_import(session, str(tmp_path), 2)
+    assert done == ['alpha', 'beta', 'gamma']
+    assert num_exifs == {'alpha': 0, 'beta': 2, 'gamma': 4}
+    assert all(last_scan for name, last_scan, images in dir_import_contents(session))
+
+def test_pipelined_import_start_fails(tmp_path, monkeypatch, caplog):
+    import ie_db
+    make_dir_tree(str(tmp_path))
+    session = open_mem_db()
+    fg_start = ie_db.fg_start_ie_work_item
+    def failing_fg_start(session, ie_cfg, work_item, *args):
+        if work_item.ie_folder.db_name == 'beta':
+            raise ValueError('no beta')
+        fg_start(session, ie_cfg, work_item, *args)
+    monkeypatch.setattr(ie_db, 'fg_start_ie_work_item', failing_fg_start)
+    task, done = run_dir_import(session, str(tmp_path), 2)
+    assert task.state == TaskState.DONE
+    assert done == ['alpha', 'beta', 'gamma']
+    assert 'no beta' in caplog.text
+    assert [
+        (name, last_scan) for name, last_scan, images in dir_import_contents(session)
+    ] == [('170101 alpha', True), ('170103 gamma', True)]
+
 def make_db():
     session = open_file_db(dev_base_ie_source_path + '\\test.db', 'w')
     my_tag_source = db.FsTagSource.add(session, 'mine')
@@ -213,3 +213,120 @@ def test_scan_file_sel_corbett_tiffs():
         proc_corbett_filename,
         test_scan_file_sel_corbett_tiffs_expected_list)
 
+
+def _make_jpeg_folder(dir_path, num_images):
+    """ Return an IEFolder of <num_images> generated JPEGs in <dir_path>. """
+    ie_folder = IEFolder(str(dir_path), None, 'generated', None)
+    for x in range(num_images):
+        file_name = 'img_%04u.jpg' % x
+        file_path = os.path.join(str(dir_path), file_name)
+        Image.new('RGB', (640, 480), (x * 20 % 256, 128, 64)).save(file_path)
+        mtime = datetime.datetime.fromtimestamp(os.path.getmtime(file_path))
+        add_ie_folder_image_inst(ie_folder, file_path, file_name, False, mtime)
+    return ie_folder
+
+def test_get_ie_image_thumbnails_pool(tmp_path):
+    ie_folder = _make_jpeg_folder(tmp_path, 8)
+    pubs = []
+    def pub(topic, data):
+        pubs.append((topic, data))
+    for num_workers in (1, 3):
+        ie_images = set(ie_folder.images.values())
+        thumbnails = get_ie_image_thumbnails(ie_images, pub, num_workers)
+        assert set(thumbnails.keys()) == set(ie_folder.images.values())
+        for ie_image, thumbnail in thumbnails.items():
+            assert ie_image.thumbnail is thumbnail
+            pimage = Image.open(io.BytesIO(thumbnail))
+            assert pimage.format == 'JPEG'
+            assert max(pimage.size) == 200
+    assert pubs.count(('ie.sts imported thumbnails', 1)) == 2 * 8
+
+def _exif_with_preview(preview_jpeg):
+    """ Return EXIF bytes with an empty IFD0 and an IFD1 holding <preview_jpeg>. """
+    import struct
+    ifd0 = struct.pack('<HI', 0, 8 + 6)  # no entries, IFD1 follows
+    ifd1_len = 2 + 2 * 12 + 4
+    preview_offset = 8 + len(ifd0) + ifd1_len
+    ifd1 = struct.pack('<H', 2)
+    ifd1 += struct.pack('<HHII', 0x0201, 4, 1, preview_offset)
+    ifd1 += struct.pack('<HHII', 0x0202, 4, 1, len(preview_jpeg))
+    ifd1 += struct.pack('<I', 0)
+    return b'Exif\x00\x00' + b'II*\x00' + struct.pack('<I', 8) + ifd0 + ifd1 + preview_jpeg
+
+def test_make_thumbnail(tmp_path):
+    # a JPEG with no EXIF preview: DCT-scaled decode
+    big_path = os.path.join(str(tmp_path), 'big.jpg')
+    Image.new('RGB', (3000, 2000), (200, 10, 10)).save(big_path)
+    fast = Image.open(io.BytesIO(make_thumbnail(big_path)))
+    full = Image.open(io.BytesIO(make_thumbnail(big_path, fast=False)))
+    assert fast.size == full.size == (200, 133)
+
+    # a JPEG with a usable EXIF preview: the preview is used
+    preview = io.BytesIO()
+    Image.new('RGB', (300, 200), (10, 200, 10)).save(preview, format='JPEG')
+    exif_path = os.path.join(str(tmp_path), 'exif.jpg')
+    Image.new('RGB', (3000, 2000), (200, 10, 10)).save(
+        exif_path, exif=_exif_with_preview(preview.getvalue()))
+    thumb = Image.open(io.BytesIO(make_thumbnail(exif_path))).convert('RGB')
+    assert thumb.size == (200, 133)
+    assert thumb.getpixel((100, 66))[1] > 150  # green, from the preview
+
+    # an unreadable file
+    bad_path = os.path.join(str(tmp_path), 'bad.jpg')
+    open(bad_path, 'wb').write(b'not a jpeg')
+    assert make_thumbnail(bad_path) is None
+
+def test_scan_dir_set_generated(tmp_path):
+    for dir_name, file_names in (
+        ('171007 virginia', ['DSC_8963.NEF', 'DSC_8963.JPG', 'DSC_8965.NEF']),
+        ('ayers', ['dks.psd', 'dks.jpg'])
+    ):
+        os.mkdir(os.path.join(str(tmp_path), dir_name))
+        for file_name in file_names:
+            touch_file(os.path.join(str(tmp_path), dir_name, file_name))
+    touch_file(os.path.join(str(tmp_path), 'stray file.txt'))
+    got_list = scan_dir_set(str(tmp_path), is_std_dirname, proc_std_dirname)
+    assert [f.db_name for f in got_list] == ['virginia', 'ayers']
+    assert got_list[0].db_date == datetime.date(2017, 10, 7)
+    assert got_list[0].mod_datetime == datetime.datetime.fromtimestamp(
+        os.path.getmtime(got_list[0].fs_path))
+    for folder in got_list:
+        scan_std_dir_files(folder)
+    _check_dir_results(got_list, [
+        ('171007 virginia', ['8963-nj', '8965-n']),
+        ('ayers', ['dks-pj'])
+    ])
+
+def test_scan_file_set_generated(tmp_path):
+    for file_name in (
+        'BLATZ_15_ASBESTOS_11_03_90-2744.psd',
+        'BLATZ_15_ASBESTOS_11_03_90-2745.psd'
+    ):
+        touch_file(os.path.join(str(tmp_path), file_name))
+    os.mkdir(os.path.join(str(tmp_path), 'subdir-1'))
+    got_list = scan_file_set(str(tmp_path), lambda x: True, proc_corbett_filename)
+    assert len(got_list) == 1
+    assert got_list[0].db_name == 'blatz 15 asbestos'
+    assert got_list[0].db_date == datetime.date(1990, 11, 3)
+    _check_image_results(got_list[0], (None, ['2744-p', '2745-p']))
+
+def test_dir_pre_scanner(tmp_path):
+    for f in range(6):
+        dir_path = os.path.join(str(tmp_path), '1710%02u folder%u' % (f + 1, f))
+        os.mkdir(dir_path)
+        for x in range(f + 1):
+            touch_file(os.path.join(dir_path, 'dsc_%04u.nef' % x))
+    ie_folders = scan_dir_set(str(tmp_path), is_std_dirname, proc_std_dirname)
+    pre_scanner = DirPreScanner(ie_folders, num_threads=2, lookahead=3)
+    try:
+        assert len(pre_scanner.futures) == 3
+        # a folder can be waited for out of order, before it's submitted
+        pre_scanner.wait(ie_folders[5])
+        assert len(ie_folders[5].images) == 6
+        for x, ie_folder in enumerate(ie_folders[:5]):
+            pre_scanner.wait(ie_folder)
+            assert len(ie_folder.images) == x + 1
+        assert len(pre_scanner.pending) == 0
+        assert len(pre_scanner.futures) == 0
+    finally:
+        pre_scanner.shutdown()
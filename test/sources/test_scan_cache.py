@@ -0,0 +1,79 @@
+''' test the persistent directory-listing cache '''
+
+import os
+import pytest
+
+import ie_fs
+from ie_fs import IEFolder, scan_std_dir_files
+from scan_cache import ScanCache
+
+def _make_tree(root):
+    for name in ('0001.nef', '0001.jpg', '0002.nef'):
+        open(os.path.join(root, name), 'w').close()
+    os.mkdir(os.path.join(root, 'hi'))
+    open(os.path.join(root, 'hi', '0001.jpg'), 'w').close()
+
+def _scan(root, scan_cache):
+    ie_folder = IEFolder(root, None, 'folder', None)
+    scan_std_dir_files(ie_folder, scan_cache)
+    return {
+        name: sorted(
+            (ext, inst.mod_datetime)
+            for ext, insts in ie_image.insts.items() for inst in insts)
+        for name, ie_image in ie_folder.images.items()}
+
+def test_scan_cache(tmp_path, monkeypatch):
+    root = str(tmp_path / 'folder')
+    os.mkdir(root)
+    _make_tree(root)
+    cache_path = str(tmp_path / 'scan-cache')
+
+    uncached = _scan(root, None)
+    assert sorted(uncached.keys()) == ['0001', '0002']
+    assert [x[0] for x in uncached['0001']] == ['.jpg', '.jpg-hi', '.nef']
+
+    scan_cache = ScanCache(cache_path)
+    assert _scan(root, scan_cache) == uncached
+    scan_cache.save()
+    assert os.path.exists(cache_path)
+
+    # unchanged directories are rebuilt from the reloaded cache, without stats
+    def no_stat(path):
+        raise AssertionError('per-file stat of %s' % path)
+    monkeypatch.setattr(ie_fs.os.path, 'getmtime', no_stat)
+    monkeypatch.setattr(ie_fs.os.path, 'isfile', no_stat)
+    monkeypatch.setattr(ie_fs.os.path, 'isdir', no_stat)
+    scan_cache = ScanCache(cache_path)
+    assert len(scan_cache.dirs) == 2
+    assert _scan(root, scan_cache) == uncached
+    assert not scan_cache.dirty
+    monkeypatch.undo()
+
+    # a changed directory is re-listed
+    open(os.path.join(root, '0003.nef'), 'w').close()
+    os.utime(root, ns=(0, 12345))
+    rescanned = _scan(root, scan_cache)
+    assert sorted(rescanned.keys()) == ['0001', '0002', '0003']
+    assert scan_cache.dirty
+
+def test_scan_cache_damaged(tmp_path):
+    cache_path = str(tmp_path / 'scan-cache')
+    open(cache_path, 'w').write('{not json')
+    scan_cache = ScanCache(cache_path)
+    assert scan_cache.dirs == {}
+
+def test_scan_cache_threads(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    cache_path = str(tmp_path / 'scan-cache')
+    scan_cache = ScanCache(cache_path)
+    def store_dirs(t):
+        for x in range(500):
+            scan_cache.store('/t%u/%u' % (t, x), [x, 0, 0], [('a.jpg', False, 1.0)])
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(store_dirs, t) for t in range(4)]
+        while not all(f.done() for f in futures):
+            scan_cache.save()  # while the threads add entries
+        for f in futures:
+            f.result()
+    scan_cache.save()
+    assert len(ScanCache(cache_path).dirs) == 2000
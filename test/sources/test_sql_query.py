@@ -3,6 +3,7 @@
 import pytest
 
 import jsonpickle
+from row_desc import RowDesc
 from sql_query import SqlQuery
 from sql_util import JoinState
 
@@ -31,3 +32,49 @@ def test_queries():
         + 'db_folder.date_day AS date_day, item_0.name AS name, db_folder.id AS id '
         + 'FROM db_folder JOIN item AS item_0 ON db_folder.id == item_0.id '
         + 'ORDER BY date_year DESC, date_month DESC, date_day DESC, name')
+
+def test_query_cache():
+    from filter import Filter
+    from imdate import IMDate
+    td = TblDesc.lookup_tbl_desc('DbFolder')
+    select = RowDesc([td.lookup_col_desc(name) for name in ['date', 'name', 'id']])
+    def date_filter(im_date):
+        return Filter(('&',
+            ('>', td.lookup_col_desc('date'), im_date),
+            ('==', td.lookup_col_desc('name'), 'a')))
+    q = SqlQuery.get(td, select, filter=date_filter(IMDate(2000, 1, 1)), sorter=td.sorter)
+    assert str(q) == str(SqlQuery(
+        td, select, filter=date_filter(IMDate(2000, 1, 1)), sorter=td.sorter))
+    # structurally equal arguments share the compiled query
+    select2 = RowDesc([td.lookup_col_desc(name) for name in ['date', 'name', 'id']])
+    assert SqlQuery.get(
+        td, select2, filter=date_filter(IMDate(2000, 1, 1)), sorter=td.sorter) is q
+    # literals are bound as parameters, so other literals share it too
+    assert SqlQuery.get(
+        td, select, filter=date_filter(IMDate(2000, 1, 2)), sorter=td.sorter) is q
+    assert '?' in q.where_str and '2000' not in q.where_str
+    assert (date_filter(IMDate(2000, 1, 1)).sql_params() !=
+            date_filter(IMDate(2000, 1, 2)).sql_params())
+    assert SqlQuery.get(td, select, filter=Filter(
+        ('>', td.lookup_col_desc('name'), 'a')), sorter=td.sorter) is not q
+    assert SqlQuery.get(td, 'count') is SqlQuery.get(td, 'count')
+
+def test_row_decoder():
+    from col_desc import CDXState
+    from imdate import IMDate
+    td = TblDesc.lookup_tbl_desc('DbImage')
+    select = RowDesc([
+        td.lookup_col_desc(name) for name in ['folder_date', 'folder_name', 'name', 'id']])
+    q = SqlQuery(td, select, sorter=td.sorter)
+    db_row = tuple(2000 + x for x in range(len(q.join_state.select_strs)))
+    vals = [
+        getter(db_row) if make_fn is None else make_fn(getter(db_row))
+        for getter, make_fn in q.row_decoder]
+    # the same values as the ColDesc.get_val() chains
+    exp_vals = [
+        cd.get_val(
+            lambda alias: db_row[q.join_state.select_cols[alias][0]], CDXState())
+        for cd in select.col_descs]
+    assert vals == exp_vals
+    assert isinstance(vals[0], IMDate)
+    assert SqlQuery(td, 'count').row_decoder is None
@@ -239,4 +239,133 @@ def test_check_init_folder_tags():
             ('0', 'b c')
         ])),
     ])
-    pass
\ No newline at end of file
+    pass
+
+def _enumerated_word_list_bindings(session, word_list, bases, fs_tag_source):
+    """ word_list_bindings() by scoring every partition (the original code) """
+    import tags
+    def partition_words(pfx, word_list, partitions):
+        partitions.append(pfx + [word_list])
+        if len(word_list) > 1:
+            for x in range(1, len(word_list)):
+                partition_words(
+                    pfx + [word_list[0:x]], word_list[x:], partitions)
+    partitions = []
+    partition_words([], word_list, partitions)
+
+    scores = []
+    for partition in partitions:
+        bindings = []
+        total_score = 1
+        have_unbound_multiword = False
+        for wl in partition:
+            binding = tags.tag_text_binding(
+                session, ' '.join(wl), bases, fs_tag_source)
+            if binding[1] == FsTagBinding.UNBOUND and len(wl) > 1:
+                have_unbound_multiword = True
+            bindings.append(binding)
+            total_score += binding[1].value
+        if have_unbound_multiword:
+            total_score = 0
+        scores.append((total_score / len(partition), partition, bindings))
+    scores.sort(key = lambda x: x[0], reverse=True)
+
+    results = []
+    idx = 0
+    for wl, binding in zip(scores[0][1], scores[0][2]):
+        results.append((range(idx, idx + len(wl)), binding))
+        idx += len(wl)
+    return results
+
+def test_word_list_bindings():
+    import random
+    import tags
+    session = open_mem_db()
+    ts = FsTagSource.add(session, 'words')
+    for text in ('a b', 'c', 'a b c', 'd e'):
+        DbTag.add(session, text)
+    FsTagMapping.add(session, ts, 'b c', FsTagBinding.SUGGESTED, None)
+    FsTagMapping.add(session, ts, 'e', FsTagBinding.BOUND, None)
+    session.commit()
+    assert tags.max_tag_words(session, ts) == 3
+    rng = random.Random(1)
+    for num_words in range(1, 9):
+        for x in range(20):
+            word_list = [rng.choice('abcdex') for w in range(num_words)]
+            assert tags.word_list_bindings(session, word_list, None, ts) == \
+                _enumerated_word_list_bindings(session, word_list, None, ts)
+
+def test_tag_rebind_task():
+    from mock_task import MockSlicer
+    from task import TaskState
+    import tags
+    session = open_mem_db()
+    ctx = check_tags.Ctx(session, FsTagSource.add(session, 'test'))
+    ie_folder_spec = (
+        'ie-folder', '', [
+            ('w', 'b'),
+            ('w', 'c')
+        ], 'band', [
+            ('image1', [
+                ('w', 'e')
+            ]),
+            ('image2', [
+                ('w', 'b'),
+                ('w', 'd')
+            ])
+        ])
+    ctx.execute([
+        ('+tag', ['b c', 'dd']),
+        ('+mapping', [('bl', 'b c', 'b c')]),
+        ('+db-folder', 'fff'),
+        ('!fs-source', ('d', 'e:', '/photos')),
+        ('+fs-folder', ('fff', ['image1', 'image2'])),
+        ('!ie-folder', [ie_folder_spec]),
+        ('set-fs-folder-tags', ('fff', 'ie-folder')),
+        ('check-fs-folder-tags', [
+            ('fff', [('wbl', ['b', 'c'], 'b c')], [
+                ('image1', [('wun', ['e'])]),
+                ('image2', [('wun', ['b']), ('wun', ['d'])])
+            ])
+        ])
+    ])
+    TagChange.clear(session)
+    session.commit()
+
+    # map 'd': only image2 has that word
+    ctx.execute(('+mapping', [('bl', 'd', 'dd')]))
+    session.commit()
+    assert [c.text for c in TagChange.all(session)] == ['d']
+    slicer = MockSlicer(suspended=True)
+    task = tags.TagRebindTask(slicer, session=session)
+    task.start()
+    slicer.resume()
+    assert task.state == TaskState.DONE
+    assert task.num_changes == 1
+    assert task.num_items == 1
+    assert TagChange.first(session) is None
+    ctx.execute(('check-fs-folder-tags', [
+        ('fff', [('wbl', ['b', 'c'], 'b c')], [
+            ('image1', [('wun', ['e'])]),
+            ('image2', [('wun', ['b']), ('wbl', ['d'], 'dd')])
+        ])
+    ]))
+
+    # a cancelled task keeps its unapplied changes, for the next task
+    ctx.execute([('+tag', ['bb']), ('+mapping', [('bl', 'b', 'bb')])])
+    session.commit()
+    slicer = MockSlicer(suspended=True)
+    task = tags.TagRebindTask(slicer, session=session)
+    task.start()
+    task.cancel()
+    slicer.resume()
+    assert task.state == TaskState.DONE
+    assert task.num_items == 0
+    assert [c.text for c in TagChange.all(session)] == ['bb', 'b']
+    slicer = MockSlicer(suspended=True)
+    task = tags.TagRebindTask(slicer, session=session)
+    task.start()
+    slicer.resume()
+    assert task.state == TaskState.DONE
+    assert task.num_changes == 2
+    assert TagChange.first(session) is None
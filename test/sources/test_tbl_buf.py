@@ -0,0 +1,110 @@
+''' test table and block buffers '''
+
+from datetime import date
+import pytest
+from sqlalchemy import event
+
+from db import DbFolder, open_mem_db
+from imdate import IMDate
+
+from tbl_desc import TblDesc
+import tbl_descs
+TblDesc.complete_tbl_descs()
+
+from filter import Filter
+from sorter import Sorter, SorterCol
+from tbl_buf import TblBuf
+from tbl_query import TblQuery
+
+
+@pytest.fixture
+def small_blks(monkeypatch):
+    monkeypatch.setattr(TblBuf, 'blk_size', 4)
+    monkeypatch.setattr(TblBuf, 'max_blks', 3)
+
+
+def test_blk_cache(small_blks):
+    session = open_mem_db()
+    for x in range(30):
+        DbFolder.add(session, date(2017, 1 + x % 3, 1), 'folder%u' % (x % 5))
+    session.commit()
+    q_folder = TblQuery.from_names('DbFolder', ['date', 'name'])
+    tb = TblBuf(q_folder)
+    exp_rows = [
+        row.extract(tb.tbl_query.row_desc, q_folder.row_desc)
+        for row in tb.tbl_query.get_rows(session)]
+
+    # scroll down, then up, then jump around
+    for row_idx in list(range(30)) + list(range(29, -1, -1)) + [17, 2, 25, 9]:
+        assert tb.get_row(session, row_idx) == exp_rows[row_idx]
+        assert len(tb.blk_bufs) <= TblBuf.max_blks
+    assert tb.get_row(session, 30) is None
+    assert tb.get_rows(session, limit=5, skip=27) == exp_rows[27:]
+
+    # a cached row needs no SQL
+    tb.get_row(session, 9)
+    statements = []
+    def count(conn, cursor, statement, *args):
+        statements.append(statement)
+    event.listen(session.get_bind(), 'before_cursor_execute', count)
+    try:
+        assert tb.get_row(session, 10) == exp_rows[10]
+        assert statements == []
+    finally:
+        event.remove(session.get_bind(), 'before_cursor_execute', count)
+
+    # a jump reads only the key (name, id) columns over the skipped rows
+    q_name = TblQuery.from_names('DbFolder', ['date', 'name'])
+    q_name.set_sorter(Sorter([SorterCol(q_name.row_desc.col_descs[1], descending=False)]))
+    tb_name = TblBuf(q_name)
+    exp_name_rows = [
+        row.extract(tb_name.tbl_query.row_desc, q_name.row_desc)
+        for row in tb_name.tbl_query.get_rows(session)]
+    event.listen(session.get_bind(), 'before_cursor_execute', count)
+    try:
+        assert tb_name.get_row(session, 25) == exp_name_rows[25]
+    finally:
+        event.remove(session.get_bind(), 'before_cursor_execute', count)
+    assert len(statements) == 2
+    assert 'OFFSET' in statements[0] and 'date_year' not in statements[0]
+    assert 'OFFSET' not in statements[1]
+    assert tb_name.get_rows(session, skip=20) == exp_name_rows[20:]
+
+    # set_filter() discards the cached blocks
+    tb.set_filter(Filter(('==', q_folder.row_desc.col_descs[1], 'folder0')))
+    assert len(tb.blk_bufs) == 0
+    assert tb.get_rows(session) == [
+        row for row in exp_rows if row.cols[1] == 'folder0']
+
+
+def check_tbl_buf_rows(session, cli_query):
+    ''' Check that a TblBuf reads get_rows()'s rows, by scrolling and jumping '''
+    tb = TblBuf(cli_query)
+    exp_rows = [
+        row.extract(tb.tbl_query.row_desc, cli_query.row_desc)
+        for row in tb.tbl_query.get_rows(session)]
+    exp_keys = [tb.tbl_query.get_key(row) for row in tb.tbl_query.get_rows(session)]
+    for row_idx in list(range(len(exp_rows))) + list(range(len(exp_rows) - 1, -1, -1)):
+        assert tb.get_row(session, row_idx) == exp_rows[row_idx]
+        assert tb.get_key(session, row_idx) == exp_keys[row_idx]
+    for row_idx in [17, 2, 13, 9, 19, 5]:
+        tb.invalidate()     # jump, with no neighboring block
+        assert tb.get_row(session, row_idx) == exp_rows[row_idx]
+    assert tb.get_rows(session) == exp_rows
+
+def test_null_and_unk_keys(small_blks):
+    session = open_mem_db()
+    for x in range(20):
+        if x % 4 == 0:
+            date = None                         # e.g. an undated folder name
+        elif x % 4 == 1:
+            date = IMDate(2017, IMDate.unk, IMDate.unk)
+        else:
+            date = IMDate(2017, 1 + x % 3, 1 + x % 2)
+        session.add(DbFolder(date=date, name='folder%u' % (x % 3)))
+    session.commit()
+    q_folder = TblQuery.from_names('DbFolder', ['date', 'name'])
+    check_tbl_buf_rows(session, q_folder)   # date descending, name
+    date_cd = q_folder.row_desc.col_descs[0]
+    q_folder.set_sorter(Sorter([SorterCol(date_cd, descending=False)]))
+    check_tbl_buf_rows(session, q_folder)
@@ -4,7 +4,7 @@ import jsonpickle
 import pytest
 
 from base_path import dev_base_ie_source_path
-from db import open_file_db
+from db import DbFolder, open_file_db, open_mem_db
 
 from tbl_desc import TblDesc
 import tbl_descs
@@ -13,6 +13,7 @@ TblDesc.complete_tbl_descs()
 from filter import Filter
 from imdate import IMDate
 from row_buf import RowBuf
+from row_desc import RowDesc
 from tbl_query import TblQuery
 
 def test_pickle():
@@ -54,4 +55,65 @@ def test_access():
         RowBuf([r_folder[2].cols[0], r_folder[2].cols[1]])
     )
     assert folder_2_idx == (2 + 1)  # we did a skip=1 to get r_folder
-    pass
\ No newline at end of file
+    pass
+
+def test_keyset_pages():
+    from datetime import date
+    session = open_mem_db()
+    for x in range(40):
+        # duplicate (date, name)s: the keys are made unique by +id
+        DbFolder.add(session, date(2017, 1 + x % 3, 1), 'folder%u' % (x % 5))
+    session.commit()
+    q_folder = TblQuery.from_names('DbFolder', ['date', 'name'])
+    assert [cd.db_name for cd in q_folder.missing_key_col_descs()] == ['id']
+    q_folder = TblQuery(
+        q_folder.tbl_desc,
+        RowDesc(list(q_folder.row_desc.col_descs) + q_folder.missing_key_col_descs()),
+        sorter=q_folder.keyset_sorter())
+    all_rows = q_folder.get_rows(session)
+    assert len(all_rows) == 40
+
+    # page forward, then backward, through the whole table
+    pages = [q_folder.get_rows(session, limit=7)]
+    while True:
+        page = q_folder.get_rows_after(session, q_folder.get_key(pages[-1][-1]), limit=7)
+        if len(page) == 0:
+            break
+        pages.append(page)
+    assert [row for page in pages for row in page] == all_rows
+    assert q_folder.get_rows_before(session, q_folder.get_key(all_rows[20]), limit=7) == (
+        all_rows[13:20])
+    assert q_folder.get_rows_before(session, q_folder.get_key(all_rows[3]), limit=7) == (
+        all_rows[0:3])
+
+    # a deep jump seeks from the key of the row before it
+    assert q_folder.get_key_at(session, 24) == q_folder.get_key(all_rows[24])
+    assert q_folder.get_rows_after(session, q_folder.get_key_at(session, 24), limit=7) == (
+        all_rows[25:32])
+    assert q_folder.get_key_at(session, 40) is None
+
+def test_keyset_null_and_unk_keys():
+    from sorter import Sorter, SorterCol
+    session = open_mem_db()
+    for x in range(20):
+        # undated folders have a NULL date, and IMDate.unk sorts last ascending
+        date = (
+            None if x % 4 == 0 else
+            IMDate(2017, IMDate.unk, 1) if x % 4 == 1 else
+            IMDate(2017, 1 + x % 3, 1))
+        session.add(DbFolder(date=date, name='folder%u' % (x % 3)))
+    session.commit()
+    q_folder = TblQuery.from_names('DbFolder', ['date', 'name', 'id'])
+    date_cd = q_folder.row_desc.col_descs[0]
+    for sorter in (
+        q_folder.keyset_sorter(),   # date descending: NULLs last
+        Sorter([SorterCol(date_cd, descending=False), SorterCol(
+            q_folder.tbl_desc.lookup_col_desc('id'), descending=True)])
+    ):
+        q_folder.set_sorter(sorter)
+        all_rows = q_folder.get_rows(session)
+        for idx in range(len(all_rows) - 1):
+            key = q_folder.get_key(all_rows[idx])
+            assert q_folder.get_key_at(session, idx) == key
+            assert q_folder.get_rows_after(session, key) == all_rows[idx + 1:]
+            assert q_folder.get_rows_before(session, key) == all_rows[:idx]
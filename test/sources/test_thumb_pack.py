@@ -0,0 +1,70 @@
+''' test the thumbnail pack '''
+
+import os
+
+from thumb_pack import ThumbPack
+
+def test_thumb_pack(tmp_path):
+    path = str(tmp_path / 'thumbs')
+    pack = ThumbPack(path)
+    pack.put(1, b'one')
+    pack.put(2, b'two')
+    pack.put(3, b'one')         # stored once
+    assert bytes(pack.get(1)) == b'one'
+    assert bytes(pack.get(3)) == b'one'
+    assert pack.data_size == 6
+    pack.put(2, b'two, newer')  # supersedes b'two'
+    pack.remove(1)
+    assert pack.get(1) is None and 1 not in pack
+    assert bytes(pack.get(2)) == b'two, newer'
+    assert pack.garbage_size() == 3
+    assert pack.check() == []
+    pack.close()
+
+    # the index log is replayed on load
+    pack = ThumbPack(path)
+    assert sorted(pack.refs) == [2, 3]
+    assert bytes(pack.get(2)) == b'two, newer'
+    pack.compact()
+    assert pack.garbage_size() == 0
+    assert pack.data_size == len(b'one') + len(b'two, newer')
+    assert bytes(pack.get(2)) == b'two, newer'
+    assert bytes(pack.get(3)) == b'one'
+    pack.close()
+
+def test_thumb_pack_damage(tmp_path):
+    path = str(tmp_path / 'thumbs')
+    pack = ThumbPack(path)
+    pack.put(1, b'one')
+    pack.put(2, b'two')
+    pack.close()
+    # damage thumbnail 1, and append a partial index entry
+    with open(path + '.dat', 'r+b') as f:
+        f.write(b'ONE')
+    with open(path + '.idx', 'ab') as f:
+        f.write(b'\0' * 7)
+    pack = ThumbPack(path)
+    assert pack.check() == [1]
+    pack.compact()
+    assert sorted(pack.refs) == [2]
+    assert os.path.getsize(path + '.idx') == ThumbPack.entry.size
+    pack.close()
+
+def test_thumb_pack_compact_in_use(tmp_path):
+    path = str(tmp_path / 'thumbs')
+    pack = ThumbPack(path)
+    pack.put(1, b'one')
+    pack.put(1, b'one, newer')
+    jpeg = pack.get(1)
+    # the data file can't be replaced while it's mapped
+    try:
+        pack.compact()
+        assert False, 'compact() with a live memoryview'
+    except BufferError:
+        pass
+    assert bytes(jpeg) == b'one, newer'
+    jpeg.release()
+    pack.compact()
+    assert pack.garbage_size() == 0
+    assert bytes(pack.get(1)) == b'one, newer'
+    pack.close()
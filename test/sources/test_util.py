@@ -0,0 +1,22 @@
+""" test util.py """
+
+from util import merge_sorted
+
+
+def test_merge_sorted():
+    def merge(existing, scanned):
+        return list(merge_sorted(
+            existing, scanned, lambda x: x, lambda x: x.lower()))
+
+    assert merge([], []) == []
+    assert merge(['a', 'b'], []) == [('a', None), ('b', None)]
+    assert merge([], ['A']) == [(None, 'A')]
+    assert merge(['a', 'c', 'd', 'f'], ['B', 'C', 'E', 'F', 'G']) == [
+        ('a', None), (None, 'B'), ('c', 'C'), ('d', None), (None, 'E'),
+        ('f', 'F'), (None, 'G')]
+    # one pass over each input: iterators are fine
+    assert merge(iter(['a']), iter(['A'])) == [('a', 'A')]
+    # a None element doesn't end its sequence
+    assert list(merge_sorted(
+        [None, 1], [0, 1], lambda x: -1 if x is None else x, lambda x: x)) == [
+        (None, None), (None, 0), (1, 1)]
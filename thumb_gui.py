@@ -0,0 +1,45 @@
+''' thumbnail viewer GUI '''
+
+import io
+import wx
+
+import db
+from ie_db import get_image_data_thumbnail
+from tab_panel_gui import TabPanel, TabPanelStack
+
+
+class ThumbnailTP(TabPanel):
+    ''' an ImageData's thumbnail '''
+
+    def __init__(self, parent: TabPanelStack, image_data_id):
+        super().__init__(parent)
+        self.image_data_id = image_data_id
+
+        sizer = wx.BoxSizer(wx.VERTICAL)
+        image_data = db.session.get(db.ImageData, image_data_id)
+        jpeg = None
+        if image_data is not None:
+            jpeg = get_image_data_thumbnail(
+                image_data, db.get_thumb_pack(db.session, create=False))
+        if jpeg is None:
+            sizer.Add(wx.StaticText(self, -1, '  no thumbnail'), 0, 0)
+        else:
+            # BytesIO copies the JPEG, so the pack's memoryview can be released
+            image = wx.Image(io.BytesIO(jpeg), wx.BITMAP_TYPE_JPEG)
+            sizer.Add(wx.StaticBitmap(self, -1, wx.Bitmap(image)), 0, wx.ALL, 5)
+            jpeg = None
+        self.SetSizer(sizer)
+        self.push()
+
+    def save(self):
+        res = super().save()
+        res['image_data_id'] = self.image_data_id
+        return res
+
+    @classmethod
+    def restore(cls, tps, saved_panel):
+        cls(tps, saved_panel['image_data_id'])
+
+    @classmethod
+    def cls_text(cls):
+        return 'Thumbnail'
@@ -0,0 +1,185 @@
+""" content-addressed thumbnail store: an append-only data file plus an index """
+
+import hashlib
+import logging
+import mmap
+import os
+import struct
+
+
+class ThumbPack(object):
+    """ a map: key (e.g. an ImageData id) -> thumbnail JPEG bytes
+
+        <path>.dat holds the JPEGs, concatenated; identical JPEGs are stored once
+        <path>.idx is a log of (key, sha1, offset, length) entries, appended by
+            put() and remove(); when the log is loaded, the last entry for a
+            key wins, and an entry with length == deleted_length deletes it
+        get() returns a zero-copy memoryview into an mmap of the data file
+        replacing or removing a key leaves its old JPEG in the data file
+        until compact() rewrites the pack with just the live JPEGs
+        compact() raises BufferError while any memoryview from get() is alive:
+        a mapped file can't be replaced on Windows
+    """
+
+    entry = struct.Struct('<q20sQI')    # key, sha1, offset, length
+    deleted_length = 0xffffffff
+
+    def __init__(self, path):
+        self.path = path
+        self.refs = {}          # key -> (sha1, offset, length)
+        self.blobs = {}         # sha1 -> (offset, length), for deduplication
+        self.mmap = None        # of the data file, remapped as it grows
+        self.mmap_size = 0
+        self.old_mmaps = []     # unmapped, but still used by get()'s memoryviews
+        self.load()
+
+    def __repr__(self):
+        return '<ThumbPack %s: %u thumbnails, %u bytes>' % (
+            self.path, len(self.refs), self.data_size)
+
+    def load(self):
+        self.refs = {}
+        try:
+            with open(self.path + '.idx', 'rb') as f:
+                log = f.read()
+        except FileNotFoundError:
+            log = b''
+        # a partial entry at the end (an interrupted put()) is ignored
+        num_entries = len(log) // ThumbPack.entry.size
+        for key, sha1, offset, length in ThumbPack.entry.iter_unpack(
+            log[:num_entries * ThumbPack.entry.size]
+        ):
+            if length == ThumbPack.deleted_length:
+                self.refs.pop(key, None)
+            else:
+                self.refs[key] = (sha1, offset, length)
+        self.blobs = {
+            sha1: (offset, length) for sha1, offset, length in self.refs.values()}
+        self.data_file = open(self.path + '.dat', 'ab')
+        self.idx_file = open(self.path + '.idx', 'ab')
+        if num_entries * ThumbPack.entry.size != len(log):
+            self.idx_file.truncate(num_entries * ThumbPack.entry.size)
+        self.data_size = self.data_file.seek(0, os.SEEK_END)
+
+    def close(self):
+        self.data_file.close()
+        self.idx_file.close()
+        self._unmap()
+
+    def flush(self):
+        """ Flush appended JPEGs and index entries to the OS. """
+        self.data_file.flush()
+        self.idx_file.flush()
+
+    def _unmap(self):
+        # memoryviews returned by get() may still refer to the old mmap:
+        # then it's kept in .old_mmaps until a later _unmap() can close it
+        if self.mmap is not None:
+            self.old_mmaps.append(self.mmap)
+        self.mmap = None
+        self.mmap_size = 0
+        in_use = []
+        for old_mmap in self.old_mmaps:
+            try:
+                old_mmap.close()
+            except BufferError:
+                in_use.append(old_mmap)
+        self.old_mmaps = in_use
+
+    def _log(self, key, sha1, offset, length):
+        self.idx_file.write(ThumbPack.entry.pack(key, sha1, offset, length))
+
+    def put(self, key, jpeg):
+        """ Store <jpeg> (bytes) as <key>'s thumbnail, replacing any previous one. """
+        sha1 = hashlib.sha1(jpeg).digest()
+        if sha1 in self.blobs:
+            offset, length = self.blobs[sha1]
+        else:
+            offset, length = self.data_size, len(jpeg)
+            self.data_file.write(jpeg)
+            self.data_size += length
+            self.blobs[sha1] = (offset, length)
+        self.refs[key] = (sha1, offset, length)
+        self._log(key, sha1, offset, length)
+
+    def remove(self, key):
+        if self.refs.pop(key, None) is not None:
+            self._log(key, bytes(20), 0, ThumbPack.deleted_length)
+
+    def __contains__(self, key):
+        return key in self.refs
+
+    def __len__(self):
+        return len(self.refs)
+
+    def get(self, key):
+        """ Return <key>'s thumbnail as a read-only memoryview, or None. """
+        try:
+            sha1, offset, length = self.refs[key]
+        except KeyError:
+            return None
+        if offset + length > self.mmap_size:
+            # the JPEG was appended after the data file was last mapped
+            self.data_file.flush()
+            self._unmap()
+            if self.data_size == 0 or offset + length > self.data_size:
+                return None
+            with open(self.path + '.dat', 'rb') as f:
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.mmap_size = len(self.mmap)
+            if offset + length > self.mmap_size:
+                return None     # a truncated data file
+        return memoryview(self.mmap)[offset:offset + length]
+
+    def garbage_size(self):
+        """ Return the number of data file bytes that compact() would free. """
+        live = {sha1: length for sha1, offset, length in self.refs.values()}
+        return self.data_size - sum(live.values())
+
+    def check(self):
+        """ Return the keys whose thumbnails are missing or damaged. """
+        self.flush()
+        bad_keys = []
+        for key in list(self.refs):
+            jpeg = self.get(key)
+            if jpeg is None or hashlib.sha1(jpeg).digest() != self.refs[key][0]:
+                bad_keys.append(key)
+        return bad_keys
+
+    def compact(self):
+        """ Rewrite the pack with just the live thumbnails.
+
+            damaged thumbnails (see check()) are dropped
+            raises BufferError if memoryviews returned by get() are still alive
+        """
+        self.flush()
+        self._unmap()
+        if len(self.old_mmaps) != 0:
+            raise BufferError(
+                'thumbnail pack %s: thumbnails are still in use' % self.path)
+        bad_keys = set(self.check())
+        if len(bad_keys) != 0:
+            logging.error('thumbnail pack %s: dropping %u damaged thumbnails',
+                self.path, len(bad_keys))
+        new_refs = {}
+        new_blobs = {}
+        with open(self.path + '.dat.tmp', 'wb') as data_file, \
+            open(self.path + '.idx.tmp', 'wb') as idx_file:
+            offset = 0
+            for key, (sha1, old_offset, length) in sorted(self.refs.items()):
+                if key in bad_keys:
+                    continue
+                if sha1 not in new_blobs:
+                    data_file.write(self.get(key))
+                    new_blobs[sha1] = (offset, length)
+                    offset += length
+                new_offset = new_blobs[sha1][0]
+                new_refs[key] = (sha1, new_offset, length)
+                idx_file.write(
+                    ThumbPack.entry.pack(key, sha1, new_offset, length))
+        self.close()
+        # the data file is replaced first: if the index replace doesn't happen,
+        # check() reports the mismatched thumbnails
+        os.replace(self.path + '.dat.tmp', self.path + '.dat')
+        os.replace(self.path + '.idx.tmp', self.path + '.idx')
+        self.load()
@@ -75,6 +75,39 @@ def find_descendent_class(cls, name):
             return c
     raise ValueError('%s is not a descendent of %s', name, cls.__name__)
 
+_merge_end = object()  # merge_sorted()'s end-of-sequence marker: elements may be None
+
+def merge_sorted(existing, scanned, existing_key, scanned_key):
+    """ merge two sequences sorted by key, yielding (existing, scanned) pairs
+
+        a pair is (e, s) if their keys match, (e, None) if e has no match,
+        and (None, s) if s has no match
+        each sequence is traversed once, so the merge is O(len(existing) + len(scanned))
+    """
+    existing = iter(existing)
+    scanned = iter(scanned)
+    e = next(existing, _merge_end)
+    s = next(scanned, _merge_end)
+    while e is not _merge_end and s is not _merge_end:
+        e_key = existing_key(e)
+        s_key = scanned_key(s)
+        if e_key == s_key:
+            yield e, s
+            e = next(existing, _merge_end)
+            s = next(scanned, _merge_end)
+        elif e_key < s_key:
+            yield e, None
+            e = next(existing, _merge_end)
+        else:
+            yield None, s
+            s = next(scanned, _merge_end)
+    while e is not _merge_end:
+        yield e, None
+        e = next(existing, _merge_end)
+    while s is not _merge_end:
+        yield None, s
+        s = next(scanned, _merge_end)
+
 class O(object):
     pass
 